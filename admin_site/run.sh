@@ -2,6 +2,9 @@
 
 PORT=$1
 ENV=$2
+# "web" (the default) for the admin site and API, or "worker" for the
+# process_media worker (see the README), which needs CPU allocated all the time.
+ROLE=${3:-web}
 
 set -e
 
@@ -12,6 +15,11 @@ else
     exit 1
 fi
 
+if [[ "$ROLE" != "web" && "$ROLE" != "worker" ]]; then
+    echo "ERROR: Invalid role: $ROLE"
+    exit 1
+fi
+
 if [ -z "$PORT" ]; then
     echo "ERROR: No port specified"
     exit 1
@@ -26,6 +34,18 @@ if [ "$ENV" = "prod" ]; then
     . .venv/bin/activate
 fi
 
+if [ "$ROLE" = "worker" ]; then
+    echo "ROLE: worker"
+    # Check uploaded media (see slsl_backend/media_queue.py), restarting it if
+    # it dies (e.g. OOM-killed), since uploads stay pending, left out of the
+    # dump, while it isn't running. The web server runs the migrations.
+    while true; do
+        python manage.py process_media --loop \
+            || echo "process_media exited with $?, restarting in 5s"
+        sleep 5
+    done
+fi
+
 # Set up DB if needed.
 python manage.py migrate --noinput
 
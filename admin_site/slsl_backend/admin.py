@@ -1,5 +1,5 @@
 from django import forms
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.db.models import Q
 from nested_admin import (
     NestedModelAdmin,
@@ -9,6 +9,7 @@ from nested_admin import (
 )
 
 from . import models
+from .media_queue import stuck_videos
 
 # TODO: Find a way to hide the string representation, e.g. Definition, Video, etc.
 # It doesn't add anything useful. Then once that's done, make the __str__ representation
@@ -77,7 +78,11 @@ class VideoInline(SortableHiddenMixin, NestedStackedInline):
         # Must be in the form for sortable_field_name to work; nested_admin
         # renders it as the hidden drag widget, not a visible number input.
         "order",
+        # Set by the process_media worker once it has checked an upload (see
+        # media_queue.py); only READY videos are dumped.
+        ("media_state", "media_error"),
     ]
+    readonly_fields = ["media_state", "media_error"]
 
 
 class SubEntryAdmin(SortableHiddenMixin, NestedStackedInline):
@@ -103,6 +108,18 @@ class EntryAdmin(NestedModelAdmin):
         SubEntryAdmin,
     ]
 
+    def changelist_view(self, request, extra_context=None):
+        # Uploads wait as pending, left out of the dump, until the process_media
+        # worker has checked them, so say if it seems to have stopped.
+        stuck = stuck_videos().count()
+        if stuck:
+            messages.warning(
+                request,
+                f"{stuck} videos have been pending for a long time, so aren't in "
+                "the dump. The process_media worker may not be running.",
+            )
+        return super().changelist_view(request, extra_context)
+
 
 # Register relevant models.
 admin.site.register(models.Entry, EntryAdmin)
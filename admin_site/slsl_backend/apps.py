@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class SlslBackendConfig(AppConfig):
+    name = "slsl_backend"
+
+    def ready(self):
+        # Connect the signal receivers that keep the dump cache up to date.
+        from . import signals  # noqa: F401
@@ -0,0 +1,161 @@
+"""The change log: an append-only record of every change to dumped content.
+
+DumpVersion and the per-entry versions say *that* something changed, so
+consumers (the dump delta, fragment refreshes, mirrors, search indexes) end up
+re-reading whole entries to find out what. The ContentChange table records each
+change itself: the table and primary key of the changed row, the entry it
+belongs to, and whether it was created, updated or deleted. The signal
+receivers in signals.py write it in the same transaction as the change, so a
+rolled-back change leaves nothing behind, and a committed one is always logged.
+It covers deletes (including cascaded ones) and admin reorders, which are saves
+like any other. It doesn't cover changes made with QuerySet.update() or
+bulk_create() unless their caller logs them (see signals.py), nor any made
+with raw SQL, e.g. in migrations.
+
+Consumers remember the highest sequence they've seen and ask for the changes
+after it (see changes_since). Sequences are handed out in commit order: every
+change is logged after signals.mark_dump_changed, which holds the DumpVersion
+row lock until the transaction commits, so a consumer never sees sequence N+1
+and then later a transaction commit N.
+
+The log only grows, so compact_change_log (see compact) trims it: dropping rows
+superseded by a later change to the same row is always safe, since a consumer
+that missed the earlier one still sees the later. Dropping rows by age isn't,
+so it records how far it went, and consumers that were further behind than that
+get a 410 and must start over from the full dump.
+"""
+
+import datetime
+import logging
+
+from django.db import transaction
+from django.db.models import Exists, Max, OuterRef
+from django.utils import timezone
+
+from . import models
+
+LOG = logging.getLogger(__name__)
+
+# How many changes changes_since returns by default, and at most.
+DEFAULT_LIMIT = 1000
+MAX_LIMIT = 10000
+
+# The table the entry <-> category relation lives in. Its changes are logged
+# with the category's ID as the object ID.
+ENTRY_CATEGORIES_TABLE = models.Entry.categories.through._meta.db_table
+
+
+class ChangesPruned(Exception):
+    """The changes after the requested sequence have been pruned."""
+
+
+def record_changes(dump_version, changes):
+    """Log `changes`, made at `dump_version`.
+
+    `changes` is an iterable of (table, object_id, entry_id, operation) tuples,
+    where `operation` is a models.ChangeOperation. Must be called after
+    signals.mark_dump_changed in the same transaction (see above): raises
+    RuntimeError outside of one, since a change committed on its own could then
+    be lost from the log.
+    """
+    if not transaction.get_connection().in_atomic_block:
+        raise RuntimeError("Changes must be logged in the transaction making them")
+    now = timezone.now()
+    models.ContentChange.objects.bulk_create(
+        [
+            models.ContentChange(
+                table=table,
+                object_id=object_id,
+                entry_id=entry_id,
+                operation=operation,
+                dump_version=dump_version,
+                changed_at=now,
+            )
+            for table, object_id, entry_id, operation in changes
+        ]
+    )
+
+
+def latest_sequence():
+    """Return the highest sequence logged (or pruned), 0 if there's none yet."""
+    latest = models.ContentChange.objects.aggregate(latest=Max("sequence"))["latest"]
+    return max(latest or 0, _pruned_through())
+
+
+def _pruned_through():
+    return (
+        models.DumpVersion.objects.filter(pk=1)
+        .values_list("changes_pruned_through", flat=True)
+        .first()
+    ) or 0
+
+
+def changes_since(sequence, limit=DEFAULT_LIMIT):
+    """Return the first `limit` changes after `sequence`, oldest first.
+
+    Returns (changes, more), where `changes` is a list of dicts and `more` says
+    whether there are more changes after the last one. Raises ChangesPruned if
+    some of the changes after `sequence` have been pruned by age.
+    """
+    if sequence < _pruned_through():
+        raise ChangesPruned(sequence)
+    # The primary key index makes this a range scan however long the log is.
+    rows = list(
+        models.ContentChange.objects.filter(sequence__gt=sequence)
+        .order_by("sequence")
+        .values(
+            "sequence",
+            "table",
+            "object_id",
+            "entry_id",
+            "operation",
+            "dump_version",
+            "changed_at",
+        )[: limit + 1]
+    )
+    return rows[:limit], len(rows) > limit
+
+
+def _later_changes(**lookups):
+    return models.ContentChange.objects.filter(
+        table=OuterRef("table"),
+        object_id=OuterRef("object_id"),
+        sequence__gt=OuterRef("sequence"),
+        **lookups,
+    )
+
+
+def compact(keep_days=None):
+    """Compact the change log, returning how many rows were deleted.
+
+    Drops every change superseded by a later change to the same row (and, for
+    the entry <-> category relation, the same pair). With `keep_days`, also
+    drops every change older than that, and records the highest sequence
+    dropped, so changes_since can tell consumers they missed some.
+    """
+    changes = models.ContentChange.objects
+    with transaction.atomic():
+        # Two passes, since entry_id is null for categories and null never
+        # equals null.
+        deleted, _ = changes.filter(
+            Exists(_later_changes(entry_id=OuterRef("entry_id"))),
+            entry_id__isnull=False,
+        ).delete()
+        count, _ = changes.filter(
+            Exists(_later_changes(entry_id__isnull=True)), entry_id__isnull=True
+        ).delete()
+        deleted += count
+
+        if keep_days is not None:
+            cutoff = timezone.now() - datetime.timedelta(days=keep_days)
+            expired = changes.filter(changed_at__lt=cutoff)
+            pruned_through = expired.aggregate(latest=Max("sequence"))["latest"]
+            if pruned_through is not None:
+                count, _ = changes.filter(sequence__lte=pruned_through).delete()
+                deleted += count
+                models.DumpVersion.objects.filter(
+                    pk=1, changes_pruned_through__lt=pruned_through
+                ).update(changes_pruned_through=pruned_through)
+
+    LOG.info(f"Compacted the change log, deleting {deleted} changes")
+    return deleted
@@ -1,13 +1,161 @@
+import concurrent.futures
+import contextlib
+import dataclasses
+import gzip
+import json
 import logging
+import zlib
 
+import brotli
+from django.conf import settings
+from django.core.exceptions import EmptyResultSet
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.db.models import Exists, F, OuterRef
 from django.forms.models import model_to_dict
+from django.utils import timezone
 
 from . import models
+from .dump_profile import profiling
 
 LOG = logging.getLogger(__name__)
 
+# The streaming dump yields its JSON in chunks of roughly this many bytes, rather
+# than one tiny chunk per entry, so the server isn't flushing thousands of
+# fragments per request.
+STREAM_CHUNK_SIZE = 64 * 1024
 
-def dump_video(video):
+# Compression settings for the pre-compressed dump variants. The dump is built
+# once per version, so this pays for good compression once rather than per
+# request. Brotli's maximum quality (11) is far slower for little gain, so it's
+# reserved for offline publishing (see publish_dump).
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 9
+
+# How many entries go in each shard of the sharded dump (see iter_dump_shards).
+# About 1.5 MB per shard at the current size of an entry.
+DEFAULT_SHARD_SIZE = 500
+
+# Entries are emitted in Entry's default ordering (with id as a tiebreak). The
+# streaming builder orders every child query by the same key so it can walk them
+# all in lockstep with the entries.
+ENTRY_ORDERING = [*models.Entry._meta.ordering, "id"]
+
+# How many entry rows the Postgres engine fetches from its cursor at a time.
+POSTGRES_FETCH_SIZE = 500
+
+# The dump engines, i.e. settings.DUMP_ENGINE values. "python" loads the rows and
+# shapes them in Python; "postgres" has Postgres build each entry's JSON (see
+# _iter_dump_models_postgres); "parallel" is "python", but with build_dump_models
+# running its queries at once, on separate connections (see
+# _fetch_dump_rows_parallel). The last two fall back to "python" on other
+# databases.
+DUMP_ENGINES = ["python", "postgres", "parallel"]
+
+
+# Sub-entry fields that a DumpFilter can leave out of the dump.
+OMITTABLE_FIELDS = ["definitions", "related_words"]
+
+# Video fields that are only in the dump if a DumpFilter asks for them (see
+# dump_video).
+INCLUDABLE_FIELDS = ["renditions"]
+
+
+@dataclasses.dataclass(frozen=True)
+class DumpFilter:
+    """Which parts of the dump to build, for clients that only need some of it.
+
+    Each filter is applied in the queries of every engine, so a smaller dump
+    does less work, not just emits less. Sub-entries left without videos, and
+    entries left without sub-entries, are left out as usual. The default
+    DumpFilter() builds the whole dump. Instances are hashable, and equal
+    filters build equal dumps, so they can key caches.
+    """
+
+    # Only videos with these VideoStatus values, or every video if None.
+    video_statuses: tuple | None = None
+    # Only sub-entries in these Regions, or every sub-entry if None.
+    regions: tuple | None = None
+    # Only definitions in these Languages, or every definition if None.
+    definition_languages: tuple | None = None
+    # Fields (see OMITTABLE_FIELDS) left out of every sub-entry.
+    omit: tuple = ()
+    # Fields (see INCLUDABLE_FIELDS) added to every video that has them.
+    include: tuple = ()
+
+    @classmethod
+    def from_params(cls, params):
+        """Make a DumpFilter from query parameters, raising ValueError if invalid.
+
+        The parameters are video_status, region, definition_language, omit and
+        include, each a comma separated list of values.
+        """
+
+        def values(name, choices):
+            value = params.get(name)
+            if value is None:
+                return None
+            chosen = {v.strip() for v in value.split(",") if v.strip()}
+            invalid = chosen - set(choices)
+            if not chosen or invalid:
+                raise ValueError(f"{name} must be a list of: {', '.join(choices)}")
+            return tuple(sorted(chosen))
+
+        def only(name, choices):
+            # Canonical, so equal filters are equal: choosing all is no filter.
+            chosen = values(name, choices)
+            return None if chosen == tuple(sorted(choices)) else chosen
+
+        return cls(
+            video_statuses=only("video_status", models.VideoStatus.values),
+            regions=only("region", models.Region.values),
+            definition_languages=only("definition_language", models.Language.values),
+            omit=values("omit", OMITTABLE_FIELDS) or (),
+            include=values("include", INCLUDABLE_FIELDS) or (),
+        )
+
+    def filter_sub_entries(self, queryset, lookup=""):
+        """Filter a queryset of sub-entries, or of rows related by `lookup`."""
+        if self.regions is None:
+            return queryset
+        return queryset.filter(**{f"{lookup}region__in": self.regions})
+
+    def filter_videos(self, queryset):
+        # Videos whose media hasn't passed its checks (see media_queue.py) are
+        # never dumped, whatever the filter.
+        queryset = self.filter_sub_entries(queryset, "sub_entry__").filter(
+            media_state=models.MediaState.READY
+        )
+        if self.video_statuses is None:
+            return queryset
+        return queryset.filter(status__in=self.video_statuses)
+
+    def filter_definitions(self, queryset):
+        queryset = self.filter_sub_entries(queryset, "sub_entry__")
+        if self.definition_languages is None:
+            return queryset
+        return queryset.filter(language__in=self.definition_languages)
+
+
+# Builds the whole dump.
+NO_FILTER = DumpFilter()
+
+
+def current_version():
+    """Return the current (version, changed_at) of the dumped content."""
+    row = models.DumpVersion.objects.filter(pk=1).values_list("version", "changed_at")
+    row = row.first()
+    if row is None:
+        # Nothing has changed since the DumpVersion table was created, so start
+        # the clock now.
+        dump_version, _ = models.DumpVersion.objects.get_or_create(
+            pk=1, defaults={"changed_at": timezone.now()}
+        )
+        row = (dump_version.version, dump_version.changed_at)
+    return row
+
+
+def dump_video(video, include=()):
     """Serialise one Video for the dump.
 
     Back-compat: a plain CURRENT video with no versioning metadata is emitted as
@@ -16,6 +164,11 @@ def dump_video(video):
     is emitted as an object the new app parses into a MediaItem. The "video" key
     always carries the filename, so the saved-video identity (its path) is
     unchanged either way.
+
+    With "renditions" in `include` (see DumpFilter.include), a video with
+    renditions (see Video.renditions) is emitted as an object too, with their
+    filenames under "renditions". Only clients that ask for them get them, so
+    the dump older app builds read is unchanged.
     """
     name = video.media.name
     meta = {
@@ -26,133 +179,669 @@ def dump_video(video):
         "note": video.note,
     }
     has_meta = any(v for v in meta.values())
-    if video.status == models.VideoStatus.CURRENT and not has_meta:
+    renditions = video.renditions if "renditions" in include else {}
+    if video.status == models.VideoStatus.CURRENT and not has_meta and not renditions:
         return name
     out = {"video": name, "status": video.status}
     for key, value in meta.items():
         if value:
             out[key] = value
+    if renditions:
+        out["renditions"] = renditions
     return out
 
 
-def build_dump_models():
-    # Load all the information we care about from the entries. We don't load up
-    # categories here for efficiency reasons, it is faster to load up the relations
-    # and category data separately in a single query and then build it all up in
-    # the Python code.
-    entries = models.Entry.objects.all()
-    entry_data = entries.values(
-        "id",
-        "word_in_english",
-        "word_in_tamil",
-        "word_in_sinhala",
-        "entry_type",
-    )
+def dump_sub_entry(sub_entry, omit=()):
+    """Serialise the base fields of one SubEntry (no videos or definitions).
 
-    # Build a map of Entry ID to Entry as a dict.
-    entry_id_to_entry = {}
-    for entry in entry_data:
-        id = entry["id"]
-        del entry["id"]
-        entry_id_to_entry[id] = entry
-
-    # Build a map of Category ID to Category as a dict.
-    categories = models.Category.objects.all()
-    category_id_to_category = {}
-    for category in categories:
-        id = category.id
-        del category.id
-        category_id_to_category[id] = category
-
-    # Load up the entry category relations.
-    entry_categories = models.Entry.categories.through.objects.all()
-    entry_id_to_category_ids = {}
-    for entry_category in entry_categories:
-        entry_id = entry_category.entry_id
-        category_id = entry_category.category_id
-        entry_id_to_category_ids.setdefault(entry_id, []).append(category_id)
-
-    # Set categories on the entries. We only set the category names. If there are no
-    # relations, set an empty list.
-    for entry_id, entry in entry_id_to_entry.items():
-        entry["categories"] = [
-            category_id_to_category[category_id].name
-            for category_id in entry_id_to_category_ids.get(entry_id, [])
-        ]
-        # For backwards compatibility, set the first category as the "category" field.
-        if entry["categories"]:
-            entry["category"] = entry["categories"][0]
-
-    # Load up a map of SubEntry ID to Entry ID. Ordered by the admin-controlled
-    # `order` (then id as a stable tiebreak) so the dump emits sub-entries in the
-    # order the admin arranged them.
-    sub_entries = models.SubEntry.objects.all().order_by("order", "id")
-    sub_entry_id_to_entry_id = {
-        k: v for (k, v) in sub_entries.values_list("id", "entry")
-    }
+    Fields in `omit` (see DumpFilter.omit) are left out.
+    """
+    sub_entry_dict = model_to_dict(sub_entry)
+    del sub_entry_dict["id"]
+    del sub_entry_dict["entry"]
+    for field in omit:
+        sub_entry_dict.pop(field, None)
+    return sub_entry_dict
 
-    # Add base information for each sub-entry.
-    for sub_entry in sub_entries:
-        entry_id = sub_entry_id_to_entry_id[sub_entry.id]
-        entry = entry_id_to_entry[entry_id]
-        sub_entries = entry.setdefault("sub_entries", {})
-        sub_entry_dict = model_to_dict(sub_entry)
-        del sub_entry_dict["id"]
-        del sub_entry_dict["entry"]
-        sub_entry = sub_entries.setdefault(sub_entry.id, sub_entry_dict)
-
-    # Attach video information to the sub-entry data in the admin-controlled
-    # `order` (then id as a stable tiebreak). The app trusts this order — index 0
-    # is the first/primary video — and does not re-sort client-side. New current
-    # uploads are auto-promoted to order 0 (see Video.save()), and admins can
-    # drag to reorder.
-    videos = models.Video.objects.all().order_by("order", "id")
-    for video in videos:
-        entry_id = sub_entry_id_to_entry_id[video.sub_entry_id]
-        entry = entry_id_to_entry[entry_id]
-        sub_entries = entry["sub_entries"]
-        sub_entry = sub_entries.setdefault(video.sub_entry_id, {})
-        sub_entry.setdefault("videos", []).append(dump_video(video))
-
-    # Attach definitions information to the sub-entry data.
-    definitions = models.Definition.objects.all()
-    for definition in definitions:
-        entry_id = sub_entry_id_to_entry_id[definition.sub_entry_id]
-        entry = entry_id_to_entry[entry_id]
-        sub_entries = entry["sub_entries"]
-        sub_entry = sub_entries.setdefault(definition.sub_entry_id, {})
-        definition = model_to_dict(definition)
-        del definition["id"]
-        del definition["sub_entry"]
-        sub_entry.setdefault("definitions", []).append(definition)
-
-    # Collapse the sub entries dictionary, since we don't actually care about any kind
-    # of numerical index for the sub-entries. Order is preserved since dicts are
-    # ordered in Python 3.6+ by insertion order.
-    out = []
-    for entry in entry_id_to_entry.values():
-        if "sub_entries" not in entry:
-            continue
-        # Remove any sub entries without at least one video.
-        new_sub_entries = []
-        for sub_entry in list(entry["sub_entries"].values()):
-            if not sub_entry.get("videos", []):
-                continue
-            new_sub_entries.append(sub_entry)
-        # Ignore any entries without at least one sub-entry.
-        if len(new_sub_entries) == 0:
+
+def dump_definition(definition):
+    """Serialise one Definition for the dump."""
+    definition_dict = model_to_dict(definition)
+    del definition_dict["id"]
+    del definition_dict["sub_entry"]
+    return definition_dict
+
+
+def set_entry_categories(entry, category_names):
+    # We only set the category names. If there are no relations this is an empty
+    # list. For backwards compatibility, the first category is also set as the
+    # "category" field.
+    entry["categories"] = category_names
+    if category_names:
+        entry["category"] = category_names[0]
+
+
+def collapse_sub_entries(entry):
+    """Turn the entry's sub-entry map into the list the dump emits.
+
+    We don't actually care about any kind of numerical index for the sub-entries,
+    so the map collapses to its values. Order is preserved since dicts are ordered
+    by insertion order. Sub-entries without at least one video are dropped.
+    Returns False if the entry is left with no sub-entries, meaning it should be
+    left out of the dump.
+    """
+    if "sub_entries" not in entry:
+        return False
+    new_sub_entries = []
+    for sub_entry in list(entry["sub_entries"].values()):
+        if not sub_entry.get("videos", []):
             continue
-        entry["sub_entries"] = new_sub_entries
-        out.append(entry)
+        new_sub_entries.append(sub_entry)
+    if len(new_sub_entries) == 0:
+        return False
+    entry["sub_entries"] = new_sub_entries
+    return True
+
+
+def _resolve_engine(engine):
+    engine = engine or settings.DUMP_ENGINE
+    if engine not in DUMP_ENGINES:
+        raise ValueError(
+            f"Unknown dump engine {engine}, expected one of {DUMP_ENGINES}"
+        )
+    if connection.vendor != "postgresql":
+        return "python"
+    return engine
+
+
+def build_dump_models(engine=None, profile=None, dump_filter=NO_FILTER):
+    """Return every dumped entry as a list, built by `engine` (see DUMP_ENGINES).
+
+    Defaults to settings.DUMP_ENGINE. Every engine returns exactly the same
+    entries; check_dump_engines checks that against a real database. Each stage
+    of the build is recorded in `profile` (a DumpProfile), or logged if None.
+    Only the parts of the dump `dump_filter` (a DumpFilter) selects are built.
+    """
+    with profiling(profile, "build_dump_models") as profile:
+        engine = _resolve_engine(engine)
+        if engine == "postgres":
+            return list(
+                _iter_dump_models_postgres(profile=profile, dump_filter=dump_filter)
+            )
+        rows = None
+        if engine == "parallel":
+            rows = _fetch_dump_rows_parallel(_dump_queries(dump_filter), profile)
+        return _build_dump_models_python(profile, dump_filter, rows)
+
+
+def _dump_queries(dump_filter):
+    # The queries the Python engine builds the dump from, none of which depend
+    # on another's results. We don't load up categories with the entries for
+    # efficiency reasons, it is faster to load up the relations and category
+    # data separately and then build it all up in the Python code.
+    definitions = dump_filter.filter_definitions(
+        # Definition has no default ordering, so order by id to keep the dump
+        # deterministic.
+        models.Definition.objects.order_by("id")
+    )
+    if "definitions" in dump_filter.omit:
+        definitions = definitions.none()
+    return {
+        "entries": models.Entry.objects.values(
+            "id",
+            "word_in_english",
+            "word_in_tamil",
+            "word_in_sinhala",
+            "entry_type",
+        ),
+        "categories": models.Category.objects.all(),
+        "entry_categories": models.Entry.categories.through.objects.all(),
+        # Ordered by the admin-controlled `order` (then id as a stable
+        # tiebreak) so the dump emits sub-entries and videos in the order the
+        # admin arranged them.
+        "sub_entries": dump_filter.filter_sub_entries(
+            models.SubEntry.objects.order_by("order", "id")
+        ),
+        "videos": dump_filter.filter_videos(
+            models.Video.objects.order_by("order", "id")
+        ),
+        "definitions": definitions,
+    }
+
+
+def _fetch_dump_rows_parallel(queries, profile):
+    """Run `queries` (from _dump_queries) at once, returning their rows by name.
+
+    Each query runs on its own connection, from its own thread, so the build
+    waits for the slowest query rather than for all of them one after another.
+    The connections all read the same snapshot, exported from this one, so the
+    rows are as consistent as if they had been read in one transaction.
+    """
+    if connection.in_atomic_block:
+        # The caller's transaction is the snapshot, and other connections can't
+        # see its writes, so stay on this connection.
+        return None
+    with profile.stage("fetch") as stage:
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY"
+                )
+                # The snapshot stays importable until this transaction ends,
+                # i.e. until every worker has imported it.
+                cursor.execute("SELECT pg_export_snapshot()")
+                (snapshot_id,) = cursor.fetchone()
+            with concurrent.futures.ThreadPoolExecutor(len(queries)) as executor:
+                futures = {
+                    name: executor.submit(_fetch_in_snapshot, snapshot_id, query)
+                    for name, query in queries.items()
+                }
+                rows = {name: future.result() for name, future in futures.items()}
+        stage.rows = sum(len(r) for r in rows.values())
+        # The workers' queries run on other connections, which the profile
+        # doesn't see, so count them here.
+        fetched = sum(not query.query.is_empty() for query in queries.values())
+        stage.stats.queries += fetched
+        profile.total.queries += fetched
+    return rows
+
+
+def _fetch_in_snapshot(snapshot_id, query):
+    # Runs in a worker thread, so on that thread's own connection, which is
+    # closed afterwards rather than left open when the thread exits.
+    try:
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY"
+                )
+                cursor.execute("SET TRANSACTION SNAPSHOT %s", [snapshot_id])
+            return list(query)
+    finally:
+        connection.close()
+
+
+def _build_dump_models_python(profile, dump_filter, rows=None):
+    # `rows` are the rows of _dump_queries if they've already been fetched (see
+    # _fetch_dump_rows_parallel), otherwise each stage runs its own query.
+    queries = rows or _dump_queries(dump_filter)
+
+    # Load all the information we care about from the entries.
+    with profile.stage("entries") as stage:
+        # Build a map of Entry ID to Entry as a dict.
+        entry_id_to_entry = {}
+        for entry in queries["entries"]:
+            id = entry["id"]
+            del entry["id"]
+            entry_id_to_entry[id] = entry
+        stage.rows = len(entry_id_to_entry)
+
+    with profile.stage("categories") as stage:
+        # Build a map of Category ID to Category as a dict.
+        category_id_to_category = {}
+        for category in queries["categories"]:
+            id = category.id
+            del category.id
+            category_id_to_category[id] = category
+
+        # Load up the entry category relations.
+        entry_id_to_category_ids = {}
+        for entry_category in queries["entry_categories"]:
+            entry_id = entry_category.entry_id
+            category_id = entry_category.category_id
+            entry_id_to_category_ids.setdefault(entry_id, []).append(category_id)
+            stage.rows += 1
+
+        # Set categories on the entries.
+        for entry_id, entry in entry_id_to_entry.items():
+            set_entry_categories(
+                entry,
+                [
+                    category_id_to_category[category_id].name
+                    for category_id in entry_id_to_category_ids.get(entry_id, [])
+                ],
+            )
+
+    with profile.stage("sub_entries") as stage:
+        # Load up a map of SubEntry ID to Entry ID, and add base information for
+        # each sub-entry.
+        sub_entry_id_to_entry_id = {}
+        for sub_entry in queries["sub_entries"]:
+            entry_id = sub_entry.entry_id
+            sub_entry_id_to_entry_id[sub_entry.id] = entry_id
+            entry = entry_id_to_entry[entry_id]
+            sub_entries = entry.setdefault("sub_entries", {})
+            sub_entry = sub_entries.setdefault(
+                sub_entry.id, dump_sub_entry(sub_entry, dump_filter.omit)
+            )
+            stage.rows += 1
+
+    with profile.stage("videos") as stage:
+        # Attach video information to the sub-entry data in the admin-controlled
+        # `order` (then id as a stable tiebreak). The app trusts this order — index 0
+        # is the first/primary video — and does not re-sort client-side. New current
+        # uploads are auto-promoted to order 0 (see Video.save()), and admins can
+        # drag to reorder.
+        for video in queries["videos"]:
+            entry_id = sub_entry_id_to_entry_id[video.sub_entry_id]
+            entry = entry_id_to_entry[entry_id]
+            sub_entries = entry["sub_entries"]
+            sub_entry = sub_entries.setdefault(video.sub_entry_id, {})
+            sub_entry.setdefault("videos", []).append(
+                dump_video(video, dump_filter.include)
+            )
+            stage.rows += 1
+
+    with profile.stage("definitions") as stage:
+        # Attach definitions information to the sub-entry data.
+        for definition in queries["definitions"]:
+            entry_id = sub_entry_id_to_entry_id[definition.sub_entry_id]
+            entry = entry_id_to_entry[entry_id]
+            sub_entries = entry["sub_entries"]
+            sub_entry = sub_entries.setdefault(definition.sub_entry_id, {})
+            sub_entry.setdefault("definitions", []).append(dump_definition(definition))
+            stage.rows += 1
+
+    with profile.stage("collapse") as stage:
+        # Collapse the sub entries dictionaries, ignoring any entries without at least
+        # one sub-entry that has a video.
+        out = []
+        for entry in entry_id_to_entry.values():
+            if collapse_sub_entries(entry):
+                out.append(entry)
+        stage.rows = len(out)
 
     return out
 
 
+class _EntryGroups:
+    """Hands out the rows of a query ordered by owning entry, one entry at a time.
+
+    The query must be ordered by ENTRY_ORDERING of the owning entry, so its rows
+    arrive in the same order as the entries themselves.
+    """
+
+    def __init__(self, rows, entry_id_of):
+        self._rows = iter(rows)
+        self._entry_id_of = entry_id_of
+        self._head = next(self._rows, None)
+
+    def take(self, entry_id):
+        out = []
+        while self._head is not None and self._entry_id_of(self._head) == entry_id:
+            out.append(self._head)
+            self._head = next(self._rows, None)
+        return out
+
+
+@contextlib.contextmanager
+def _read_snapshot():
+    # The streaming builder keeps several queries open at once, so they need to
+    # see the same snapshot of the DB or a row created mid-dump could desync
+    # them. SQLite read transactions are already snapshots; Postgres needs
+    # REPEATABLE READ for that (READ COMMITTED snapshots per statement). If the
+    # caller already opened a transaction, that transaction is the snapshot.
+    if connection.in_atomic_block:
+        yield
+        return
+    with transaction.atomic():
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY"
+                )
+        yield
+
+
+def _postgres_dump_sql(entries, dump_filter=NO_FILTER):
+    # Every child table is aggregated into JSON per parent in one pass, then
+    # joined up to the entries. Objects are built with json (not jsonb)
+    # functions, which keep keys in the order given, and each aggregate is
+    # ordered the same way the Python engine orders its queries. Keys that the
+    # Python engine only sets sometimes ("definitions", "category", the video
+    # metadata) are left out the same way here.
+    def table(model):
+        return connection.ops.quote_name(model._meta.db_table)
+
+    def column(model, field_name):
+        return connection.ops.quote_name(model._meta.get_field(field_name).column)
+
+    entry_order = ", ".join(
+        f"e.{column(models.Entry, field_name)}" for field_name in ENTRY_ORDERING
+    )
+    where = ""
+    where_params = []
+    if entries is not None:
+        try:
+            entries_sql, where_params = (
+                entries.order_by().values("id").query.sql_with_params()
+            )
+            where = f"WHERE e.id IN ({entries_sql})"
+        except EmptyResultSet:
+            # Django can tell the filter matches nothing, e.g. id__in=[].
+            where = "WHERE false"
+
+    # The DumpFilter's conditions, with their params in the order they appear.
+    def any_of(sql_column, values):
+        if values is None:
+            return "true", []
+        return f"{sql_column} IN ({', '.join(['%s'] * len(values))})", list(values)
+
+    video_where, video_params = any_of("v.status", dump_filter.video_statuses)
+    video_where += f" AND v.media_state = '{models.MediaState.READY.value}'"
+    definition_where, definition_params = any_of(
+        "d.language", dump_filter.definition_languages
+    )
+    sub_entry_where, sub_entry_params = any_of("s.region", dump_filter.regions)
+    with_definitions = "definitions" not in dump_filter.omit
+    if not with_definitions:
+        definition_params = []
+    params = [*video_params, *definition_params, *sub_entry_params, *where_params]
+
+    # A video is a bare filename unless it's HISTORICAL or has metadata, or
+    # renditions that were asked for (see dump_video); json_strip_nulls drops
+    # the empty metadata fields.
+    video_meta = {
+        field_name: f"v.{column(models.Video, field_name)}"
+        for field_name in ["researched", "recorded", "published", "source", "note"]
+    }
+    no_video_meta = " AND ".join(f"{meta} = ''" for meta in video_meta.values())
+    video_meta_fields = ", ".join(
+        f"'{field_name}', NULLIF({meta}, '')" for field_name, meta in video_meta.items()
+    )
+    if "renditions" in dump_filter.include:
+        renditions = f"v.{column(models.Video, 'renditions')}"
+        no_video_meta += f" AND {renditions} = '{{}}'::jsonb"
+        video_meta_fields += f", 'renditions', NULLIF({renditions}, '{{}}'::jsonb)"
+    video_json = f"""
+        CASE WHEN v.status = '{models.VideoStatus.CURRENT.value}' AND {no_video_meta}
+        THEN to_json(v.media)
+        ELSE json_strip_nulls(json_build_object(
+            'video', v.media, 'status', v.status, {video_meta_fields}
+        ))
+        END
+    """
+    sub_entry_fields = {
+        "order": 's."order"',
+        "region": "s.region",
+        "related_words": "s.related_words",
+        "videos": "v.videos",
+    }
+    sub_entry_fields = ", ".join(
+        f"'{field}', {value}"
+        for field, value in sub_entry_fields.items()
+        if field not in dump_filter.omit
+    )
+    if with_definitions:
+        definitions_cte = f"""
+            definitions AS (
+                SELECT d.sub_entry_id, json_agg(json_build_object(
+                    'translation_of', d.translation_of_id,
+                    'language', d.language,
+                    'category', d.category,
+                    'definition', d.definition
+                ) ORDER BY d.id) AS definitions
+                FROM {table(models.Definition)} d
+                WHERE {definition_where}
+                GROUP BY d.sub_entry_id
+            ),
+        """
+        sub_entry_json = f"""
+            CASE WHEN d.definitions IS NULL
+            THEN json_build_object({sub_entry_fields})
+            ELSE json_build_object({sub_entry_fields}, 'definitions', d.definitions)
+            END
+        """
+        definitions_join = "LEFT JOIN definitions d ON d.sub_entry_id = s.id"
+    else:
+        definitions_cte = ""
+        sub_entry_json = f"json_build_object({sub_entry_fields})"
+        definitions_join = ""
+    return (
+        f"""
+        WITH videos AS (
+            SELECT v.sub_entry_id, json_agg({video_json} ORDER BY v."order", v.id) AS videos
+            FROM {table(models.Video)} v
+            WHERE {video_where}
+            GROUP BY v.sub_entry_id
+        ), {definitions_cte} sub_entries AS (
+            SELECT s.entry_id, json_agg(
+                {sub_entry_json}
+                ORDER BY s."order", s.id
+            ) AS sub_entries
+            FROM {table(models.SubEntry)} s
+            -- Sub-entries without videos are left out, like collapse_sub_entries.
+            JOIN videos v ON v.sub_entry_id = s.id
+            {definitions_join}
+            WHERE {sub_entry_where}
+            GROUP BY s.entry_id
+        ), categories AS (
+            SELECT ec.entry_id, json_agg(c.name ORDER BY ec.id) AS names
+            FROM {table(models.Entry.categories.through)} ec
+            JOIN {table(models.Category)} c ON c.id = ec.category_id
+            GROUP BY ec.entry_id
+        )
+        SELECT json_build_object(
+            'word_in_english', e.word_in_english,
+            'word_in_tamil', e.word_in_tamil,
+            'word_in_sinhala', e.word_in_sinhala,
+            'entry_type', e.entry_type,
+            'categories', COALESCE(c.names, '[]'::json),
+            'category', c.names -> 0,
+            'sub_entries', s.sub_entries
+        )::text
+        FROM {table(models.Entry)} e
+        -- Entries left without sub-entries aren't dumped.
+        JOIN sub_entries s ON s.entry_id = e.id
+        LEFT JOIN categories c ON c.entry_id = e.id
+        {where}
+        ORDER BY {entry_order}
+        """,
+        params,
+    )
+
+
+def _iter_dump_models_postgres(entries=None, profile=None, dump_filter=NO_FILTER):
+    """Postgres engine for iter_dump_models: Postgres builds each entry's JSON.
+
+    Rather than sending every row of five tables over to be shaped in Python,
+    one query aggregates them into a JSON document per entry, so only the
+    finished entries cross the wire. Rows are streamed from a server-side
+    cursor.
+    """
+    sql, params = _postgres_dump_sql(entries, dump_filter)
+    query_stage = profile.stage("query")
+    decode_stage = profile.stage("decode")
+    with connection.chunked_cursor() as cursor:
+        with query_stage:
+            cursor.execute(sql, params)
+        while True:
+            with query_stage:
+                rows = cursor.fetchmany(POSTGRES_FETCH_SIZE)
+                query_stage.rows += len(rows)
+            if not rows:
+                break
+            for (entry_json,) in rows:
+                with decode_stage:
+                    entry = json.loads(entry_json)
+                    # json_build_object can't leave a key out conditionally, so
+                    # "category" is null when there are no categories.
+                    if entry["category"] is None:
+                        del entry["category"]
+                    decode_stage.rows += 1
+                yield entry
+
+
+def iter_dump_models(entries=None, engine=None, profile=None, dump_filter=NO_FILTER):
+    """Generator version of build_dump_models, yielding one entry at a time.
+
+    Rather than loading each table whole and joining in Python, every query is
+    ordered by the owning entry and streamed with .iterator(), and the results
+    are merged in lockstep. Peak memory is one entry's worth of data rather than
+    the whole dump. Yields exactly what build_dump_models returns, in the same
+    order.
+
+    If `entries` (an Entry queryset) is given, only those entries are dumped.
+    `engine`, `profile` and `dump_filter` are as for build_dump_models.
+    """
+    with profiling(profile, "iter_dump_models") as profile:
+        # The parallel engine loads every table whole, which would defeat
+        # streaming, so streams with the Python engine instead.
+        if _resolve_engine(engine) == "postgres":
+            yield from _iter_dump_models_postgres(entries, profile, dump_filter)
+        else:
+            yield from _iter_dump_models_python(entries, profile, dump_filter)
+
+
+def _iter_dump_models_python(entries, profile, dump_filter):
+    def owned_by_entries(queryset, lookup):
+        if entries is None:
+            return queryset
+        return queryset.filter(**{f"{lookup}__in": entries.values("id")})
+
+    # The stages are interleaved, one entry at a time, so each adds up the time
+    # it spends on every entry. A stage's query runs the first time it fetches.
+    entries_stage = profile.stage("entries")
+    categories_stage = profile.stage("categories")
+    sub_entries_stage = profile.stage("sub_entries")
+    videos_stage = profile.stage("videos")
+    definitions_stage = profile.stage("definitions")
+    collapse_stage = profile.stage("collapse")
+
+    with _read_snapshot():
+        with categories_stage:
+            # Categories are a small lookup table, so these are loaded up front.
+            category_id_to_name = dict(
+                models.Category.objects.values_list("id", "name")
+            )
+
+        entry_rows = (
+            owned_by_entries(models.Entry.objects, "id")
+            .order_by(*ENTRY_ORDERING)
+            .values(
+                "id",
+                "word_in_english",
+                "word_in_tamil",
+                "word_in_sinhala",
+                "entry_type",
+            )
+            .iterator()
+        )
+
+        with categories_stage:
+            entry_categories = _EntryGroups(
+                owned_by_entries(models.Entry.categories.through.objects, "entry")
+                .order_by(*[f"entry__{f}" for f in ENTRY_ORDERING], "id")
+                .values_list("entry_id", "category_id")
+                .iterator(),
+                lambda row: row[0],
+            )
+        with sub_entries_stage:
+            sub_entries = _EntryGroups(
+                dump_filter.filter_sub_entries(
+                    owned_by_entries(models.SubEntry.objects, "entry")
+                )
+                .order_by(*[f"entry__{f}" for f in ENTRY_ORDERING], "order", "id")
+                .iterator(),
+                lambda sub_entry: sub_entry.entry_id,
+            )
+        # Within an entry, videos and definitions are grouped by sub-entry but
+        # needn't follow the sub-entry order: they're attached by sub-entry ID.
+        with videos_stage:
+            videos = _EntryGroups(
+                dump_filter.filter_videos(
+                    owned_by_entries(models.Video.objects, "sub_entry__entry")
+                )
+                .annotate(entry_id=F("sub_entry__entry_id"))
+                .order_by(
+                    *[f"sub_entry__entry__{f}" for f in ENTRY_ORDERING],
+                    "sub_entry_id",
+                    "order",
+                    "id",
+                )
+                .iterator(),
+                lambda video: video.entry_id,
+            )
+        with definitions_stage:
+            if "definitions" in dump_filter.omit:
+                definition_query = iter(())
+            else:
+                definition_query = (
+                    dump_filter.filter_definitions(
+                        owned_by_entries(models.Definition.objects, "sub_entry__entry")
+                    )
+                    .annotate(entry_id=F("sub_entry__entry_id"))
+                    .order_by(
+                        *[f"sub_entry__entry__{f}" for f in ENTRY_ORDERING],
+                        "sub_entry_id",
+                        "id",
+                    )
+                    .iterator()
+                )
+            definitions = _EntryGroups(
+                definition_query, lambda definition: definition.entry_id
+            )
+
+        while True:
+            with entries_stage:
+                entry = next(entry_rows, None)
+                if entry is None:
+                    break
+                entries_stage.rows += 1
+            entry_id = entry.pop("id")
+
+            with categories_stage:
+                category_rows = entry_categories.take(entry_id)
+                set_entry_categories(
+                    entry,
+                    [
+                        category_id_to_name[category_id]
+                        for _, category_id in category_rows
+                    ],
+                )
+                categories_stage.rows += len(category_rows)
+
+            with sub_entries_stage:
+                sub_entry_rows = sub_entries.take(entry_id)
+                entry_sub_entries = entry["sub_entries"] = {
+                    sub_entry.id: dump_sub_entry(sub_entry, dump_filter.omit)
+                    for sub_entry in sub_entry_rows
+                }
+                sub_entries_stage.rows += len(sub_entry_rows)
+            with videos_stage:
+                video_rows = videos.take(entry_id)
+                for video in video_rows:
+                    sub_entry = entry_sub_entries.setdefault(video.sub_entry_id, {})
+                    sub_entry.setdefault("videos", []).append(
+                        dump_video(video, dump_filter.include)
+                    )
+                videos_stage.rows += len(video_rows)
+            with definitions_stage:
+                definition_rows = definitions.take(entry_id)
+                for definition in definition_rows:
+                    sub_entry = entry_sub_entries.setdefault(
+                        definition.sub_entry_id, {}
+                    )
+                    sub_entry.setdefault("definitions", []).append(
+                        dump_definition(definition)
+                    )
+                definitions_stage.rows += len(definition_rows)
+
+            with collapse_stage:
+                dumped = collapse_sub_entries(entry)
+                collapse_stage.rows += dumped
+            if dumped:
+                yield entry
+
+
 # Get the entire DB as JSON, to be stored in a bucket to then be served to clients.
-def build_dump():
+# Each stage of the build is recorded in `profile` (a DumpProfile), or logged if
+# None. Only the parts `dump_filter` (a DumpFilter) selects are built.
+def build_dump(profile=None, dump_filter=NO_FILTER):
     LOG.info("Building data dump")
 
-    out = build_dump_models()
+    with profiling(profile, "build_dump") as profile:
+        out = build_dump_models(profile=profile, dump_filter=dump_filter)
 
     LOG.info(f"Returning data dump containing {len(out)} entries")
 
@@ -160,3 +849,248 @@ def build_dump():
     out = {"data": out}
 
     return out
+
+
+def build_dump_delta(since, dump_filter=NO_FILTER):
+    """Build the changes to the dump since DumpVersion `since`.
+
+    Returns the current version, every dumped entry that changed after `since`
+    (in the same shape as in the full dump), and the English words of entries
+    that left the dump after `since`. Clients should drop the deleted words and
+    then upsert the entries, keyed by word_in_english. With `dump_filter`, this
+    is the delta of the dump built with that filter.
+    """
+    # Read the version before taking the snapshot: anything that changes in
+    # between is then simply sent again in the next delta.
+    version, _ = current_version()
+
+    with _read_snapshot():
+        changed = models.Entry.objects.filter(dump_version__gt=since)
+        data = list(iter_dump_models(entries=changed, dump_filter=dump_filter))
+
+        # Entries that changed but no longer make it into the dump (e.g. their
+        # last video was removed) are deleted as far as clients are concerned.
+        dumped_words = {entry["word_in_english"] for entry in data}
+        deleted_words = set(changed.values_list("word_in_english", flat=True))
+        deleted_words.update(
+            models.DeletedEntry.objects.filter(dump_version__gt=since).values_list(
+                "word_in_english", flat=True
+            )
+        )
+        deleted = sorted(deleted_words - dumped_words)
+
+    LOG.info(
+        f"Returning dump delta since version {since} to {version} containing "
+        f"{len(data)} changed and {len(deleted)} deleted entries"
+    )
+
+    return {"version": version, "data": data, "deleted": deleted}
+
+
+def iter_dump_json(profile=None, dump_filter=NO_FILTER):
+    """Stream the dump as UTF-8 JSON bytes, built entry by entry.
+
+    The bytes are identical to serialising build_dump() with JsonResponse (same
+    encoder and separators), just never held in memory all at once. `profile`
+    and `dump_filter` are as for build_dump_models.
+    """
+    LOG.info("Streaming data dump")
+
+    with profiling(profile, "iter_dump_json") as profile:
+        entries = iter_dump_models(profile=profile, dump_filter=dump_filter)
+        count = yield from _iter_data_json(entries, profile)
+
+    LOG.info(f"Streamed data dump containing {count} entries")
+
+
+def _iter_data_json(entries, profile):
+    # Serialises `entries` with iter_data_chunks, returning how many there were.
+    def pieces():
+        encoder = DjangoJSONEncoder()
+        for entry in entries:
+            # Looked up per entry so it's listed after the build's own stages.
+            with profile.stage("serialise") as serialise_stage:
+                piece = encoder.encode(entry)
+                serialise_stage.rows += 1
+            yield piece
+
+    return (yield from iter_data_chunks(pieces()))
+
+
+def iter_data_chunks(pieces):
+    """Join serialised entries into {"data": [...]} UTF-8 JSON bytes.
+
+    Yields it in chunks of about STREAM_CHUNK_SIZE bytes, with the same
+    separators as JsonResponse, and returns how many entries there were.
+    """
+    count = 0
+    buffer = ['{"data": [']
+    size = 0
+    for piece in pieces:
+        buffer.append(", " + piece if count else piece)
+        size += len(piece)
+        count += 1
+        if size >= STREAM_CHUNK_SIZE:
+            yield "".join(buffer).encode("utf-8")
+            buffer = []
+            size = 0
+    buffer.append("]}")
+    yield "".join(buffer).encode("utf-8")
+    return count
+
+
+def iter_dump_index(profile=None, dump_filter=NO_FILTER):
+    """Yield the slim index dump, one entry at a time.
+
+    Each entry has just its ID (the key for fetching the rest of it with
+    dump_entry), words, entry type and categories, in the same order and with
+    the same values as in the full dump. Only entries that are in the full dump
+    are listed. `profile` and `dump_filter` are as for build_dump_models, though
+    only the filter's video statuses and regions matter here.
+    """
+    with profiling(profile, "iter_dump_index") as profile:
+        entries_stage = profile.stage("entries")
+        categories_stage = profile.stage("categories")
+        # The same entries collapse_sub_entries keeps: those with a video.
+        dumped = models.Entry.objects.filter(
+            Exists(
+                dump_filter.filter_videos(
+                    models.Video.objects.filter(sub_entry__entry=OuterRef("pk"))
+                )
+            )
+        )
+        with _read_snapshot():
+            with categories_stage:
+                category_id_to_name = dict(
+                    models.Category.objects.values_list("id", "name")
+                )
+                entry_categories = _EntryGroups(
+                    models.Entry.categories.through.objects.filter(
+                        entry__in=dumped.values("id")
+                    )
+                    .order_by(*[f"entry__{f}" for f in ENTRY_ORDERING], "id")
+                    .values_list("entry_id", "category_id")
+                    .iterator(),
+                    lambda row: row[0],
+                )
+            entry_rows = (
+                dumped.order_by(*ENTRY_ORDERING)
+                .values(
+                    "id",
+                    "word_in_english",
+                    "word_in_tamil",
+                    "word_in_sinhala",
+                    "entry_type",
+                )
+                .iterator()
+            )
+            while True:
+                with entries_stage:
+                    entry = next(entry_rows, None)
+                    if entry is None:
+                        break
+                    entries_stage.rows += 1
+                with categories_stage:
+                    category_rows = entry_categories.take(entry["id"])
+                    set_entry_categories(
+                        entry,
+                        [
+                            category_id_to_name[category_id]
+                            for _, category_id in category_rows
+                        ],
+                    )
+                    categories_stage.rows += len(category_rows)
+                yield entry
+
+
+def iter_dump_index_json(profile=None, dump_filter=NO_FILTER):
+    """Stream the slim index dump (see iter_dump_index) as UTF-8 JSON bytes."""
+    LOG.info("Streaming index dump")
+
+    with profiling(profile, "iter_dump_index_json") as profile:
+        entries = iter_dump_index(profile=profile, dump_filter=dump_filter)
+        count = yield from _iter_data_json(entries, profile)
+
+    LOG.info(f"Streamed index dump containing {count} entries")
+
+
+def dump_entry(entry_id):
+    """Return the entry with ID `entry_id` exactly as it is in the full dump.
+
+    Returns None if there's no such entry or it isn't in the dump.
+    """
+    return next(
+        iter_dump_models(entries=models.Entry.objects.filter(pk=entry_id)), None
+    )
+
+
+def compress_dump(content, brotli_quality=BROTLI_QUALITY):
+    """Return the pre-compressed variants of the serialised dump.
+
+    Keyed by Content-Encoding token, most preferred first. The output only
+    depends on the input (gzip's mtime is pinned), so equal dumps compress to
+    equal bytes.
+    """
+    return {
+        "br": brotli.compress(content, quality=brotli_quality),
+        "gzip": gzip.compress(content, compresslevel=GZIP_LEVEL, mtime=0),
+    }
+
+
+def dump_compressors(brotli_quality=BROTLI_QUALITY):
+    """Return incremental compressors for the same variants as compress_dump.
+
+    Keyed the same way, each a (compress, flush) pair of functions: pass
+    compress() each chunk of the dump in turn, then call flush() for the rest of
+    the output. Lets a streamed dump be compressed without holding all of it.
+    """
+    br = brotli.Compressor(quality=brotli_quality)
+    # wbits=31 makes zlib write a gzip header, with a zero mtime.
+    gz = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    return {
+        "br": (br.process, br.finish),
+        "gzip": (gz.compress, gz.flush),
+    }
+
+
+def serialise_dump(entries):
+    """Serialise a list of dump entries as {"data": [...]} UTF-8 JSON bytes.
+
+    Uses the same encoder and separators as JsonResponse, so serialising the
+    whole of build_dump_models gives exactly the bytes /dump serves.
+    """
+    return DjangoJSONEncoder().encode({"data": entries}).encode("utf-8")
+
+
+def iter_dump_shards(entries=None, shard_size=DEFAULT_SHARD_SIZE, by_category=False):
+    """Split the dump into shards, yielding (name, entries) pairs.
+
+    The dump is `entries`, an iterable of the dump's entries in order, e.g. those
+    of a dump already built, or else built here. Each shard is a list of entries
+    shaped exactly as in the full dump. By default, shards hold `shard_size`
+    consecutive entries in dump order (named by their index), and only one is in
+    memory at a time. With `by_category` there's one shard per category instead,
+    keyed by each entry's first category (its "category" field), with
+    uncategorised entries last; that has to see the whole dump before it can
+    yield anything.
+    """
+    if entries is None:
+        entries = iter_dump_models()
+    if by_category:
+        shards = {}
+        for entry in entries:
+            shards.setdefault(entry.get("category"), []).append(entry)
+        for category in sorted(shards, key=lambda c: (c is None, c or "")):
+            yield category or "uncategorised", shards[category]
+        return
+
+    shard = []
+    index = 0
+    for entry in entries:
+        shard.append(entry)
+        if len(shard) == shard_size:
+            yield str(index), shard
+            shard = []
+            index += 1
+    if shard:
+        yield str(index), shard
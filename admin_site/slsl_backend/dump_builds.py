@@ -0,0 +1,103 @@
+"""Limits how many full dumps are built at once, across all worker processes.
+
+Building the dump is the heaviest thing this service asks of its small Cloud
+SQL instance, so at most settings.DUMP_BUILD_CONCURRENCY full builds run at any
+one time. Each build holds a slot for as long as it runs. On Postgres the slots
+are session-level advisory locks, so they're shared by every thread and worker
+process (and instance) using the DB. Elsewhere (SQLite in dev) they're a
+per-process semaphore.
+
+A build that can't get a slot doesn't queue: build_slot raises DumpBusy, and
+the caller serves something else instead (see dump_cache.get_cached_dump and
+views.get_dump).
+"""
+
+import contextlib
+import logging
+import threading
+
+from django.conf import settings
+from django.db import connection
+
+LOG = logging.getLogger(__name__)
+
+# The first key of the two-key advisory locks the slots use ("SLSL" in ASCII);
+# the second key is the slot number.
+ADVISORY_LOCK_CLASS = 0x534C534C
+
+_local_slots = threading.BoundedSemaphore(settings.DUMP_BUILD_CONCURRENCY)
+
+
+class DumpBusy(Exception):
+    """Every dump build slot is taken."""
+
+
+def _try_advisory_lock(slot):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT pg_try_advisory_lock(%s, %s)", [ADVISORY_LOCK_CLASS, slot]
+        )
+        return cursor.fetchone()[0]
+
+
+def _advisory_unlock(slot):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_unlock(%s, %s)", [ADVISORY_LOCK_CLASS, slot])
+
+
+@contextlib.contextmanager
+def build_slot():
+    """Hold a dump build slot for the duration, or raise DumpBusy if none is free."""
+    if connection.vendor != "postgresql":
+        if not _local_slots.acquire(blocking=False):
+            raise DumpBusy()
+        try:
+            yield
+        finally:
+            _local_slots.release()
+        return
+
+    for slot in range(settings.DUMP_BUILD_CONCURRENCY):
+        if _try_advisory_lock(slot):
+            break
+    else:
+        raise DumpBusy()
+    try:
+        yield
+    finally:
+        _advisory_unlock(slot)
+
+
+class _SlotHeldIterator:
+    def __init__(self, chunks, slot):
+        self._chunks = chunks
+        self._slot = slot
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self._chunks)
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        # Called by the response once it's done, even if it was never iterated.
+        try:
+            self._chunks.close()
+        finally:
+            self._slot.close()
+
+
+def hold_build_slot(chunks):
+    """Take a build slot for a streamed build, released once `chunks` is done.
+
+    Raises DumpBusy straight away if no slot is free, so a streamed response
+    can still be turned into a 503. The returned iterator yields `chunks` and
+    releases the slot when it's exhausted or closed.
+    """
+    slot = contextlib.ExitStack()
+    slot.enter_context(build_slot())
+    return _SlotHeldIterator(chunks, slot)
@@ -0,0 +1,220 @@
+"""In-process cache of the serialised dump, invalidated via DumpVersion.
+
+Each worker process keeps the last dump it built along with the DumpVersion it
+was built at. Signal receivers (see signals.py) bump DumpVersion whenever dumped
+content changes, in whichever process the change happened, so a worker only
+rebuilds when the version it cached is no longer the current one. The gzip and
+brotli variants are compressed once per rebuild, not per request. Threads that
+find the dump stale at the same time wait on one rebuild rather than each
+starting their own.
+
+With settings.DUMP_FILE_DIR set, the dump is kept on disk rather than in memory,
+and shared by every worker process (see dump_files.py): a worker that finds its
+copy stale first looks for one another worker has written at the current
+version, and only builds if there isn't one. It's then streamed to disk as it's
+built, so a rebuild's memory stays as bounded as with settings.STREAM_DUMP.
+Without it, each worker holds the whole dump and its compressed copies.
+"""
+
+import dataclasses
+import datetime
+import hashlib
+import logging
+import threading
+
+from .dump import (
+    NO_FILTER,
+    compress_dump,
+    current_version,
+    iter_dump_index_json,
+)
+from .dump_builds import DumpBusy, build_slot
+from .dump_files import DumpFileWriter
+from .dump_files import enabled as dump_files_enabled
+from .dump_files import read_dump_files
+from .dump_fragments import iter_dump_json_from_fragments
+from .dump_msgpack import iter_dump_msgpack
+from .dump_ndjson import iter_dump_ndjson
+from .dump_profile import DumpProfile
+
+LOG = logging.getLogger(__name__)
+
+# How to build each format of the dump the cache can hold, as a stream of bytes.
+# Each optionally takes a DumpProfile to record the build's stages in, and a
+# DumpFilter. Each format and filter is cached separately, and only built once
+# it's first asked for. There are only so many distinct (canonical) filters, so
+# this stays bounded.
+FORMATS = {
+    "json": iter_dump_json_from_fragments,
+    "msgpack": iter_dump_msgpack,
+    "index": iter_dump_index_json,
+    "ndjson": iter_dump_ndjson,
+}
+
+
+@dataclasses.dataclass(frozen=True)
+class CachedDump:
+    # The DumpVersion.version this dump was built at.
+    version: int
+    # When the dumped content last changed, i.e. the dump's Last-Modified.
+    last_modified: datetime.datetime
+    # Strong ETag (quoted) derived from a hash of the content.
+    etag: str
+    # The content, or if the dump is on disk (see dump_files.py), the path of
+    # the file holding it.
+    content: bytes | str
+    # Pre-compressed copies of content, by Content-Encoding (see compress_dump).
+    # Paths too if the dump is on disk.
+    encodings: dict
+    # The per-stage stats of the build, as a Server-Timing header value (see
+    # dump_profile.py).
+    server_timing: str
+
+
+class _Flight:
+    """One in-progress rebuild, which every thread wanting it waits on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+_lock = threading.Lock()
+# (Format name, DumpFilter) -> CachedDump.
+_cached = {}
+# (Format name, DumpFilter) -> _Flight, while that dump is being rebuilt.
+_flights = {}
+
+
+def _read_files(key, version=None, changed_at=None):
+    if not dump_files_enabled():
+        return None
+    meta = read_dump_files(key, version)
+    if meta is None:
+        return None
+    cached = _from_files(meta)
+    # Versions only identify content within one DB, so check it's the same
+    # change, in case the files outlived the DB (or are another DB's).
+    if changed_at is not None and cached.last_modified != changed_at:
+        return None
+    return cached
+
+
+def _from_files(meta):
+    return CachedDump(
+        version=meta["version"],
+        last_modified=datetime.datetime.fromisoformat(meta["last_modified"]),
+        etag=meta["etag"],
+        content=meta["content"],
+        encodings=meta["encodings"],
+        server_timing=meta["server_timing"],
+    )
+
+
+def _build(key, version, changed_at):
+    format, dump_filter = key
+    # Another worker may have built it already, or while this one waited for
+    # the build slot.
+    cached = _read_files(key, version, changed_at)
+    if cached is not None:
+        _cached[key] = cached
+        return cached
+
+    with build_slot():
+        cached = _read_files(key, version, changed_at)
+        if cached is not None:
+            _cached[key] = cached
+            return cached
+
+        LOG.info(f"Dump cache {key} is stale, rebuilding at version {version}")
+        if dump_files_enabled():
+            # Written out (and compressed) chunk by chunk as it's built, so the
+            # whole dump is never in memory.
+            with DumpFileWriter(key, version, changed_at) as writer:
+                with DumpProfile(f"{format} dump cache") as profile:
+                    for chunk in FORMATS[format](
+                        profile=profile, dump_filter=dump_filter
+                    ):
+                        writer.write(chunk)
+                writer.server_timing = profile.server_timing()
+            cached = _from_files(writer.meta)
+        else:
+            with DumpProfile(f"{format} dump cache") as profile:
+                content = b"".join(
+                    FORMATS[format](profile=profile, dump_filter=dump_filter)
+                )
+                with profile.stage("compress") as stage:
+                    etag = f'"{hashlib.sha256(content).hexdigest()}"'
+                    encodings = compress_dump(content)
+                    stage.rows = len(encodings)
+            cached = CachedDump(
+                version=version,
+                last_modified=changed_at,
+                etag=etag,
+                content=content,
+                encodings=encodings,
+                server_timing=profile.server_timing(),
+            )
+    _cached[key] = cached
+    return cached
+
+
+def get_cached_dump(format="json", dump_filter=NO_FILTER):
+    """Return the dump as a CachedDump, rebuilding it only if content changed.
+
+    `dump_filter` (a DumpFilter) selects the parts of the dump to build.
+
+    Concurrent requests for a stale dump share a single rebuild. If that rebuild
+    can't start because too many dumps are being built already (see
+    dump_builds.py), the stale dump is returned instead, and DumpBusy is raised
+    if there isn't one yet.
+    """
+    # Read the version before building: if content changes mid-build we then
+    # cache it under the older version, and simply rebuild on the next request.
+    version, changed_at = current_version()
+    key = (format, dump_filter)
+    cached = _cached.get(key)
+    if cached is not None and cached.version >= version:
+        return cached
+
+    with _lock:
+        # Another thread may have built it since.
+        cached = _cached.get(key)
+        if cached is not None and cached.version >= version:
+            return cached
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight()
+
+    if leader:
+        try:
+            flight.result = _build(key, version, changed_at)
+        except BaseException as e:
+            flight.error = e
+        finally:
+            with _lock:
+                del _flights[key]
+            flight.done.set()
+    else:
+        flight.done.wait()
+
+    if isinstance(flight.error, DumpBusy):
+        # Another worker's dump will do as well as this one's.
+        cached = cached or _read_files(key)
+    if isinstance(flight.error, DumpBusy) and cached is not None:
+        LOG.info(
+            f"Too many dumps are being built, serving the stale {format} dump "
+            f"from version {cached.version}"
+        )
+        return cached
+    if flight.error is not None:
+        raise flight.error
+    return flight.result
+
+
+def clear_cached_dumps():
+    """Drop every cached dump, so the next request for each one rebuilds it."""
+    with _lock:
+        _cached.clear()
@@ -0,0 +1,183 @@
+"""Cached dumps kept on disk, shared by every worker process.
+
+Without this each gunicorn worker (see run.sh) builds, compresses and holds its
+own copy of every dump. With settings.DUMP_FILE_DIR set, the worker that builds
+a dump writes it there instead, named by its format, filter and DumpVersion,
+and every other worker serves that file rather than building its own (see
+dump_cache.py). /dump then serves the file with FileResponse, which WSGI servers
+hand to sendfile.
+
+Every file is written under a temporary name and renamed into place, so no
+worker ever sees half a file. Each version's files are listed in a small
+metadata file, renamed into place last: if it exists, so does the rest. Once a
+newer version is written, older versions are deleted. A worker still serving
+one of them keeps its open file, which the OS only frees once it's closed.
+"""
+
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import tempfile
+
+from django.conf import settings
+
+from .dump import dump_compressors
+
+LOG = logging.getLogger(__name__)
+
+
+def enabled():
+    return bool(settings.DUMP_FILE_DIR)
+
+
+def _stem(key):
+    format, dump_filter = key
+    # The filter's repr is the same in every process (it's all tuples and
+    # strings), and the hash keeps the names short.
+    filter_id = hashlib.sha256(repr(dump_filter).encode("utf-8")).hexdigest()[:16]
+    return f"{format}-{filter_id}-v"
+
+
+def _meta_path(key, version):
+    return os.path.join(settings.DUMP_FILE_DIR, f"{_stem(key)}{version}.meta")
+
+
+def read_dump_files(key, version=None):
+    """Return the metadata of the dump for `key` at `version`, None if missing.
+
+    `key` is a (format, DumpFilter) pair, as in dump_cache. With no `version`,
+    returns the newest one there is. The metadata is a dict of the dump's
+    "version", "last_modified" (ISO 8601), "etag", "server_timing", the path of
+    its "content" and the paths of its "encodings", by Content-Encoding.
+    """
+    if version is None:
+        version = max(_versions(key), default=None)
+        if version is None:
+            return None
+    try:
+        with open(_meta_path(key, version)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _versions(key):
+    stem = _stem(key)
+    with contextlib.suppress(FileNotFoundError):
+        for name in os.listdir(settings.DUMP_FILE_DIR):
+            if name.startswith(stem) and name.endswith(".meta"):
+                with contextlib.suppress(ValueError):
+                    yield int(name[len(stem) : -len(".meta")])
+
+
+def _write_atomically(path, content):
+    fd, temp_path = tempfile.mkstemp(dir=settings.DUMP_FILE_DIR, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+        os.replace(temp_path, path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(temp_path)
+        raise
+
+
+class DumpFileWriter:
+    """Writes the dump for `key` at `version` to disk as it's built.
+
+    `key` is a (format, DumpFilter) pair, as in dump_cache. Use it as a context
+    manager, write() the content to it chunk by chunk, and set server_timing to
+    the build's Server-Timing header value before it exits. The compressed
+    copies are made as the chunks come in (see dump.dump_compressors), so only
+    one chunk of the dump is ever in memory. On a clean exit the files are
+    renamed into place, meta is set to their metadata (as read_dump_files
+    returns it), and the older versions of the same dump are deleted. If the
+    build fails, nothing is left behind.
+    """
+
+    def __init__(self, key, version, last_modified):
+        self.key = key
+        self.version = version
+        self.last_modified = last_modified
+        self.server_timing = ""
+        self.meta = None
+        self._hash = hashlib.sha256()
+        # Content-Encoding (None for the content itself) -> (file, temp path).
+        self._files = {}
+
+    def __enter__(self):
+        os.makedirs(settings.DUMP_FILE_DIR, exist_ok=True)
+        self._compressors = dump_compressors()
+        try:
+            for coding in [None, *self._compressors]:
+                fd, temp_path = tempfile.mkstemp(
+                    dir=settings.DUMP_FILE_DIR, prefix=".tmp-"
+                )
+                self._files[coding] = (os.fdopen(fd, "wb"), temp_path)
+        except BaseException:
+            self._discard()
+            raise
+        return self
+
+    def write(self, chunk):
+        self._hash.update(chunk)
+        self._files[None][0].write(chunk)
+        for coding, (compress, _) in self._compressors.items():
+            self._files[coding][0].write(compress(chunk))
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self._discard()
+            return
+        try:
+            self._commit()
+        except BaseException:
+            self._discard()
+            raise
+
+        for old_version in list(_versions(self.key)):
+            if old_version < self.version:
+                _remove_dump_files(self.key, old_version)
+
+    def _commit(self):
+        for coding, (_, flush) in self._compressors.items():
+            self._files[coding][0].write(flush())
+        for f, _ in self._files.values():
+            f.close()
+
+        base = os.path.join(settings.DUMP_FILE_DIR, f"{_stem(self.key)}{self.version}")
+        meta = {
+            "version": self.version,
+            "last_modified": self.last_modified.isoformat(),
+            "etag": f'"{self._hash.hexdigest()}"',
+            "server_timing": self.server_timing,
+            "content": base,
+            "encodings": {coding: f"{base}.{coding}" for coding in self._compressors},
+        }
+        os.replace(self._files[None][1], base)
+        for coding, path in meta["encodings"].items():
+            os.replace(self._files[coding][1], path)
+        _write_atomically(
+            _meta_path(self.key, self.version), json.dumps(meta).encode("utf-8")
+        )
+        LOG.info(f"Wrote dump {self.key} at version {self.version} to {base}")
+        self.meta = meta
+
+    def _discard(self):
+        for f, temp_path in self._files.values():
+            f.close()
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(temp_path)
+
+
+def _remove_dump_files(key, version):
+    meta = read_dump_files(key, version)
+    if meta is None:
+        return
+    # The metadata goes first, so no other worker picks the rest up meanwhile.
+    paths = [_meta_path(key, version), meta["content"], *meta["encodings"].values()]
+    for path in paths:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(path)
@@ -0,0 +1,210 @@
+"""Pre-serialised per-entry dump fragments, so the dump isn't rebuilt whole.
+
+Most changes touch a single entry, yet rebuilding the dump re-reads and
+re-serialises every entry. Instead, the DumpFragment table keeps each entry's
+JSON exactly as the dump emits it, tagged with the Entry.dump_version it was
+built at. The signal receivers (see signals.py) stamp an entry with a new
+dump_version whenever it or anything dumped with it changes, which makes its
+fragment stale, and once the change commits the fragments of the entries it
+stamped are refreshed (see schedule_refresh). A full JSON dump is then one
+ordered scan of the fragments, joined together.
+
+Anything that goes stale without a refresh, e.g. a change that rolled back
+halfway or a fragment write that failed, is refreshed the next time the dump
+is assembled, so the assembled dump is always current. rebuild_dump_fragments
+rebuilds every fragment, in parallel.
+
+Fragments hold whole entries, so filtered dumps (see dump.DumpFilter) are still
+built from scratch.
+"""
+
+import logging
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, Q
+
+from . import models
+from .dump import (
+    ENTRY_ORDERING,
+    NO_FILTER,
+    iter_data_chunks,
+    iter_dump_json,
+    iter_dump_models,
+)
+from .dump_profile import profiling
+
+LOG = logging.getLogger(__name__)
+
+# How many entries refresh_fragments builds and writes at a time.
+REFRESH_BATCH_SIZE = 500
+
+
+def stale_entries():
+    """Return the entries whose fragment is missing or older than the entry."""
+    return models.Entry.objects.filter(
+        Q(dumpfragment__isnull=True) | ~Q(dumpfragment__dump_version=F("dump_version"))
+    )
+
+
+def refresh_fragments(entries, profile=None, batch_size=REFRESH_BATCH_SIZE):
+    """Rebuild the fragments of `entries` (an Entry queryset).
+
+    Returns how many fragments were written. `profile` is as for
+    dump.build_dump_models.
+    """
+    with profiling(profile, "refresh_fragments") as profile:
+        entry_ids = list(entries.order_by("id").values_list("id", flat=True))
+        written = 0
+        for start in range(0, len(entry_ids), batch_size):
+            written += _refresh_batch(entry_ids[start : start + batch_size], profile)
+        return written
+
+
+def _refresh_batch(entry_ids, profile):
+    # Read the versions (and words, which the dump keys entries by) before
+    # building: if an entry changes mid-build, its fragment is recorded at the
+    # older version, and so is just stale again. Entries deleted since the IDs
+    # were read are left out.
+    rows = list(
+        models.Entry.objects.filter(id__in=entry_ids).values_list(
+            "id", "word_in_english", "dump_version"
+        )
+    )
+    encoder = DjangoJSONEncoder()
+    content_by_word = {
+        entry["word_in_english"]: encoder.encode(entry)
+        for entry in iter_dump_models(
+            entries=models.Entry.objects.filter(id__in=entry_ids), profile=profile
+        )
+    }
+    with profile.stage("write") as stage:
+        # Entries that aren't in the dump get a null fragment.
+        fragments = [
+            models.DumpFragment(
+                entry_id=entry_id,
+                dump_version=version,
+                content=content_by_word.get(word),
+            )
+            for entry_id, word, version in rows
+        ]
+        try:
+            with transaction.atomic():
+                models.DumpFragment.objects.bulk_create(
+                    fragments,
+                    update_conflicts=True,
+                    unique_fields=["entry"],
+                    update_fields=["dump_version", "content"],
+                )
+        except IntegrityError as e:
+            # An entry was deleted mid-write. The rest stay stale until the next
+            # refresh, which won't see the deleted one.
+            LOG.warning(f"Failed to write {len(fragments)} dump fragments: {e}")
+            return 0
+        stage.rows += len(fragments)
+    return len(fragments)
+
+
+def refresh_stale_fragments(profile=None):
+    """Refresh every stale fragment, returning how many were refreshed."""
+    count = refresh_fragments(stale_entries(), profile=profile)
+    if count:
+        LOG.info(f"Refreshed {count} stale dump fragments")
+    return count
+
+
+class _PendingRefresh:
+    """The entries a connection's transactions stamped, to refresh on commit."""
+
+    def __init__(self):
+        self.entry_ids = set()
+
+    def refresh(self):
+        entry_ids, self.entry_ids = self.entry_ids, set()
+        if entry_ids:
+            refresh_fragments(models.Entry.objects.filter(id__in=entry_ids))
+
+
+def schedule_refresh(entry_ids):
+    """Refresh the fragments of `entry_ids` once the current transaction commits.
+
+    Called by signals.mark_dump_changed with the entries it stamped. A
+    transaction that changes many things refreshes all of their entries at once,
+    and one that rolls back doesn't refresh at all.
+    """
+    if not settings.DUMP_FRAGMENTS:
+        return
+    # One admin save changes an entry and its sub-entries, videos and so on,
+    # each of which calls this, so their entries are collected on the connection
+    # (which is per thread) and refreshed together.
+    pending = getattr(connection, "pending_fragment_refresh", None)
+    if pending is None:
+        pending = connection.pending_fragment_refresh = _PendingRefresh()
+    pending.entry_ids.update(entry_ids)
+    # Registered every time, though the first hook to run refreshes them all and
+    # leaves the rest nothing to do: a hook registered in a savepoint that rolls
+    # back is dropped, and a later change in the same transaction still needs
+    # one. Entries left behind by a rollback are refreshed with the next commit.
+    # robust, so a failed refresh doesn't fail the change: the fragments are
+    # refreshed when the dump is next assembled anyway. A failure is logged by
+    # the hook's __qualname__, which the bound method has.
+    transaction.on_commit(pending.refresh, robust=True)
+
+
+def iter_dump_json_from_fragments(profile=None, dump_filter=NO_FILTER):
+    """Stream the JSON dump assembled from the fragments.
+
+    Yields exactly the bytes iter_dump_json does. Stale fragments are refreshed
+    first. Falls back to iter_dump_json if settings.DUMP_FRAGMENTS is off or
+    `dump_filter` filters anything. `profile` and `dump_filter` are as for
+    dump.build_dump_models.
+    """
+    if not settings.DUMP_FRAGMENTS or dump_filter != NO_FILTER:
+        yield from iter_dump_json(profile=profile, dump_filter=dump_filter)
+        return
+
+    LOG.info("Assembling data dump from fragments")
+
+    with profiling(profile, "iter_dump_json_from_fragments") as profile:
+        with profile.stage("refresh") as stage:
+            stage.rows = refresh_stale_fragments()
+
+        fragments_stage = profile.stage("fragments")
+
+        def pieces():
+            rows = (
+                models.DumpFragment.objects.filter(content__isnull=False)
+                .order_by(*[f"entry__{f}" for f in ENTRY_ORDERING])
+                .values_list("content", flat=True)
+                .iterator()
+            )
+            while True:
+                with fragments_stage:
+                    piece = next(rows, None)
+                    if piece is None:
+                        return
+                    fragments_stage.rows += 1
+                yield piece
+
+        count = yield from iter_data_chunks(pieces())
+
+    LOG.info(f"Assembled data dump from {count} fragments")
+
+
+def fragment_content(entry_id):
+    """Return the entry's fragment, refreshing it first if it's stale.
+
+    That's the entry serialised exactly as in the JSON dump, or None if there's
+    no such entry or it isn't in the dump.
+    """
+    fragments = models.DumpFragment.objects.filter(entry_id=entry_id)
+    row = (
+        fragments.filter(dump_version=F("entry__dump_version"))
+        .values_list("content")
+        .first()
+    )
+    if row is None:
+        refresh_fragments(models.Entry.objects.filter(pk=entry_id))
+        row = fragments.values_list("content").first()
+    return row[0] if row is not None else None
@@ -0,0 +1,146 @@
+"""Compact binary serialisation of the dump: MessagePack with interned strings.
+
+In the JSON dump the same field names, enum values (AS_A_NOUN, EN, ALL, ...)
+and category names repeat thousands of times. This format writes each of those
+once and refers back to it by index after that.
+
+The dump is a stream of MessagePack objects, not one big object, so it can be
+written and read an entry at a time. The first object is a header map,
+{"format": FORMAT, "version": VERSION}. Every object after that is one entry,
+shaped exactly as in the JSON dump, except that interned strings are written
+as MessagePack extension types:
+
+  * EXT_DEFINE: the first occurrence of an interned string. The data is the
+    UTF-8 string, and it's assigned the next index in the string table
+    (0, 1, 2, ...).
+  * EXT_REF: a later occurrence. The data is its index in the string table as
+    a big-endian unsigned integer of 1, 2 or 4 bytes.
+
+Every map key is interned, as is every string value except free text
+(headwords, definitions, video filenames, ...), which is written inline.
+Decoders must process extension types in stream order, which is the order
+MessagePack decoders see them in anyway. decode_msgpack_dump is the reference
+decoder.
+"""
+
+import logging
+
+import msgpack
+
+from .dump import NO_FILTER, STREAM_CHUNK_SIZE, iter_dump_models
+from .dump_profile import profiling
+
+LOG = logging.getLogger(__name__)
+
+FORMAT = "slsl-dump-msgpack"
+VERSION = 1
+
+EXT_DEFINE = 1
+EXT_REF = 2
+
+# Values of these keys are (nearly) unique per entry, so interning them would
+# only grow the string table. The same goes for the strings in "videos", which
+# are filenames.
+FREE_TEXT_KEYS = {
+    "word_in_english",
+    "word_in_sinhala",
+    "word_in_tamil",
+    "related_words",
+    "definition",
+    "videos",
+    "video",
+    "note",
+}
+
+
+class _Interner:
+    def __init__(self):
+        self._indexes = {}
+
+    def __call__(self, string):
+        index = self._indexes.get(string)
+        if index is None:
+            self._indexes[string] = len(self._indexes)
+            return msgpack.ExtType(EXT_DEFINE, string.encode("utf-8"))
+        size = 1 if index < 1 << 8 else 2 if index < 1 << 16 else 4
+        return msgpack.ExtType(EXT_REF, index.to_bytes(size, "big"))
+
+
+def _intern(value, intern, free_text=False):
+    # Keys are interned before their values, the same order MessagePack writes
+    # them in, so definitions always come before their references.
+    if isinstance(value, dict):
+        return {
+            intern(k): _intern(v, intern, free_text=k in FREE_TEXT_KEYS)
+            for k, v in value.items()
+        }
+    if isinstance(value, list):
+        return [_intern(v, intern, free_text=free_text) for v in value]
+    if isinstance(value, str) and not free_text:
+        return intern(value)
+    return value
+
+
+def iter_dump_msgpack(profile=None, dump_filter=NO_FILTER):
+    """Stream the dump in the interned MessagePack format, entry by entry.
+
+    `profile` and `dump_filter` are as for dump.build_dump_models.
+    """
+    LOG.info("Streaming MessagePack data dump")
+
+    with profiling(profile, "iter_dump_msgpack") as profile:
+        packer = msgpack.Packer(use_bin_type=True)
+        intern = _Interner()
+        count = 0
+        buffer = [packer.pack({"format": FORMAT, "version": VERSION})]
+        size = 0
+        for entry in iter_dump_models(profile=profile, dump_filter=dump_filter):
+            # Looked up per entry so it's listed after the build's own stages.
+            with profile.stage("serialise") as serialise_stage:
+                piece = packer.pack(_intern(entry, intern))
+                serialise_stage.rows += 1
+            buffer.append(piece)
+            size += len(piece)
+            count += 1
+            if size >= STREAM_CHUNK_SIZE:
+                yield b"".join(buffer)
+                buffer = []
+                size = 0
+        yield b"".join(buffer)
+
+    LOG.info(f"Streamed MessagePack data dump containing {count} entries")
+
+
+def iter_decode_msgpack_dump(stream):
+    """Decode an interned MessagePack dump from a file-like object or bytes.
+
+    Yields the entries, exactly as they appear in the JSON dump.
+    """
+    strings = []
+
+    def ext_hook(code, data):
+        if code == EXT_DEFINE:
+            string = data.decode("utf-8")
+            strings.append(string)
+            return string
+        if code == EXT_REF:
+            return strings[int.from_bytes(data, "big")]
+        return msgpack.ExtType(code, data)
+
+    unpacker = msgpack.Unpacker(
+        None if isinstance(stream, bytes) else stream, ext_hook=ext_hook, raw=False
+    )
+    if isinstance(stream, bytes):
+        unpacker.feed(stream)
+
+    header = next(unpacker, None)
+    if not isinstance(header, dict) or header.get("format") != FORMAT:
+        raise ValueError("Not an interned MessagePack dump")
+    if header.get("version") != VERSION:
+        raise ValueError(f"Unsupported dump format version {header.get('version')}")
+    yield from unpacker
+
+
+def decode_msgpack_dump(data):
+    """Decode an interned MessagePack dump into the same dict as the JSON dump."""
+    return {"data": list(iter_decode_msgpack_dump(data))}
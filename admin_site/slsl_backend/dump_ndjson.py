@@ -0,0 +1,87 @@
+"""Newline-delimited JSON serialisation of the dump.
+
+Parsing the JSON dump means decoding the whole body at once, so nothing can be
+used until it's all parsed, and the whole thing is in memory while it is. In
+this format every line is a JSON value, so a reader can decode and use the
+dump one entry at a time, in constant memory.
+
+The first line is a header, {"format": FORMAT, "version": VERSION}. Every line
+after that is one entry, serialised exactly as in the JSON dump (the same
+encoder and separators), so `{"data": [<lines joined with ", ">]}` is the JSON
+dump. Lines end with "\\n", and none contain one otherwise, since JSON escapes
+newlines in strings. iter_decode_ndjson_dump is the reference reader.
+"""
+
+import json
+import logging
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .dump import NO_FILTER, STREAM_CHUNK_SIZE, iter_dump_models
+from .dump_profile import profiling
+
+LOG = logging.getLogger(__name__)
+
+FORMAT = "slsl-dump-ndjson"
+VERSION = 1
+
+
+def _iter_lines(entries, profile):
+    encoder = DjangoJSONEncoder()
+    yield encoder.encode({"format": FORMAT, "version": VERSION}) + "\n"
+    for entry in entries:
+        # Looked up per entry so it's listed after the build's own stages.
+        with profile.stage("serialise") as serialise_stage:
+            line = encoder.encode(entry) + "\n"
+            serialise_stage.rows += 1
+        yield line
+
+
+def iter_dump_ndjson(profile=None, dump_filter=NO_FILTER):
+    """Stream the dump as NDJSON, entry by entry.
+
+    `profile` and `dump_filter` are as for dump.build_dump_models.
+    """
+    LOG.info("Streaming NDJSON data dump")
+
+    with profiling(profile, "iter_dump_ndjson") as profile:
+        entries = iter_dump_models(profile=profile, dump_filter=dump_filter)
+        count = -1
+        buffer = []
+        size = 0
+        for line in _iter_lines(entries, profile):
+            buffer.append(line)
+            size += len(line)
+            count += 1
+            if size >= STREAM_CHUNK_SIZE:
+                yield "".join(buffer).encode("utf-8")
+                buffer = []
+                size = 0
+        yield "".join(buffer).encode("utf-8")
+
+    LOG.info(f"Streamed NDJSON data dump containing {count} entries")
+
+
+def serialise_ndjson_dump(entries):
+    """Serialise a list of dump entries as NDJSON UTF-8 bytes, all at once."""
+    encoder = DjangoJSONEncoder()
+    lines = [encoder.encode({"format": FORMAT, "version": VERSION})]
+    lines.extend(encoder.encode(entry) for entry in entries)
+    return "".join(f"{line}\n" for line in lines).encode("utf-8")
+
+
+def iter_decode_ndjson_dump(lines):
+    """Decode an NDJSON dump from an iterable of lines, e.g. a file or response.
+
+    Lines can be bytes or str. Yields the entries, exactly as they appear in the
+    JSON dump, decoding one line at a time.
+    """
+    lines = iter(lines)
+    header = json.loads(next(lines, "null"))
+    if not isinstance(header, dict) or header.get("format") != FORMAT:
+        raise ValueError("Not an NDJSON dump")
+    if header.get("version") != VERSION:
+        raise ValueError(f"Unsupported dump format version {header.get('version')}")
+    for line in lines:
+        if line.strip():
+            yield json.loads(line)
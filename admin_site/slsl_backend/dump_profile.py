@@ -0,0 +1,165 @@
+"""Per-stage instrumentation of dump builds.
+
+A DumpProfile splits a build into named stages (the entries query, categories,
+sub-entries, ...) and records, for each, the wall time, how many queries it ran,
+how many rows it handled and, if settings.DUMP_TRACE_MEMORY is on, the peak
+memory it allocated (tracemalloc, which slows the build down several times, so
+it's off by default). A stage can be entered many times, e.g. once per entry by
+the streaming builder, and its numbers add up.
+
+When the profile finishes it logs one line per stage, with the numbers both in
+the message and as structured fields (the `dump_stage` extra) for log
+processors. If settings.DUMP_TIMING_HEADER is on, /dump also returns them in a
+Server-Timing header (see views.py).
+"""
+
+import contextlib
+import dataclasses
+import logging
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.db import connection
+
+LOG = logging.getLogger(__name__)
+
+
+@dataclasses.dataclass
+class StageStats:
+    seconds: float = 0.0
+    queries: int = 0
+    # None for the build's total, where rows of different tables don't add up.
+    rows: int | None = 0
+    # Peak bytes allocated above what was allocated when the stage started, or
+    # None when memory isn't traced.
+    peak_memory: int | None = None
+
+    def as_fields(self):
+        fields = {
+            "wall_ms": round(self.seconds * 1000, 1),
+            "queries": self.queries,
+        }
+        if self.rows is not None:
+            fields["rows"] = self.rows
+        if self.peak_memory is not None:
+            fields["peak_kb"] = round(self.peak_memory / 1024)
+        return fields
+
+
+class _Stage:
+    def __init__(self, profile, stats):
+        self._profile = profile
+        self.stats = stats
+
+    @property
+    def rows(self):
+        return self.stats.rows
+
+    @rows.setter
+    def rows(self, rows):
+        self.stats.rows = rows
+
+    def __enter__(self):
+        self._profile._current = self.stats
+        if self._profile._trace_memory:
+            tracemalloc.reset_peak()
+            self._memory_start = tracemalloc.get_traced_memory()[0]
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stats.seconds += time.perf_counter() - self._start
+        if self._profile._trace_memory:
+            peak = tracemalloc.get_traced_memory()[1] - self._memory_start
+            self.stats.peak_memory = max(self.stats.peak_memory or 0, peak)
+        self._profile._current = None
+
+
+class DumpProfile:
+    """Records per-stage stats of one dump build, and logs them when it ends.
+
+    Use it as a context manager around the build, and wrap each stage of the
+    build in `with profile.stage(name) as stage:`, adding to `stage.rows`.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.stages = {}
+        self.total = StageStats(rows=None)
+        self._current = None
+        self._trace_memory = False
+
+    def stage(self, name):
+        """Return the named stage, to be used as a context manager.
+
+        Entering the same stage again adds to its stats, and the returned object
+        can be kept and re-entered, which is cheap enough to do per entry.
+        """
+        stats = self.stages.get(name)
+        if stats is None:
+            stats = self.stages[name] = StageStats()
+        return _Stage(self, stats)
+
+    def _count_query(self, execute, sql, params, many, context):
+        self.total.queries += 1
+        if self._current is not None:
+            self._current.queries += 1
+        return execute(sql, params, many, context)
+
+    def __enter__(self):
+        # Not connection.execute_wrapper(), since that unwinds its wrappers
+        # last-in-first-out, and streamed builds on the same connection (under
+        # ASGI) can finish in any order.
+        connection.execute_wrappers.append(self._count_query)
+        # Only if nothing else is tracing already (e.g. benchmark_dump), since
+        # each stage resets the peak.
+        self._trace_memory = settings.DUMP_TRACE_MEMORY and not tracemalloc.is_tracing()
+        if self._trace_memory:
+            tracemalloc.start()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.total.seconds = time.perf_counter() - self._start
+        if self._trace_memory:
+            self.total.peak_memory = max(
+                (s.peak_memory or 0 for s in self.stages.values()), default=0
+            )
+            tracemalloc.stop()
+        connection.execute_wrappers.remove(self._count_query)
+        if exc_info[0] is None:
+            self.log()
+
+    def log(self):
+        for name, stats in [*self.stages.items(), ("total", self.total)]:
+            fields = stats.as_fields()
+            LOG.info(
+                f"{self.name} stage {name}: "
+                + " ".join(f"{key}={value}" for key, value in fields.items()),
+                extra={"dump_stage": {"build": self.name, "stage": name, **fields}},
+            )
+
+    def server_timing(self):
+        """Return the stats as a Server-Timing header value."""
+        metrics = []
+        for name, stats in [*self.stages.items(), ("total", self.total)]:
+            fields = stats.as_fields()
+            wall_ms = fields.pop("wall_ms")
+            description = " ".join(f"{key}={value}" for key, value in fields.items())
+            metrics.append(f'{name};dur={wall_ms};desc="{description}"')
+        return ", ".join(metrics)
+
+
+@contextlib.contextmanager
+def profiling(profile, name):
+    """Yield `profile`, or if it's None a new DumpProfile run for the duration.
+
+    Lets builders record stages into their caller's profile when there is one,
+    and still log their own otherwise.
+    """
+    if profile is not None:
+        yield profile
+        return
+    with DumpProfile(name) as profile:
+        yield profile
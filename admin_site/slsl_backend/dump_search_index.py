@@ -0,0 +1,119 @@
+"""A precomputed search index over the dump, published next to it.
+
+Without it, every client re-keys and tokenises the whole dump at startup to be
+able to search it. This index does that work once, when the dump is published
+(see publish_dump), so clients can load it instead.
+
+The index is JSON:
+
+    {
+        "format": FORMAT,
+        "version": VERSION,
+        "dump_sha256": <hex sha256 of the dump.json bytes it indexes>,
+        "entries": <how many entries that dump has>,
+        "tokens": [<token>, ...],
+        "postings": [[<entry index>, ...], ...],
+    }
+
+`tokens` is sorted by code point, so every token starting with a given prefix
+is one contiguous run, found by binary search. `postings[i]` lists, in
+ascending order, the indexes in the dump's "data" array of the entries that
+`tokens[i]` occurs in. A client must only use an index whose dump_sha256
+matches the dump it has (or, failing a hash, whose entry count does), and
+otherwise fall back to building its own.
+
+The tokens of an entry come from its English, Sinhala and Tamil words and the
+related words of its sub-entries (split on commas, as the app does). Each of
+those is normalised (see normalise): the whole normalised phrase is a token,
+and so is each word in it, so both "thank you" and "you" find "Thank you".
+Clients must normalise queries the same way before looking them up.
+lookup_prefix is the reference lookup.
+"""
+
+import bisect
+import json
+import unicodedata
+
+FORMAT = "slsl-search-index"
+VERSION = 1
+
+HEADWORD_FIELDS = ["word_in_english", "word_in_sinhala", "word_in_tamil"]
+
+
+def _is_separator(char):
+    # Punctuation, symbols, whitespace and control characters separate words.
+    # Combining vowel signs (Mn/Mc) and the zero width joiners Sinhala uses in
+    # conjuncts (Cf) are part of a word, so this can't just be str.isalnum.
+    category = unicodedata.category(char)
+    return category[0] in "PSZ" or category == "Cc"
+
+
+def normalise(text):
+    """Normalise `text` for the index: NFKC, case folded, one space between words.
+
+    Returns the normalised words, which are empty if `text` has none.
+    """
+    text = unicodedata.normalize("NFKC", text).casefold()
+    return "".join(" " if _is_separator(c) else c for c in text).split()
+
+
+def _entry_phrases(entry):
+    for field in HEADWORD_FIELDS:
+        if entry.get(field):
+            yield entry[field]
+    for sub_entry in entry.get("sub_entries", []):
+        for related_word in (sub_entry.get("related_words") or "").split(","):
+            yield related_word
+
+
+def build_search_index(entries, dump_sha256):
+    """Build the search index of `entries`, the dump's "data" array, as a dict.
+
+    `dump_sha256` is the hash of the serialised dump, recorded so clients can
+    tell which dump the index belongs to.
+    """
+    postings = {}
+    for index, entry in enumerate(entries):
+        for phrase in _entry_phrases(entry):
+            words = normalise(phrase)
+            if not words:
+                continue
+            for token in {" ".join(words), *words}:
+                token_postings = postings.setdefault(token, [])
+                # Entries are visited in order, so this keeps postings sorted.
+                if not token_postings or token_postings[-1] != index:
+                    token_postings.append(index)
+
+    tokens = sorted(postings)
+    return {
+        "format": FORMAT,
+        "version": VERSION,
+        "dump_sha256": dump_sha256,
+        "entries": len(entries),
+        "tokens": tokens,
+        "postings": [postings[token] for token in tokens],
+    }
+
+
+def serialise_search_index(index):
+    """Serialise the search index as compact UTF-8 JSON bytes."""
+    return json.dumps(index, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def lookup_prefix(index, query):
+    """Return the indexes of the entries with a token starting with `query`.
+
+    The reference lookup for clients: `query` is normalised the same way as the
+    tokens, then every token it's a prefix of is found by binary search.
+    """
+    prefix = " ".join(normalise(query))
+    if not prefix:
+        return []
+    tokens = index["tokens"]
+    start = bisect.bisect_left(tokens, prefix)
+    found = set()
+    for i in range(start, len(tokens)):
+        if not tokens[i].startswith(prefix):
+            break
+        found.update(index["postings"][i])
+    return sorted(found)
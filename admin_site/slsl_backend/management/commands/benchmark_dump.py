@@ -0,0 +1,425 @@
+"""Benchmark building and serving the dump against synthetic data.
+
+For each requested size this seeds that many synthetic entries, with a fan-out
+of sub-entries, videos, definitions and categories roughly like the real data.
+It then measures:
+
+  * build_dump_models
+  * build_dump
+  * the /dump view, with the dump cache and fragments cold (so it rebuilds from
+    scratch) and warm
+
+For each it records wall time (over --repeat runs), the peak Python memory
+allocated (tracemalloc, so memory held by the DB driver isn't counted) and the
+number of queries. Results are written as JSON, along with the git commit and
+the dump settings they were taken with, so runs on two commits can be compared
+with --compare.
+
+Everything happens in a throwaway test database (the same one the Django test
+runner would create), so the configured DB is never touched. For SQLite that is
+an in-memory DB.
+
+    uv run python manage.py benchmark_dump --sizes 1000 10000 --output before.json
+    # ... change something ...
+    uv run python manage.py benchmark_dump --sizes 1000 10000 --compare before.json
+"""
+
+import gc
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import override_settings
+
+from slsl_backend import models
+from slsl_backend.dump import build_dump, build_dump_models
+from slsl_backend.dump_cache import clear_cached_dumps
+from slsl_backend.secrets import secrets
+
+# Bump this if the shape of the results changes.
+RESULTS_VERSION = 1
+
+NUM_CATEGORIES = 40
+
+# Relative weights of how many children each parent gets, roughly following the
+# real data: most entries have one sub-entry with one video.
+SUB_ENTRIES_PER_ENTRY = {1: 70, 2: 25, 3: 5}
+VIDEOS_PER_SUB_ENTRY = {0: 5, 1: 60, 2: 25, 3: 10}
+DEFINITIONS_PER_SUB_ENTRY = {0: 20, 1: 40, 2: 30, 3: 10}
+CATEGORIES_PER_ENTRY = {0: 30, 1: 55, 2: 15}
+
+WORDS = (
+    "sign hand move palm finger face shoulder chest forward twice small large "
+    "house water food school family friend work morning evening happy sad"
+).split()
+
+BATCH_SIZE = 2000
+
+# Metrics that --compare reports, with the unit they're in.
+METRICS = {
+    "wall_time_min": "s",
+    "wall_time_median": "s",
+    "peak_memory": "bytes",
+    "queries": "",
+}
+
+
+class Command(BaseCommand):
+    help = "Benchmark building and serving the dump against synthetic data."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes",
+            type=int,
+            nargs="+",
+            default=[1000, 10000],
+            help="How many entries to seed, one benchmark per size (default: "
+            "1000 10000). 100000 takes a while.",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=3,
+            help="How many timed runs of each target (default: 3).",
+        )
+        parser.add_argument(
+            "--seed",
+            type=int,
+            default=0,
+            help="Random seed for the synthetic data (default: 0).",
+        )
+        parser.add_argument(
+            "--output",
+            help="Write the results JSON here rather than to stdout.",
+        )
+        parser.add_argument(
+            "--compare",
+            help="A results JSON from an earlier run to compare these results to.",
+        )
+
+    def handle(self, *args, **options):
+        old_name = connection.settings_dict["NAME"]
+        # Dumps the view keeps on disk (see dump_files.py) go somewhere of
+        # their own, so the cold runs can clear them.
+        dump_file_dir = tempfile.mkdtemp() if settings.DUMP_FILE_DIR else ""
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            with override_settings(DUMP_FILE_DIR=dump_file_dir):
+                results = [
+                    self.benchmark(size, options["repeat"], options["seed"])
+                    for size in options["sizes"]
+                ]
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            if dump_file_dir:
+                shutil.rmtree(dump_file_dir)
+
+        out = {
+            "version": RESULTS_VERSION,
+            "environment": _environment(),
+            "repeat": options["repeat"],
+            "seed": options["seed"],
+            "results": results,
+        }
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(out, f, indent=2)
+            self.stderr.write(f"Wrote results to {options['output']}")
+        else:
+            self.stdout.write(json.dumps(out, indent=2))
+
+        if options["compare"]:
+            with open(options["compare"]) as f:
+                self.compare(json.load(f), out)
+
+    def benchmark(self, size, repeat, seed):
+        # Progress goes to stderr, so stdout can be redirected to a file.
+        # The seeded data is committed, since the parallel engine reads it on
+        # other connections (and stays on this one inside a transaction), and
+        # is cleared afterwards, so each size starts empty.
+        self.stderr.write(f"Seeding {size} entries")
+        start = time.perf_counter()
+        with transaction.atomic():
+            counts = seed_data(size, random.Random(seed))
+        self.stderr.write(f"Seeded in {time.perf_counter() - start:.1f}s")
+
+        try:
+            client = Client()
+            headers = {}
+            if secrets.get("dump_auth_token"):
+                headers["Authorization"] = f"Bearer {secrets['dump_auth_token']}"
+
+            def get_dump():
+                response = client.get("/dump", headers=headers, secure=True)
+                assert response.status_code == 200, response.status_code
+                # Streamed responses only do their work as they're consumed.
+                if response.streaming:
+                    return b"".join(response.streaming_content)
+                return response.content
+
+            def get_dump_cold():
+                clear_cached_dumps()
+                # Or the rebuild only joins up the entries' fragments (see
+                # dump_fragments.py), rather than building them from scratch.
+                models.DumpFragment.objects.all().delete()
+                if settings.DUMP_FILE_DIR:
+                    for name in os.listdir(settings.DUMP_FILE_DIR):
+                        os.remove(os.path.join(settings.DUMP_FILE_DIR, name))
+                return get_dump()
+
+            targets = {
+                "build_dump_models": build_dump_models,
+                "build_dump": build_dump,
+                "dump_view_cold": get_dump_cold,
+                "dump_view_warm": get_dump,
+            }
+            measurements = {}
+            for name, target in targets.items():
+                self.stderr.write(f"Measuring {name} at {size} entries")
+                measurements[name] = measure(target, repeat)
+            measurements["dump_view_cold"]["bytes"] = len(get_dump_cold())
+        finally:
+            clear_seed_data()
+
+        return {"size": size, "rows": counts, "targets": measurements}
+
+    def compare(self, before, after):
+        if before.get("version") != RESULTS_VERSION:
+            self.stderr.write(
+                f"Can't compare to results version {before.get('version')}, "
+                f"expected {RESULTS_VERSION}"
+            )
+            return
+        self.stderr.write(
+            f"Compared to {before['environment'].get('commit')} (before -> after):"
+        )
+        before_by_size = {r["size"]: r for r in before["results"]}
+        for result in after["results"]:
+            before_result = before_by_size.get(result["size"])
+            if before_result is None:
+                continue
+            for name, measurement in result["targets"].items():
+                before_measurement = before_result["targets"].get(name)
+                if before_measurement is None:
+                    continue
+                for metric, unit in METRICS.items():
+                    old = before_measurement[metric]
+                    new = measurement[metric]
+                    change = f"{(new - old) / old:+.1%}" if old else "n/a"
+                    self.stderr.write(
+                        f"  {result['size']:>7} {name:<18} {metric:<17} "
+                        f"{_format(old, unit):>12} -> {_format(new, unit):>12} "
+                        f"({change})"
+                    )
+
+
+def measure(target, repeat):
+    """Measure wall time, peak Python memory and query count of target().
+
+    Each is measured in separate runs, so neither tracemalloc nor recording the
+    queries slows down the timed runs.
+    """
+    target()  # Warm up, e.g. imports and DB connection setup.
+
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        target()
+        times.append(time.perf_counter() - start)
+
+    # Counted with an execute wrapper rather than CaptureQueriesContext, since
+    # the view's request_started signal resets connection.queries.
+    queries = _QueryCounter()
+    with connection.execute_wrapper(queries):
+        target()
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        target()
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "wall_times": times,
+        "wall_time_min": min(times),
+        "wall_time_median": statistics.median(times),
+        "peak_memory": peak_memory,
+        "queries": queries.count,
+    }
+
+
+class _QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def _weighted(rng, weights):
+    return rng.choices(list(weights), weights=list(weights.values()))[0]
+
+
+def _text(rng, min_words, max_words):
+    return " ".join(rng.choices(WORDS, k=rng.randint(min_words, max_words)))
+
+
+def seed_data(size, rng):
+    """Create `size` synthetic entries and their children, without signals.
+
+    Returns how many rows of each model were created.
+    """
+    categories = models.Category.objects.bulk_create(
+        models.Category(name=f"Benchmark category {i}") for i in range(NUM_CATEGORIES)
+    )
+
+    entries = models.Entry.objects.bulk_create(
+        (
+            models.Entry(
+                word_in_english=f"{_text(rng, 1, 2)} {i}",
+                word_in_sinhala=f"සිංහල {i}" if rng.random() < 0.8 else None,
+                word_in_tamil=f"தமிழ் {i}" if rng.random() < 0.6 else None,
+                entry_type=rng.choice(models.EntryType.values),
+            )
+            for i in range(size)
+        ),
+        batch_size=BATCH_SIZE,
+    )
+
+    entry_categories = []
+    sub_entries = []
+    for entry in entries:
+        for category in rng.sample(categories, _weighted(rng, CATEGORIES_PER_ENTRY)):
+            entry_categories.append(
+                models.Entry.categories.through(entry=entry, category=category)
+            )
+        for order in range(_weighted(rng, SUB_ENTRIES_PER_ENTRY)):
+            sub_entries.append(
+                models.SubEntry(
+                    entry=entry,
+                    order=order,
+                    region=rng.choice(models.Region.values),
+                    related_words=(
+                        ", ".join(rng.sample(WORDS, 3)) if rng.random() < 0.3 else None
+                    ),
+                )
+            )
+    models.Entry.categories.through.objects.bulk_create(
+        entry_categories, batch_size=BATCH_SIZE
+    )
+    sub_entries = models.SubEntry.objects.bulk_create(
+        sub_entries, batch_size=BATCH_SIZE
+    )
+
+    videos = []
+    definitions = []
+    for sub_entry in sub_entries:
+        for order in range(_weighted(rng, VIDEOS_PER_SUB_ENTRY)):
+            historical = rng.random() < 0.1
+            videos.append(
+                models.Video(
+                    sub_entry=sub_entry,
+                    order=order,
+                    media=f"benchmark/{sub_entry.entry_id}_{sub_entry.id}_{order}.mp4",
+                    status=(
+                        models.VideoStatus.HISTORICAL
+                        if historical
+                        else models.VideoStatus.CURRENT
+                    ),
+                    recorded=str(rng.randint(2005, 2024)) if historical else "",
+                    source="Benchmark archive" if historical else "",
+                )
+            )
+        for _ in range(_weighted(rng, DEFINITIONS_PER_SUB_ENTRY)):
+            definitions.append(
+                models.Definition(
+                    sub_entry=sub_entry,
+                    language=rng.choice(models.Language.values),
+                    category=rng.choice(models.DefinitionCategory.values),
+                    definition=_text(rng, 5, 40),
+                )
+            )
+    models.Video.objects.bulk_create(videos, batch_size=BATCH_SIZE)
+    models.Definition.objects.bulk_create(definitions, batch_size=BATCH_SIZE)
+
+    return {
+        "entries": len(entries),
+        "categories": len(categories),
+        "entry_categories": len(entry_categories),
+        "sub_entries": len(sub_entries),
+        "videos": len(videos),
+        "definitions": len(definitions),
+    }
+
+
+def clear_seed_data():
+    """Delete everything seed_data, and building and serving the dump, created.
+
+    The tables are flushed, rather than their rows deleted one by one with
+    signals, which would take longer than the benchmark.
+    """
+    tables = [
+        model._meta.db_table
+        for model in [
+            models.Entry,
+            models.Entry.categories.through,
+            models.Category,
+            models.SubEntry,
+            models.Video,
+            models.Definition,
+            models.DumpFragment,
+            models.DeletedEntry,
+            models.ContentChange,
+        ]
+    ]
+    connection.ops.execute_sql_flush(
+        connection.ops.sql_flush(no_style(), tables, allow_cascade=True)
+    )
+    clear_cached_dumps()
+
+
+def _environment():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": sys.version.split()[0],
+        "django": django.get_version(),
+        "platform": platform.platform(),
+        "db_vendor": connection.vendor,
+        "dump_engine": settings.DUMP_ENGINE,
+        "stream_dump": settings.STREAM_DUMP,
+        "cache_dump": settings.CACHE_DUMP,
+        "dump_fragments": settings.DUMP_FRAGMENTS,
+        "dump_files": bool(settings.DUMP_FILE_DIR),
+    }
+
+
+def _format(value, unit):
+    if unit == "s":
+        return f"{value * 1000:.1f}ms"
+    if unit == "bytes":
+        return f"{value / 1024 / 1024:.1f}MB"
+    return str(value)
@@ -27,6 +27,7 @@ import sys
 
 from django.core.files.base import File
 from django.core.management.base import BaseCommand
+from django.db import transaction
 
 from slsl_backend import models
 from slsl_backend.dump import build_dump_models
@@ -99,39 +100,43 @@ class Command(BaseCommand):
                         print(f"Existing: {existing_video_basenames}")
                         print(f"New: {new_video_basenames}")
                     continue
-                if options.get("dry_run"):
-                    print(f'Would\'ve created entry for word "{word}"')
-                else:
-                    # Create the Entry
-                    entry = models.Entry()
-                    entry.word_in_english = word
-                    entry.category = category
-                    entry.entry_type = models.EntryType.PHRASE
-                    entry.save()
-                for region, video_fnames in region_to_video_fnames.items():
-                    print(
-                        f"Working on sub-entries for word {word} (region {region}): {[os.path.basename(f) for f in video_fnames]}"
-                    )
+                # One transaction per word, so none is left half-created.
+                # Videos uploaded before a failure stay in storage (see
+                # find_unused_videos).
+                with transaction.atomic():
                     if options.get("dry_run"):
+                        print(f'Would\'ve created entry for word "{word}"')
+                    else:
+                        # Create the Entry
+                        entry = models.Entry()
+                        entry.word_in_english = word
+                        entry.category = category
+                        entry.entry_type = models.EntryType.PHRASE
+                        entry.save()
+                    for region, video_fnames in region_to_video_fnames.items():
                         print(
-                            f'Would\'ve created sub-entry for word "{word}" (region {region}) with {[os.path.basename(f) for f in video_fnames]}'
+                            f"Working on sub-entries for word {word} (region {region}): {[os.path.basename(f) for f in video_fnames]}"
                         )
-                    else:
-                        # Create the SubEntry, pointing back to the Entry.
-                        sub_entry = models.SubEntry()
-                        sub_entry.entry = entry
-                        sub_entry.region = region
-                        sub_entry.save()
-
-                        # Attach the Videos to the SubEntry.
-                        for fname in video_fnames:
-                            with open(fname, "rb") as f:
-                                content = File(f)
-                                # Create the Video and save the file content to it, which will
-                                # actually result in uploading the file.
-                                video = models.Video()
-                                video.sub_entry = sub_entry
-                                video.media.save(os.path.basename(fname), content)
+                        if options.get("dry_run"):
+                            print(
+                                f'Would\'ve created sub-entry for word "{word}" (region {region}) with {[os.path.basename(f) for f in video_fnames]}'
+                            )
+                        else:
+                            # Create the SubEntry, pointing back to the Entry.
+                            sub_entry = models.SubEntry()
+                            sub_entry.entry = entry
+                            sub_entry.region = region
+                            sub_entry.save()
+
+                            # Attach the Videos to the SubEntry.
+                            for fname in video_fnames:
+                                with open(fname, "rb") as f:
+                                    content = File(f)
+                                    # Create the Video and save the file content to it, which will
+                                    # actually result in uploading the file.
+                                    video = models.Video()
+                                    video.sub_entry = sub_entry
+                                    video.media.save(os.path.basename(fname), content)
 
                 num_processed += 1
                 if limit and num_processed >= limit:
@@ -22,6 +22,7 @@ import sys
 
 from django.core.files.base import File
 from django.core.management.base import BaseCommand
+from django.db import transaction
 
 from slsl_backend import models
 from slsl_backend.dump import build_dump_models
@@ -99,27 +100,31 @@ class Command(BaseCommand):
                         f"Would've created entry for word {word} with {[os.path.basename(f) for f in video_fnames]}"
                     )
                 else:
-                    # Create the Entry
-                    entry = models.Entry()
-                    entry.word_in_english = word
-                    if category and not category.startswith("Unknown"):
-                        entry.category = category
-                    entry.save()
-
-                    # Create the SubEntry, pointing back to the Entry.
-                    sub_entry = models.SubEntry()
-                    sub_entry.entry = entry
-                    sub_entry.save()
-
-                    # Attach the Videos to the SubEntry.
-                    for fname in video_fnames:
-                        with open(fname, "rb") as f:
-                            content = File(f)
-                            # Create the Video and save the file content to it, which will
-                            # actually result in uploading the file.
-                            video = models.Video()
-                            video.sub_entry = sub_entry
-                            video.media.save(os.path.basename(fname), content)
+                    # One transaction per word, so none is left half-created.
+                    # Videos uploaded before a failure stay in storage (see
+                    # find_unused_videos).
+                    with transaction.atomic():
+                        # Create the Entry
+                        entry = models.Entry()
+                        entry.word_in_english = word
+                        if category and not category.startswith("Unknown"):
+                            entry.category = category
+                        entry.save()
+
+                        # Create the SubEntry, pointing back to the Entry.
+                        sub_entry = models.SubEntry()
+                        sub_entry.entry = entry
+                        sub_entry.save()
+
+                        # Attach the Videos to the SubEntry.
+                        for fname in video_fnames:
+                            with open(fname, "rb") as f:
+                                content = File(f)
+                                # Create the Video and save the file content to it, which will
+                                # actually result in uploading the file.
+                                video = models.Video()
+                                video.sub_entry = sub_entry
+                                video.media.save(os.path.basename(fname), content)
 
                 num_processed += 1
                 if limit and num_processed >= limit:
@@ -0,0 +1,119 @@
+"""Check that every dump engine builds exactly the same dump.
+
+The Postgres engine (see dump._iter_dump_models_postgres) builds the dump in SQL
+rather than in Python, so it has to be kept in step with the Python code by
+hand. The parallel engine reads its rows on other connections, which all have
+to see the same snapshot.
+
+This builds the dump with each engine, both in one go (build_dump_models) and
+streamed (iter_dump_models). The streamed build is also run with an entry
+filter, as the delta dump uses, and both are run with a few DumpFilters (see
+DUMP_FILTERS). It compares the serialised bytes, and exits non-zero on any
+difference, naming the first entry that differs.
+
+Run it against a Postgres DB after changing anything that goes into the dump.
+On SQLite every engine falls back to the Python one, so there's nothing to
+compare.
+
+    uv run python manage.py check_dump_engines
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+
+from slsl_backend import models
+from slsl_backend.dump import (
+    DUMP_ENGINES,
+    DumpFilter,
+    build_dump_models,
+    iter_dump_models,
+)
+
+# DumpFilters to check the engines with, between them using every kind of
+# filter.
+DUMP_FILTERS = {
+    "current videos": DumpFilter(video_statuses=(models.VideoStatus.CURRENT,)),
+    "one region, English definitions": DumpFilter(
+        regions=(models.Region.NORTH_EAST,),
+        definition_languages=(models.Language.ENGLISH,),
+    ),
+    "no definitions or related words": DumpFilter(
+        omit=("definitions", "related_words")
+    ),
+    "renditions": DumpFilter(include=("renditions",)),
+}
+
+
+class Command(BaseCommand):
+    help = "Check that every dump engine builds exactly the same dump."
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            self.stdout.write(
+                f"The DB is {connection.vendor}, where every dump engine is the "
+                "Python one. Run this against Postgres."
+            )
+            return
+
+        # Every other entry, so the filtered build has something to leave out.
+        some_entries = models.Entry.objects.filter(
+            id__in=list(models.Entry.objects.values_list("id", flat=True)[::2])
+        )
+        builds = {
+            "build_dump_models": lambda engine: build_dump_models(engine=engine),
+            "iter_dump_models": lambda engine: list(iter_dump_models(engine=engine)),
+            "iter_dump_models (filtered)": lambda engine: list(
+                iter_dump_models(entries=some_entries, engine=engine)
+            ),
+        }
+        for filter_name, dump_filter in DUMP_FILTERS.items():
+            builds[f"build_dump_models ({filter_name})"] = (
+                lambda engine, dump_filter=dump_filter: build_dump_models(
+                    engine=engine, dump_filter=dump_filter
+                )
+            )
+            builds[f"iter_dump_models ({filter_name})"] = (
+                lambda engine, dump_filter=dump_filter: list(
+                    iter_dump_models(engine=engine, dump_filter=dump_filter)
+                )
+            )
+
+        # Compared serialised, as that's what clients get.
+        encoder = DjangoJSONEncoder()
+        failed = False
+        for build_name, build in builds.items():
+            reference_engine, *other_engines = DUMP_ENGINES
+            reference = [encoder.encode(e) for e in build(reference_engine)]
+            for engine in other_engines:
+                entries = [encoder.encode(e) for e in build(engine)]
+                difference = _first_difference(reference, entries)
+                if difference is None:
+                    self.stdout.write(
+                        f"{build_name}: {engine} matches {reference_engine} "
+                        f"({len(entries)} entries)"
+                    )
+                    continue
+                failed = True
+                self.stderr.write(
+                    f"{build_name}: {engine} differs from {reference_engine} at "
+                    f"entry {difference}:\n"
+                    f"  {reference_engine}: {_at(reference, difference)}\n"
+                    f"  {engine}: {_at(entries, difference)}"
+                )
+
+        if failed:
+            raise CommandError("The dump engines don't build the same dump")
+
+
+def _first_difference(a, b):
+    for index, (x, y) in enumerate(zip(a, b)):
+        if x != y:
+            return index
+    if len(a) != len(b):
+        return min(len(a), len(b))
+    return None
+
+
+def _at(entries, index):
+    return entries[index] if index < len(entries) else "(no entry)"
@@ -0,0 +1,33 @@
+"""Compact the change log (see changelog.py).
+
+Always drops the changes superseded by a later change to the same row, which
+no consumer needs. With --keep-days, also drops every change older than that;
+consumers that last read the log before then get a 410 from /changes and have
+to start over from the full dump, so pick something comfortably longer than
+they go between reads.
+
+    uv run python manage.py compact_change_log
+    uv run python manage.py compact_change_log --keep-days 90
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from slsl_backend.changelog import compact
+
+
+class Command(BaseCommand):
+    help = "Compact the change log."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--keep-days",
+            type=int,
+            help="Also drop changes older than this many days.",
+        )
+
+    def handle(self, *args, **options):
+        keep_days = options["keep_days"]
+        if keep_days is not None and keep_days < 0:
+            raise CommandError("--keep-days must not be negative")
+        deleted = compact(keep_days=keep_days)
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} changes"))
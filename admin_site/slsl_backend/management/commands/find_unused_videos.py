@@ -2,11 +2,12 @@
 
 Every Video row's `media` file lives under the `media/` prefix in the R2 bucket
 (django-storages' S3 backend is configured with location="media"; see
-settings.py). Re-recording a sign or deleting an entry leaves the old object in
-the bucket with nothing pointing at it. This lists those orphans, and with
---archive moves each from `media/<name>` to `archive/<name>` — out of the app's
-way (it only ever reads media/) but still in the bucket, so a mistaken archive
-is recoverable. Nothing is deleted.
+settings.py), along with its renditions in a directory named after it (see
+media_queue.rendition_dir). Re-recording a sign or deleting an entry leaves the
+old objects in the bucket with nothing pointing at them. This lists those
+orphans, and with --archive moves each from `media/<name>` to `archive/<name>` —
+out of the app's way (it only ever reads media/) but still in the bucket, so a
+mistaken archive is recoverable. Nothing is deleted.
 
 Run it from admin_site/ against prod: it needs the prod DB + R2 secrets, i.e.
 prod_secrets.json present (the same footgun as the other prod scripts — that
@@ -23,13 +24,14 @@ must never be pointed at Auslan data.
 from django.core.files.storage import default_storage
 from django.core.management.base import BaseCommand, CommandError
 
+from slsl_backend.media_queue import ARCHIVE_PREFIX, rendition_dir
 from slsl_backend.models import Video
 
-# Where archived orphans are moved to: a sibling of the media/ prefix. The app
-# only reads media/, so moving here hides them from clients while keeping them in
-# the bucket (recoverable) rather than deleting — R2 has no point-in-time
-# recovery, so we never hard-delete media here.
-ARCHIVE_PREFIX = "archive/"
+# Archived orphans are moved to ARCHIVE_PREFIX, a sibling of the media/ prefix
+# (where the process_media worker also moves the originals of the videos it
+# transcodes). The app only reads media/, so moving there hides them from
+# clients while keeping them in the bucket (recoverable) rather than deleting —
+# R2 has no point-in-time recovery, so we never hard-delete media here.
 
 
 class Command(BaseCommand):
@@ -64,6 +66,9 @@ class Command(BaseCommand):
         referenced = {
             name for name in Video.objects.values_list("media", flat=True) if name
         }
+        # Everything under a referenced video's renditions directory (the HLS
+        # segments aren't listed anywhere) is in use too.
+        rendition_dirs = tuple(rendition_dir(name) for name in referenced)
 
         # Bucket side: every object actually under the media/ prefix. Paginate
         # (there are ~5000 objects) via the storage's own boto3 client so we
@@ -83,7 +88,11 @@ class Command(BaseCommand):
                     continue
                 present[name] = key
 
-        orphans = sorted(set(present) - referenced)
+        orphans = sorted(
+            name
+            for name in set(present) - referenced
+            if not name.startswith(rendition_dirs)
+        )
         missing = sorted(referenced - set(present))
 
         self.stdout.write(
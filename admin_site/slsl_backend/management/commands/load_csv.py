@@ -3,6 +3,7 @@
 import csv
 
 from django.core.management.base import BaseCommand
+from django.db import transaction
 from django.db.utils import IntegrityError
 
 from slsl_backend import models
@@ -21,36 +22,39 @@ class Command(BaseCommand):
             updated_entries = list(reader)
 
         # Iterate through CSV data and update corresponding entries in the DB
-        num_updated = 0
-        for row in updated_entries:
-            try:
-                entry = get_entry(row["English"])
-                changes_made = False
-                if entry.word_in_sinhala != row["Sinhala"] or entry.word_in_tamil != row["Tamil"]:
-                    changes_made = True
-                entry.word_in_sinhala = row["Sinhala"]
-                entry.word_in_tamil = row["Tamil"]
-                if changes_made:
-                    if not options["dry_run"]:
-                        entry.save()
-                    self.stdout.write(
-                        self.style.SUCCESS(f"Updated entry: {entry.word_in_english}")
-                    )
-                else:
+        # In one transaction, so the dump is only invalidated (and its fragments
+        # refreshed) once, and a failure part way through leaves nothing half-loaded.
+        with transaction.atomic():
+            num_updated = 0
+            for row in updated_entries:
+                try:
+                    entry = get_entry(row["English"])
+                    changes_made = False
+                    if entry.word_in_sinhala != row["Sinhala"] or entry.word_in_tamil != row["Tamil"]:
+                        changes_made = True
+                    entry.word_in_sinhala = row["Sinhala"]
+                    entry.word_in_tamil = row["Tamil"]
+                    if changes_made:
+                        if not options["dry_run"]:
+                            entry.save()
+                        self.stdout.write(
+                            self.style.SUCCESS(f"Updated entry: {entry.word_in_english}")
+                        )
+                    else:
+                        self.stdout.write(
+                            self.style.NOTICE(f"No changes made to entry: {entry.word_in_english}")
+                        )
+                except models.Entry.DoesNotExist:
                     self.stdout.write(
-                        self.style.NOTICE(f"No changes made to entry: {entry.word_in_english}")
-                    )
-            except models.Entry.DoesNotExist:
-                self.stdout.write(
-                    self.style.WARNING(
-                        f"Not Found: Entry {row['English']} (not in database)"
+                        self.style.WARNING(
+                            f"Not Found: Entry {row['English']} (not in database)"
+                        )
                     )
-                )
-            except:
-                raise
-            num_updated += 1
-            if options["limit"] and num_updated >= options["limit"]:
-                break
+                except:
+                    raise
+                num_updated += 1
+                if options["limit"] and num_updated >= options["limit"]:
+                    break
 
 
 def get_entry(word_in_english):
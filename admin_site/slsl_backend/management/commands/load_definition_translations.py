@@ -8,6 +8,7 @@ a definition for each non-English language.
 import csv
 
 from django.core.management.base import BaseCommand
+from django.db import transaction
 
 from slsl_backend import models
 
@@ -69,47 +70,50 @@ class Command(BaseCommand):
         if options.get("limit"):
             rows = rows[: options["limit"]]
 
-        for row in rows:
-            definition_id = int(row["Definition ID"])
-            definition_in_sinhala = row["Definition in Sinhala"].strip()
-            definition_in_tamil = row["Definition in Tamil"].strip()
-            category = row["Category"].strip()
-
-            subentry = definition_id_to_subentry.get(definition_id)
-            if not subentry:
-                print(f"SubEntry for definition {definition_id} not found.")
-                continue
-
-            # Prepare new definitions
-            definitions = {
-                "SI": definition_in_sinhala,
-                "TA": definition_in_tamil,
-            }
-
-            for language_code, definition_text in definitions.items():
-                if not definition_text:
+        # In one transaction, so the dump is only invalidated (and its fragments
+        # refreshed) once, and a failure part way through leaves nothing half-loaded.
+        with transaction.atomic():
+            for row in rows:
+                definition_id = int(row["Definition ID"])
+                definition_in_sinhala = row["Definition in Sinhala"].strip()
+                definition_in_tamil = row["Definition in Tamil"].strip()
+                category = row["Category"].strip()
+
+                subentry = definition_id_to_subentry.get(definition_id)
+                if not subentry:
+                    print(f"SubEntry for definition {definition_id} not found.")
                     continue
 
-                other_definition_id = english_definition_id_to_language_to_other_definition_id.get(definition_id, {}).get(language_code)
-                if other_definition_id:
-                    print(f"Translation of definition '{definition_id}' for '{language_code}' already exists as '{other_definition_id}'.")
-                    continue
-
-                if dry_run:
-                    print(
-                        f"[Dry Run] Would add definition for '{language_code}' to SubEntry '{subentry.id}'."
-                    )
-                else:
-                    # Create new Definition
-                    new_definition = models.Definition(
-                        language=language_code,
-                        category=category,
-                        definition=definition_text,
-                        sub_entry=subentry,
-                        # https://stackoverflow.com/a/2846537/3846032
-                        translation_of_id=definition_id,
-                    )
-                    new_definition.save()
-                    print(
-                        f"Added definition for '{language_code}' to SubEntry '{subentry.id}' as translation of '{definition_id}'"
-                    )
+                # Prepare new definitions
+                definitions = {
+                    "SI": definition_in_sinhala,
+                    "TA": definition_in_tamil,
+                }
+
+                for language_code, definition_text in definitions.items():
+                    if not definition_text:
+                        continue
+
+                    other_definition_id = english_definition_id_to_language_to_other_definition_id.get(definition_id, {}).get(language_code)
+                    if other_definition_id:
+                        print(f"Translation of definition '{definition_id}' for '{language_code}' already exists as '{other_definition_id}'.")
+                        continue
+
+                    if dry_run:
+                        print(
+                            f"[Dry Run] Would add definition for '{language_code}' to SubEntry '{subentry.id}'."
+                        )
+                    else:
+                        # Create new Definition
+                        new_definition = models.Definition(
+                            language=language_code,
+                            category=category,
+                            definition=definition_text,
+                            sub_entry=subentry,
+                            # https://stackoverflow.com/a/2846537/3846032
+                            translation_of_id=definition_id,
+                        )
+                        new_definition.save()
+                        print(
+                            f"Added definition for '{language_code}' to SubEntry '{subentry.id}' as translation of '{definition_id}'"
+                        )
@@ -0,0 +1,143 @@
+"""Work through the queue of media processing tasks (see media_queue.py).
+
+With settings.PROCESS_MEDIA_IN_BACKGROUND, new uploads wait as pending, left
+out of the dump, until this has checked them. In prod it runs on its own, with
+CPU allocated all the time, as `run.sh <port> prod worker`, which restarts it if
+it dies. Any number can run at once against the same DB.
+
+Each runs tasks on --workers threads, at most one per CPU, since transcoding is
+CPU bound. One CPU is left for anything else running alongside it, e.g. the web
+server, and the rest are shared out between the threads' ffmpeg runs.
+
+    uv run python manage.py process_media           # run the tasks due, then exit
+    uv run python manage.py process_media --loop    # keep running them
+
+With --queue-renditions, it first queues renditions to be made (see
+media_queue.RENDITION_LADDER) of every video that doesn't have them yet, e.g.
+those uploaded before they were made.
+
+With --loop, it also warns every so often about videos stuck pending (see
+media_queue.stuck_videos), e.g. because the workers can't keep up.
+"""
+
+import concurrent.futures
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection
+
+from slsl_backend.media_queue import (
+    claim_task,
+    queue_missing_renditions,
+    run_task,
+    stuck_videos,
+)
+
+DEFAULT_INTERVAL = 5
+
+# Seconds between checks for stuck videos in --loop mode.
+STUCK_CHECK_INTERVAL = 600
+
+
+class Command(BaseCommand):
+    help = "Run the queued media processing tasks."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep running tasks forever, checking for new ones every "
+            "--interval seconds.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=int,
+            default=DEFAULT_INTERVAL,
+            help=f"Seconds between checks in --loop mode. Default: {DEFAULT_INTERVAL}",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            help="How many tasks to run at once, at most the number of CPUs "
+            "less one. Default: the number of CPUs less one",
+        )
+        parser.add_argument(
+            "--queue-renditions",
+            action="store_true",
+            help="First queue renditions to be made of every video without them.",
+        )
+
+    def handle(self, *args, **options):
+        # Leaving one CPU, if there's more than one, to whatever else is
+        # running, so a burst of uploads can't starve it.
+        cpus = max((os.cpu_count() or 1) - 1, 1)
+        workers = min(options["workers"] or cpus, cpus)
+        if workers < 1:
+            raise CommandError("--workers must be positive")
+        if connection.vendor == "sqlite" and workers > 1:
+            # SQLite only lets one connection write at a time.
+            self.stderr.write("SQLite only allows one writer, using one worker.")
+            workers = 1
+        # Each of ffmpeg's runs gets an equal share of the CPUs.
+        self.threads = max(cpus // workers, 1)
+        self.workers = workers
+
+        if options["queue_renditions"]:
+            queued = queue_missing_renditions()
+            self.stdout.write(f"Queued renditions of {queued} videos")
+
+        if not options["loop"]:
+            count = self.run_due()
+            self.stdout.write(self.style.SUCCESS(f"Ran {count} media tasks"))
+            return
+
+        interval = options["interval"]
+        if interval <= 0:
+            raise CommandError("--interval must be positive")
+        last_stuck_check = None
+        while True:
+            # Connections can go stale while we sleep, same as between requests.
+            close_old_connections()
+            try:
+                self.run_due()
+                now = time.monotonic()
+                if (
+                    last_stuck_check is None
+                    or now - last_stuck_check >= STUCK_CHECK_INTERVAL
+                ):
+                    last_stuck_check = now
+                    self.warn_stuck()
+            except Exception as e:
+                self.stderr.write(self.style.ERROR(f"Failed to run media tasks: {e}"))
+            time.sleep(interval)
+
+    def warn_stuck(self):
+        stuck = stuck_videos().count()
+        if stuck:
+            self.stderr.write(
+                self.style.WARNING(
+                    f"{stuck} videos have been pending for a long time, and are "
+                    "left out of the dump until they're processed"
+                )
+            )
+
+    def run_due(self):
+        """Run tasks until there are none due, returning how many were run."""
+        with concurrent.futures.ThreadPoolExecutor(self.workers) as executor:
+            return sum(executor.map(lambda _: self.run_worker(), range(self.workers)))
+
+    def run_worker(self):
+        # Each worker thread gets its own DB connection, which is closed once
+        # it's done rather than left open when the thread exits.
+        count = 0
+        try:
+            while (task := claim_task()) is not None:
+                state = run_task(task, threads=self.threads)
+                self.stdout.write(
+                    f"{task.get_kind_display()} video {task.video_id}: {state.label}"
+                )
+                count += 1
+        finally:
+            connection.close()
+        return count
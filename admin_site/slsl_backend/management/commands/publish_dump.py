@@ -0,0 +1,368 @@
+"""Publish the dump to R2, but only when its content actually changed.
+
+The app checks for new data with If-Modified-Since against the published
+`dump/dump.json`, so re-uploading identical bytes makes every client download
+the whole ~16 MB again. This builds the dump (the same bytes /dump serves, which
+are deterministic), hashes it, and compares that to the hash stored in the
+published object's metadata. It only uploads when they differ, so Last-Modified
+only moves when the data does. Brotli and gzip copies of the dump are kept up to
+date next to it the same way (dump/dump.json.br and dump/dump.json.gz).
+
+The dump is also published as NDJSON (see dump_ndjson.py), one entry per line,
+as dump/dump.ndjson (plus .br and .gz), for readers that parse it as a stream.
+Each publish also builds the search index of the dump (see dump_search_index.py)
+from the same bytes and publishes it next to it as dump/search_index.json (plus
+.br and .gz), so clients don't have to tokenise the whole dump themselves. The
+index records the sha256 of the dump it indexes.
+
+Run it from admin_site/ with the prod DB + R2 secrets configured (the same
+prod_secrets.json caveat as find_unused_videos):
+
+    uv run python manage.py publish_dump             # publish once, if changed
+    uv run python manage.py publish_dump --dry-run   # just report
+    uv run python manage.py publish_dump --loop      # every dump_interval_secs
+    uv run python manage.py publish_dump --shards    # also publish the shards
+
+With --shards the dump is also split into shards (see dump.iter_dump_shards)
+that clients can fetch in parallel, plus dump/manifest.json listing each shard's
+URL (relative to the manifest), entry count, byte size and sha256. Like the
+other variants, they're split from the exact dump just published. Shards are
+named by their hash, so unchanged shards keep their URL and are never
+re-uploaded, and clients only need to re-fetch shards whose hash changed. Once a
+new manifest is up, shards listed by neither it nor the one it replaced are
+deleted, so clients that fetched the previous manifest can still get its shards.
+"""
+
+import hashlib
+import json
+import posixpath
+import time
+
+from botocore.exceptions import ClientError
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from slsl_backend.dump import (
+    DEFAULT_SHARD_SIZE,
+    compress_dump,
+    iter_dump_shards,
+    serialise_dump,
+)
+from slsl_backend.dump_builds import DumpBusy, build_slot
+from slsl_backend.dump_fragments import iter_dump_json_from_fragments
+from slsl_backend.dump_ndjson import serialise_ndjson_dump
+from slsl_backend.dump_search_index import build_search_index, serialise_search_index
+from slsl_backend.secrets import secrets
+
+# Where the app fetches the dump from, relative to the bucket root (not under
+# the media/ location).
+DUMP_KEY = "dump/dump.json"
+
+# The precomputed search index (see dump_search_index.py) is published next to
+# the dump, e.g. dump/search_index.json, along with its compressed variants.
+SEARCH_INDEX_NAME = "search_index.json"
+
+# The dump is also published as NDJSON (see dump_ndjson.py) next to it, e.g.
+# dump/dump.ndjson, along with its compressed variants.
+NDJSON_CONTENT_TYPE = "application/x-ndjson"
+
+# The object metadata key holding the hex sha256 of the published (uncompressed)
+# content.
+HASH_METADATA_KEY = "sha256"
+
+# Pre-compressed copies of the dump are published next to it, e.g.
+# dump/dump.json.br, served with the matching Content-Encoding.
+ENCODING_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+# Publishing happens offline, so spend the time on brotli's best compression.
+PUBLISH_BROTLI_QUALITY = 11
+
+
+class Command(BaseCommand):
+    help = "Upload the dump to R2 if its content changed since the last publish."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--key",
+            default=DUMP_KEY,
+            help=f"Object key to publish the dump to. Default: {DUMP_KEY}",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Build and compare the dump but don't upload it.",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Upload even if the content hash is unchanged.",
+        )
+        parser.add_argument(
+            "--shards",
+            action="store_true",
+            help="Also publish the dump as shards plus a manifest.",
+        )
+        parser.add_argument(
+            "--shard-size",
+            type=int,
+            default=DEFAULT_SHARD_SIZE,
+            help=f"Entries per shard. Default: {DEFAULT_SHARD_SIZE}",
+        )
+        parser.add_argument(
+            "--shard-by-category",
+            action="store_true",
+            help="Make one shard per category instead of fixed-size shards.",
+        )
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep publishing forever, every --interval seconds.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=int,
+            default=secrets.get("dump_interval_secs"),
+            help="Seconds between publishes in --loop mode. Defaults to the "
+            "dump_interval_secs secret.",
+        )
+
+    def handle(self, *args, **options):
+        storage = default_storage
+        bucket_name = getattr(storage, "bucket_name", None)
+        if not bucket_name:
+            raise CommandError(
+                "Default storage is not the S3/R2 backend. Run this from "
+                "admin_site/ with the prod R2 + DB secrets configured "
+                "(prod_secrets.json present)."
+            )
+        client = storage.connection.meta.client
+
+        if not options["loop"]:
+            self.publish(client, bucket_name, options)
+            return
+
+        if not options["interval"]:
+            raise CommandError(
+                "--loop needs --interval or the dump_interval_secs secret."
+            )
+        interval = int(options["interval"])
+        while True:
+            # Connections can go stale while we sleep, same as between requests.
+            close_old_connections()
+            try:
+                self.publish(client, bucket_name, options)
+            except Exception as e:
+                self.stderr.write(self.style.ERROR(f"Failed to publish dump: {e}"))
+            time.sleep(interval)
+
+    def published_digest(self, client, bucket_name, key):
+        try:
+            head = client.head_object(Bucket=bucket_name, Key=key)
+        except ClientError as e:
+            # A missing object just means this is the first publish.
+            if e.response.get("Error", {}).get("Code") not in ("404", "NoSuchKey"):
+                raise
+            return None
+        return head.get("Metadata", {}).get(HASH_METADATA_KEY)
+
+    def publish(self, client, bucket_name, options):
+        # Counts towards the limit on concurrent dump builds, the same as /dump.
+        try:
+            with build_slot():
+                content = self.publish_dump(client, bucket_name, options)
+                # The other variants are derived from the exact bytes just
+                # published, so they always match them.
+                entries = json.loads(content)["data"]
+                self.publish_ndjson(client, bucket_name, options, entries)
+                self.publish_search_index(
+                    client, bucket_name, options, content, entries
+                )
+                if options["shards"]:
+                    self.publish_shards(client, bucket_name, options, entries)
+        except DumpBusy:
+            raise CommandError("Too many dumps are being built, try again shortly")
+
+    def publish_dump(self, client, bucket_name, options):
+        """Publish the dump and its compressed variants, returning its content."""
+        content = b"".join(iter_dump_json_from_fragments())
+        self.publish_variants(client, bucket_name, options["key"], content, options)
+        return content
+
+    def publish_ndjson(self, client, bucket_name, options, entries):
+        key = f"{posixpath.splitext(options['key'])[0]}.ndjson"
+        self.publish_variants(
+            client,
+            bucket_name,
+            key,
+            serialise_ndjson_dump(entries),
+            options,
+            content_type=NDJSON_CONTENT_TYPE,
+        )
+
+    def publish_search_index(self, client, bucket_name, options, content, entries):
+        dump_digest = hashlib.sha256(content).hexdigest()
+        index = build_search_index(entries, dump_digest)
+        key = posixpath.join(posixpath.dirname(options["key"]), SEARCH_INDEX_NAME)
+        self.publish_variants(
+            client, bucket_name, key, serialise_search_index(index), options
+        )
+
+    def publish_variants(
+        self,
+        client,
+        bucket_name,
+        key,
+        content,
+        options,
+        content_type="application/json",
+    ):
+        """Publish `content` and its compressed variants to `key`, if changed."""
+        digest = hashlib.sha256(content).hexdigest()
+
+        # Every variant records the hash of the uncompressed content, so each
+        # one is checked (and caught up, e.g. on the first publish after a
+        # variant was added) independently.
+        keys = [key] + [f"{key}{suffix}" for suffix in ENCODING_SUFFIXES.values()]
+        stale = [
+            k
+            for k in keys
+            if options["force"]
+            or self.published_digest(client, bucket_name, k) != digest
+        ]
+        if not stale:
+            self.stdout.write(f"{key} unchanged ({digest[:12]}), not publishing.")
+            return
+
+        if options["dry_run"]:
+            self.stdout.write(f"Would publish {', '.join(stale)} ({digest[:12]}).")
+            return
+
+        # Compressing is the slow part, so only do it if a variant needs it.
+        encodings = {}
+        if stale != [key]:
+            encodings = compress_dump(content, brotli_quality=PUBLISH_BROTLI_QUALITY)
+
+        # Upload the compressed variants first, so by the time the plain
+        # content's Last-Modified moves they already match it.
+        for encoding, suffix in ENCODING_SUFFIXES.items():
+            variant_key = f"{key}{suffix}"
+            if variant_key not in stale:
+                continue
+            self.upload(
+                client,
+                bucket_name,
+                variant_key,
+                encodings[encoding],
+                digest,
+                content_type,
+                ContentEncoding=encoding,
+            )
+        if key in stale:
+            self.upload(client, bucket_name, key, content, digest, content_type)
+
+    def upload(
+        self,
+        client,
+        bucket_name,
+        key,
+        body,
+        digest,
+        content_type="application/json",
+        **extra,
+    ):
+        client.put_object(
+            Bucket=bucket_name,
+            Key=key,
+            Body=body,
+            ContentType=content_type,
+            Metadata={HASH_METADATA_KEY: digest},
+            **extra,
+        )
+        self.stdout.write(
+            self.style.SUCCESS(f"Published {len(body)} bytes to {key} ({digest[:12]}).")
+        )
+
+    def publish_shards(self, client, bucket_name, options, entries):
+        dump_dir = posixpath.dirname(options["key"])
+        manifest_key = posixpath.join(dump_dir, "manifest.json")
+
+        shards = []
+        uploaded = 0
+        for name, shard_entries in iter_dump_shards(
+            entries,
+            shard_size=options["shard_size"],
+            by_category=options["shard_by_category"],
+        ):
+            content = serialise_dump(shard_entries)
+            digest = hashlib.sha256(content).hexdigest()
+            url = f"shards/{digest}.json"
+            shards.append(
+                {
+                    "name": name,
+                    "url": url,
+                    "entries": len(shard_entries),
+                    "bytes": len(content),
+                    "sha256": digest,
+                }
+            )
+            # Shards are content-addressed: one that's already there is current.
+            shard_key = posixpath.join(dump_dir, url)
+            if self.published_digest(client, bucket_name, shard_key) == digest:
+                continue
+            uploaded += 1
+            if not options["dry_run"]:
+                self.upload(client, bucket_name, shard_key, content, digest)
+
+        manifest = json.dumps(
+            {"entries": sum(s["entries"] for s in shards), "shards": shards},
+            indent=2,
+        ).encode("utf-8")
+        digest = hashlib.sha256(manifest).hexdigest()
+        if (
+            self.published_digest(client, bucket_name, manifest_key) == digest
+            and not options["force"]
+        ):
+            self.stdout.write(f"Shard manifest unchanged ({len(shards)} shards).")
+            return
+        # Clients may still hold the manifest being replaced, so its shards are
+        # kept until the next one replaces it in turn.
+        keep = {s["url"] for s in shards} | self.published_shard_urls(
+            client, bucket_name, manifest_key
+        )
+        if options["dry_run"]:
+            self.stdout.write(
+                f"Would publish {uploaded}/{len(shards)} shards and {manifest_key}."
+            )
+            orphans = self.orphaned_shards(client, bucket_name, dump_dir, keep)
+            self.stdout.write(f"Would delete {len(orphans)} orphaned shards.")
+            return
+        # The manifest goes last, so every shard it lists is already there.
+        self.upload(client, bucket_name, manifest_key, manifest, digest)
+
+        orphans = self.orphaned_shards(client, bucket_name, dump_dir, keep)
+        for key in orphans:
+            client.delete_object(Bucket=bucket_name, Key=key)
+        if orphans:
+            self.stdout.write(f"Deleted {len(orphans)} orphaned shards.")
+
+    def published_shard_urls(self, client, bucket_name, manifest_key):
+        """Return the URLs of the shards the published manifest lists."""
+        try:
+            body = client.get_object(Bucket=bucket_name, Key=manifest_key)["Body"]
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") not in ("404", "NoSuchKey"):
+                raise
+            return set()
+        return {s["url"] for s in json.load(body)["shards"]}
+
+    def orphaned_shards(self, client, bucket_name, dump_dir, keep):
+        """Return the keys of the published shards whose URL isn't in `keep`."""
+        prefix = posixpath.join(dump_dir, "shards/")
+        paginator = client.get_paginator("list_objects_v2")
+        return [
+            obj["Key"]
+            for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix)
+            for obj in page.get("Contents", ())
+            if posixpath.relpath(obj["Key"], dump_dir) not in keep
+        ]
@@ -0,0 +1,101 @@
+"""Rebuild the per-entry dump fragments (see dump_fragments.py), in parallel.
+
+Fragments refresh themselves as entries change, so this is only needed to fill
+the table the first time, or after changing how entries are dumped (which
+changes every fragment without changing any entry). The entries are split into
+batches, which are built and written by --workers threads, each with its own DB
+connection. With the Postgres dump engine most of the work happens in the DB,
+so the threads really do run in parallel.
+
+    uv run python manage.py rebuild_dump_fragments
+    uv run python manage.py rebuild_dump_fragments --stale-only
+"""
+
+import concurrent.futures
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from slsl_backend import models
+from slsl_backend.dump_builds import DumpBusy, build_slot
+from slsl_backend.dump_fragments import (
+    REFRESH_BATCH_SIZE,
+    refresh_fragments,
+    stale_entries,
+)
+
+DEFAULT_WORKERS = 4
+
+
+class Command(BaseCommand):
+    help = "Rebuild the per-entry dump fragments, in parallel."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=DEFAULT_WORKERS,
+            help=f"How many batches to build at once. Default: {DEFAULT_WORKERS}",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=REFRESH_BATCH_SIZE,
+            help=f"Entries per batch. Default: {REFRESH_BATCH_SIZE}",
+        )
+        parser.add_argument(
+            "--stale-only",
+            action="store_true",
+            help="Only rebuild fragments that are missing or out of date.",
+        )
+
+    def handle(self, *args, **options):
+        workers = options["workers"]
+        if connection.vendor == "sqlite" and workers > 1:
+            # SQLite only lets one connection write at a time.
+            self.stderr.write("SQLite only allows one writer, using one worker.")
+            workers = 1
+
+        entries = stale_entries() if options["stale_only"] else models.Entry.objects
+        entry_ids = list(entries.order_by("id").values_list("id", flat=True))
+        batch_size = options["batch_size"]
+        batches = [
+            entry_ids[start : start + batch_size]
+            for start in range(0, len(entry_ids), batch_size)
+        ]
+        self.stdout.write(
+            f"Rebuilding {len(entry_ids)} dump fragments in {len(batches)} batches "
+            f"with {workers} workers"
+        )
+
+        start = time.perf_counter()
+        written = 0
+        # A full rebuild is as much work as a dump build, so it counts towards
+        # the limit on concurrent builds, the same as /dump.
+        try:
+            with build_slot():
+                with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+                    for count in executor.map(_rebuild_batch, batches):
+                        written += count
+        except DumpBusy:
+            raise CommandError("Too many dumps are being built, try again shortly")
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Rebuilt {written} dump fragments in "
+                f"{time.perf_counter() - start:.1f}s"
+            )
+        )
+
+
+def _rebuild_batch(entry_ids):
+    # Each worker thread gets its own DB connection, which is closed after each
+    # batch rather than left open when the thread exits.
+    try:
+        return refresh_fragments(
+            models.Entry.objects.filter(id__in=entry_ids),
+            batch_size=len(entry_ids),
+        )
+    finally:
+        connection.close()
@@ -0,0 +1,514 @@
+"""A queue of media processing tasks, kept in the DB (the MediaTask table).
+
+Checking an upload while the admin saves it holds a server thread for as long
+as the check takes, and a large upload plus ffprobe can run into gunicorn's 60s
+timeout. With settings.PROCESS_MEDIA_IN_BACKGROUND, Video.save instead marks a
+new upload PENDING and queues a task for it in the same transaction, and the
+process_media command works through the queue, making each video READY or
+FAILED. Pending and failed videos are left out of the dump (see
+DumpFilter.filter_videos); the worker's save bumps the dump like any other.
+
+There's no broker: workers claim tasks with a conditional UPDATE, so any number
+of them can share the DB (on Postgres, SELECT ... FOR UPDATE SKIP LOCKED also
+keeps them off each other's rows). A claimed task is leased for LEASE, and if
+its worker dies the lease runs out and another worker takes it over. The media
+being rejected is a result, not an error; anything else (the bucket being
+unreachable, say) is retried with backoff, up to MAX_ATTEMPTS runs. Each task
+is for the media the video had when it was queued, and is skipped if the video
+has other media by the time it runs, which has tasks of its own. If no worker
+is running at all, uploads stay PENDING: stuck_videos finds them, and the admin
+and the worker itself warn about them.
+
+With settings.TRANSCODE_UNDECODABLE_MEDIA, an upload that's intact but encoded
+in a format the apps can't decode isn't failed but queued for a TRANSCODE task,
+which re-encodes it with validators.TRANSCODE_ARGS. Once the new file passes the
+checks, the video is switched over to it and made READY, and the original is
+moved to the archive/ prefix, as find_unused_videos does with unused videos.
+
+With settings.MEDIA_RENDITIONS, every video that's made READY is queued for a
+RENDITIONS task, which encodes it at each height in RENDITION_LADDER it's tall
+enough for, plus an HLS playlist of them all, for clients on slow connections.
+They're kept next to the video, under names derived from its own (see
+rendition_names), and listed in Video.renditions. A video is dumped with or
+without them, so failing to make them never fails the video.
+"""
+
+import contextlib
+import datetime
+import logging
+import os
+import posixpath
+import shutil
+import subprocess
+import tempfile
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Q
+from django.utils import timezone
+
+from . import models
+from .validators import (
+    TRANSCODE_ARGS,
+    UNDECODABLE,
+    VIDEO_EXTS,
+    check_video_file,
+    check_video_path,
+)
+from .video_probe import probe_video
+
+LOG = logging.getLogger(__name__)
+
+# How long a worker has to finish a task before another may take it over, by
+# MediaTaskKind.
+LEASES = {
+    models.MediaTaskKind.VALIDATE: datetime.timedelta(minutes=10),
+    models.MediaTaskKind.TRANSCODE: datetime.timedelta(hours=1),
+    # An encode, and a quick copy into HLS segments, per rendition.
+    models.MediaTaskKind.RENDITIONS: datetime.timedelta(hours=3),
+}
+
+# How long each ffmpeg run gets, comfortably inside a transcode's lease.
+TRANSCODE_TIMEOUT = datetime.timedelta(minutes=45)
+
+# The renditions made of each video: the most bits a second the video of each
+# may use, by height. Heights taller than the video are skipped.
+RENDITION_LADDER = {
+    240: 400_000,
+    480: 1_000_000,
+    720: 2_500_000,
+}
+
+# The bits a second of the renditions' audio, if any.
+RENDITION_AUDIO_BITRATE = 64_000
+
+# The length of each HLS segment, in seconds.
+HLS_SEGMENT_SECONDS = 4
+
+# The name of the HLS playlist listing every rendition, which clients load.
+HLS_PLAYLIST = "index.m3u8"
+
+# Where originals are moved once they've been transcoded: a sibling of the
+# media/ prefix in the bucket, which the app never reads from.
+ARCHIVE_PREFIX = "archive/"
+
+# How many times a task is run before giving up on it.
+MAX_ATTEMPTS = 5
+
+# How long to wait before running a failed task again, doubling each attempt.
+RETRY_BACKOFF = datetime.timedelta(seconds=30)
+
+# How many due tasks claim_task looks at before giving up to other workers.
+CLAIM_CANDIDATES = 10
+
+# How long a video can wait on its tasks before it counts as stuck (see
+# stuck_videos). A running worker gets through a validation and a transcode well
+# within this, so a video still PENDING after it most likely has no worker.
+STUCK_AFTER = datetime.timedelta(hours=2)
+
+
+def _claimable(now):
+    # Queued tasks that are due, and running tasks whose worker's lease ran out.
+    return models.MediaTask.objects.filter(
+        Q(state=models.MediaTaskState.QUEUED, run_after__lte=now)
+        | Q(state=models.MediaTaskState.RUNNING, locked_until__lt=now)
+    )
+
+
+def claim_task():
+    """Claim the next task that's due, returning it, or None if there's none.
+
+    The task is RUNNING, leased to the caller, until run_task finishes it.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        candidates = list(
+            _claimable(now)
+            .select_for_update(skip_locked=True)
+            .order_by("run_after", "id")
+            .values_list("id", "kind")[:CLAIM_CANDIDATES]
+        )
+        for task_id, kind in candidates:
+            # Only claims the task if no other worker did first, even where
+            # there are no row locks (SQLite).
+            claimed = (
+                _claimable(now)
+                .filter(pk=task_id)
+                .update(
+                    state=models.MediaTaskState.RUNNING,
+                    locked_until=now + LEASES[kind],
+                    attempts=F("attempts") + 1,
+                )
+            )
+            if claimed:
+                return models.MediaTask.objects.select_related("video").get(pk=task_id)
+    return None
+
+
+def run_task(task, threads=0):
+    """Run a task claimed with claim_task, returning its new MediaTaskState.
+
+    `threads` is how many threads ffmpeg may use, or 0 to leave it to ffmpeg.
+    """
+    if task.video.media.name != task.media:
+        # The video's had other media since, which has tasks of its own.
+        LOG.info(f"Skipping {task}: it was queued for {task.media}, now replaced")
+        _finish(task, models.MediaTaskState.DONE)
+        return models.MediaTaskState.DONE
+    LOG.info(f"Running {task} (attempt {task.attempts})")
+    try:
+        HANDLERS[task.kind](task.video, threads)
+    except Exception as e:
+        LOG.exception(f"{task} failed")
+        return _retry_or_fail(task, f"{type(e).__name__}: {e}")
+    _finish(task, models.MediaTaskState.DONE)
+    return models.MediaTaskState.DONE
+
+
+def _finish(task, state, error=""):
+    models.MediaTask.objects.filter(pk=task.pk).update(
+        state=state, locked_until=None, error=error
+    )
+
+
+def _retry_or_fail(task, error):
+    if task.attempts >= MAX_ATTEMPTS:
+        _finish(task, models.MediaTaskState.FAILED, error)
+        if task.kind == models.MediaTaskKind.RENDITIONS:
+            # The video's dumped without them.
+            return models.MediaTaskState.FAILED
+        _set_media_state(
+            task.video,
+            models.MediaState.FAILED,
+            f"This video couldn't be processed ({error}). Try uploading it again.",
+        )
+        return models.MediaTaskState.FAILED
+    backoff = RETRY_BACKOFF * 2 ** (task.attempts - 1)
+    models.MediaTask.objects.filter(pk=task.pk).update(
+        state=models.MediaTaskState.QUEUED,
+        run_after=timezone.now() + backoff,
+        locked_until=None,
+        error=error,
+    )
+    return models.MediaTaskState.QUEUED
+
+
+def _update_video(video, **fields):
+    """Save `fields` on the video, returning whether it did.
+
+    It doesn't if the video's media was replaced while it was processed.
+    """
+    with transaction.atomic():
+        # Only if the video still has the media that was processed: if an
+        # admin uploaded another meanwhile, that has a task of its own.
+        current = (
+            models.Video.objects.select_for_update()
+            .filter(pk=video.pk, media=video.media.name)
+            .first()
+        )
+        if current is None:
+            LOG.info(f"Video {video.pk} changed while it was processed, skipping")
+            return False
+        for field_name, value in fields.items():
+            setattr(current, field_name, value)
+        # A save, not an update(), so the signal receivers bump the dump.
+        current.save(update_fields=list(fields))
+        return True
+
+
+def _set_media_state(video, state, error="", **fields):
+    return _update_video(video, media_state=state, media_error=error, **fields)
+
+
+def _set_ready(video, **fields):
+    with transaction.atomic():
+        ready = _set_media_state(video, models.MediaState.READY, **fields)
+        if ready and settings.MEDIA_RENDITIONS and _have_ffmpeg():
+            models.MediaTask.objects.create(
+                video=video,
+                kind=models.MediaTaskKind.RENDITIONS,
+                media=fields.get("media", video.media.name),
+            )
+    return ready
+
+
+def _have_ffmpeg():
+    if shutil.which("ffmpeg"):
+        return True
+    LOG.warning("ffmpeg not found; skipping the tasks that need it")
+    return False
+
+
+def _run_ffmpeg(*args):
+    ffmpeg = shutil.which("ffmpeg")
+    if not ffmpeg:
+        raise RuntimeError("ffmpeg not found")
+    proc = subprocess.run(
+        [ffmpeg, "-v", "error", "-y", *args],
+        capture_output=True,
+        timeout=TRANSCODE_TIMEOUT.total_seconds(),
+    )
+    if proc.returncode != 0:
+        stderr = proc.stderr.decode("utf-8", "replace").strip()
+        raise RuntimeError(f"ffmpeg exited with {proc.returncode}: {stderr}")
+
+
+@contextlib.contextmanager
+def _local_path(media):
+    # ffprobe needs the file on disk, which a bucket's files aren't.
+    try:
+        path = media.path
+    except NotImplementedError:
+        path = None
+    if path is not None:
+        yield path
+        return
+    suffix = os.path.splitext(media.name)[1]
+    with tempfile.NamedTemporaryFile(suffix=suffix) as f:
+        with media.open("rb") as source:
+            shutil.copyfileobj(source, f)
+        f.flush()
+        yield f.name
+
+
+def _validate_video(video, threads):
+    try:
+        if settings.VALIDATE_WITH_FFPROBE:
+            with _local_path(video.media) as path:
+                check_video_path(path, cross_check=True)
+        else:
+            with video.media.open("rb") as f:
+                check_video_file(f, video.media.size)
+    except ValidationError as e:
+        if e.code == UNDECODABLE and _can_transcode():
+            LOG.info(f"Video {video.pk} ({video.media.name}) needs transcoding")
+            # The video stays PENDING until it's been transcoded.
+            models.MediaTask.objects.create(
+                video=video,
+                kind=models.MediaTaskKind.TRANSCODE,
+                media=video.media.name,
+            )
+            return
+        LOG.info(f"Video {video.pk} ({video.media.name}) was rejected: {e}")
+        _set_media_state(video, models.MediaState.FAILED, " ".join(e.messages))
+        return
+    _set_ready(video)
+
+
+def _can_transcode():
+    return settings.TRANSCODE_UNDECODABLE_MEDIA and _have_ffmpeg()
+
+
+def _transcode_video(video, threads):
+    original = video.media.name
+    with _local_path(video.media) as source, tempfile.TemporaryDirectory() as temp:
+        output = os.path.join(temp, "transcoded.mp4")
+        _run_ffmpeg("-i", source, *TRANSCODE_ARGS, "-threads", str(threads), output)
+        try:
+            check_video_path(output, cross_check=settings.VALIDATE_WITH_FFPROBE)
+        except ValidationError as e:
+            # Re-encoding didn't help, so it's no use retrying.
+            LOG.info(f"Video {video.pk} ({original}) failed to transcode: {e}")
+            _set_media_state(video, models.MediaState.FAILED, " ".join(e.messages))
+            return
+        # Under the original's name, which the storage makes unique.
+        with open(output, "rb") as f:
+            transcoded = default_storage.save(original, File(f))
+
+    if not _set_ready(video, media=transcoded):
+        default_storage.delete(transcoded)
+        return
+    LOG.info(f"Video {video.pk} was transcoded from {original} to {transcoded}")
+    try:
+        _archive_media(original)
+    except Exception:
+        # The video's fine; find_unused_videos will find the original.
+        LOG.exception(f"Failed to archive {original}")
+
+
+def _archive_media(name):
+    storage = default_storage
+    bucket_name = getattr(storage, "bucket_name", None)
+    if not bucket_name:
+        # Local dev: under the media dir, as there's no bucket to put it beside.
+        with storage.open(name, "rb") as f:
+            storage.save(f"{ARCHIVE_PREFIX}{name}", f)
+        storage.delete(name)
+        return
+    # A server-side copy, then delete the original: an S3/R2 "move".
+    location = (storage.location or "").strip("/")
+    key = f"{location}/{name}" if location else name
+    client = storage.connection.meta.client
+    client.copy_object(
+        Bucket=bucket_name,
+        CopySource={"Bucket": bucket_name, "Key": key},
+        Key=f"{ARCHIVE_PREFIX}{name}",
+    )
+    client.delete_object(Bucket=bucket_name, Key=key)
+
+
+def rendition_dir(name):
+    """Return the directory the renditions of the media named `name` are in.
+
+    It's next to the media, named after it: "sign_ab12/" for "sign_ab12.mp4".
+    """
+    return f"{posixpath.splitext(name)[0]}/"
+
+
+def rendition_names(name):
+    """Return the storage names of the renditions of the media named `name`.
+
+    They're in its rendition_dir: for "sign_ab12.mp4", "sign_ab12/240p.mp4" and
+    so on, and the HLS playlist and its segments under "sign_ab12/hls/". Returns
+    a dict of the names of the MP4 renditions by height, plus "hls", the
+    playlist's.
+    """
+    directory = rendition_dir(name)
+    names = {"hls": f"{directory}hls/{HLS_PLAYLIST}"}
+    for height in RENDITION_LADDER:
+        names[height] = f"{directory}{height}p.mp4"
+    return names
+
+
+def _make_renditions(video, threads):
+    names = rendition_names(video.media.name)
+    hls_dir = posixpath.dirname(names["hls"])
+    with _local_path(video.media) as source, tempfile.TemporaryDirectory() as temp:
+        with open(source, "rb") as f:
+            source_height = probe_video(f).height
+        # At least the smallest, however short the video is.
+        heights = [
+            height
+            for height in RENDITION_LADDER
+            if height <= source_height or height == min(RENDITION_LADDER)
+        ]
+        local_hls_dir = os.path.join(temp, "hls")
+        os.mkdir(local_hls_dir)
+        variants = []
+        for height in heights:
+            bitrate = RENDITION_LADDER[height]
+            output = os.path.join(temp, f"{height}p.mp4")
+            _run_ffmpeg(
+                "-i",
+                source,
+                "-vf",
+                f"scale=-2:{height}",
+                *TRANSCODE_ARGS,
+                "-maxrate",
+                str(bitrate),
+                "-bufsize",
+                str(bitrate * 2),
+                "-c:a",
+                "aac",
+                "-b:a",
+                str(RENDITION_AUDIO_BITRATE),
+                "-threads",
+                str(threads),
+                output,
+            )
+            probe = check_video_path(output)
+            # The same video and audio, cut into segments without re-encoding.
+            _run_ffmpeg(
+                "-i",
+                output,
+                "-c",
+                "copy",
+                "-f",
+                "hls",
+                "-hls_time",
+                str(HLS_SEGMENT_SECONDS),
+                "-hls_playlist_type",
+                "vod",
+                "-hls_segment_filename",
+                os.path.join(local_hls_dir, f"{height}p_%03d.ts"),
+                os.path.join(local_hls_dir, f"{height}p.m3u8"),
+            )
+            variants.append(
+                f"#EXT-X-STREAM-INF:BANDWIDTH={bitrate + RENDITION_AUDIO_BITRATE},"
+                f"RESOLUTION={probe.width}x{probe.height}\n{height}p.m3u8\n"
+            )
+        with open(os.path.join(local_hls_dir, HLS_PLAYLIST), "w") as f:
+            f.write("#EXTM3U\n#EXT-X-VERSION:3\n" + "".join(variants))
+
+        for height in heights:
+            _save_as(names[height], os.path.join(temp, f"{height}p.mp4"))
+        # The playlist goes last, so every file it lists is already there.
+        for file_name in sorted(os.listdir(local_hls_dir)):
+            if file_name != HLS_PLAYLIST:
+                _save_as(
+                    f"{hls_dir}/{file_name}", os.path.join(local_hls_dir, file_name)
+                )
+        _save_as(names["hls"], os.path.join(local_hls_dir, HLS_PLAYLIST))
+
+    # In the order Postgres keeps a jsonb object's keys (shortest first), so the
+    # dump engines agree on it.
+    renditions = {"hls": names["hls"]}
+    for height in heights:
+        renditions[f"{height}p"] = names[height]
+    if _update_video(video, renditions=renditions):
+        LOG.info(f"Made renditions of video {video.pk}: {', '.join(renditions)}")
+
+
+def _save_as(name, path):
+    # Under exactly this name, replacing what's there from an earlier run: the
+    # storage would otherwise pick a new one.
+    default_storage.delete(name)
+    with open(path, "rb") as f:
+        saved = default_storage.save(name, File(f))
+    if saved != name:
+        raise RuntimeError(f"{name} was saved as {saved}")
+
+
+def queue_missing_renditions():
+    """Queue a RENDITIONS task for every READY video without renditions.
+
+    Skips videos already queued for one and images. Returns how many tasks
+    were queued.
+    """
+    queued = models.MediaTask.objects.filter(
+        kind=models.MediaTaskKind.RENDITIONS,
+        state__in=[models.MediaTaskState.QUEUED, models.MediaTaskState.RUNNING],
+    )
+    videos = (
+        models.Video.objects.filter(media_state=models.MediaState.READY, renditions={})
+        .exclude(pk__in=queued.values("video_id"))
+        .only("media")
+    )
+    tasks = [
+        models.MediaTask(
+            video=video, kind=models.MediaTaskKind.RENDITIONS, media=video.media.name
+        )
+        for video in videos.iterator()
+        if video.media.name.lower().endswith(VIDEO_EXTS)
+    ]
+    models.MediaTask.objects.bulk_create(tasks)
+    return len(tasks)
+
+
+def stuck_videos(older_than=STUCK_AFTER):
+    """Return the PENDING videos that have waited `older_than` or more.
+
+    That's those with a task that's been unfinished since then, and those with
+    no unfinished task at all, which nothing will ever make READY. Either way
+    they're left out of the dump until a worker gets to them.
+    """
+    unfinished = models.MediaTask.objects.filter(
+        video=OuterRef("pk"),
+        state__in=[models.MediaTaskState.QUEUED, models.MediaTaskState.RUNNING],
+    )
+    return models.Video.objects.filter(media_state=models.MediaState.PENDING).filter(
+        Exists(unfinished.filter(created_at__lte=timezone.now() - older_than))
+        | ~Exists(unfinished)
+    )
+
+
+# What each MediaTaskKind does, given the task's video and how many threads
+# ffmpeg may use.
+HANDLERS = {
+    models.MediaTaskKind.VALIDATE: _validate_video,
+    models.MediaTaskKind.TRANSCODE: _transcode_video,
+    models.MediaTaskKind.RENDITIONS: _make_renditions,
+}
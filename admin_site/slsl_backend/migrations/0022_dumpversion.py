@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("slsl_backend", "0021_alter_subentry_options_alter_video_options_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DumpVersion",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("version", models.PositiveBigIntegerField(default=0)),
+                ("changed_at", models.DateTimeField()),
+            ],
+        ),
+    ]
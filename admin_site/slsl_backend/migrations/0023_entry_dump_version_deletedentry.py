@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("slsl_backend", "0022_dumpversion"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DeletedEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("word_in_english", models.CharField(max_length=256)),
+                ("dump_version", models.PositiveBigIntegerField(db_index=True)),
+            ],
+            options={
+                "verbose_name_plural": "deleted entries",
+            },
+        ),
+        migrations.AddField(
+            model_name="entry",
+            name="dump_version",
+            field=models.PositiveBigIntegerField(db_index=True, default=0),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Indexes for the /search endpoint (see search.py). Postgres only: dev on SQLite
+# searches with plain icontains scans instead.
+
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+# Index name -> (table, indexed expression). Trigram indexes serve the
+# word_similarity (<%) matches on headwords and related words; the full-text
+# index serves definition search. The expressions must match search.py exactly
+# for the planner to use them.
+INDEXES = {
+    "slsl_entry_english_trgm": ("slsl_backend_entry", "word_in_english gin_trgm_ops"),
+    "slsl_entry_sinhala_trgm": ("slsl_backend_entry", "word_in_sinhala gin_trgm_ops"),
+    "slsl_entry_tamil_trgm": ("slsl_backend_entry", "word_in_tamil gin_trgm_ops"),
+    "slsl_subentry_related_trgm": (
+        "slsl_backend_subentry",
+        "related_words gin_trgm_ops",
+    ),
+    "slsl_definition_fts": (
+        "slsl_backend_definition",
+        "to_tsvector('simple', definition)",
+    ),
+}
+
+
+def create_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for name, (table, expression) in INDEXES.items():
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS {name} ON {table} USING gin ({expression})"
+        )
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for name in INDEXES:
+        schema_editor.execute(f"DROP INDEX IF EXISTS {name}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("slsl_backend", "0023_entry_dump_version_deletedentry"),
+    ]
+
+    operations = [
+        # Does nothing on other databases.
+        TrigramExtension(),
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("slsl_backend", "0024_search_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DumpFragment",
+            fields=[
+                (
+                    "entry",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        serialize=False,
+                        to="slsl_backend.entry",
+                    ),
+                ),
+                ("dump_version", models.PositiveBigIntegerField()),
+                ("content", models.TextField(null=True)),
+            ],
+        ),
+    ]
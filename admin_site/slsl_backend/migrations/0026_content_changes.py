@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("slsl_backend", "0025_dump_fragments"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="dumpversion",
+            name="changes_pruned_through",
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name="ContentChange",
+            fields=[
+                ("sequence", models.BigAutoField(primary_key=True, serialize=False)),
+                ("table", models.CharField(max_length=64)),
+                ("object_id", models.PositiveBigIntegerField()),
+                ("entry_id", models.PositiveBigIntegerField(null=True)),
+                (
+                    "operation",
+                    models.CharField(
+                        choices=[
+                            ("CREATE", "Create"),
+                            ("UPDATE", "Update"),
+                            ("DELETE", "Delete"),
+                        ],
+                        max_length=16,
+                    ),
+                ),
+                ("dump_version", models.PositiveBigIntegerField()),
+                ("changed_at", models.DateTimeField()),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["table", "object_id"],
+                        name="slsl_backen_table_38eb17_idx",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,85 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:10
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("slsl_backend", "0026_content_changes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="video",
+            name="media_error",
+            field=models.TextField(blank=True, default="", editable=False),
+        ),
+        migrations.AddField(
+            model_name="video",
+            name="media_state",
+            field=models.CharField(
+                choices=[
+                    ("PENDING", "Pending"),
+                    ("READY", "Ready"),
+                    ("FAILED", "Failed"),
+                ],
+                default="READY",
+                editable=False,
+                max_length=16,
+            ),
+        ),
+        migrations.CreateModel(
+            name="MediaTask",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(choices=[("VALIDATE", "Validate")], max_length=16),
+                ),
+                (
+                    "state",
+                    models.CharField(
+                        choices=[
+                            ("QUEUED", "Queued"),
+                            ("RUNNING", "Running"),
+                            ("DONE", "Done"),
+                            ("FAILED", "Failed"),
+                        ],
+                        default="QUEUED",
+                        max_length=16,
+                    ),
+                ),
+                ("attempts", models.PositiveIntegerField(default=0)),
+                ("run_after", models.DateTimeField(default=django.utils.timezone.now)),
+                ("locked_until", models.DateTimeField(blank=True, null=True)),
+                ("error", models.TextField(blank=True, default="")),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "video",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="slsl_backend.video",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["state", "run_after"],
+                        name="slsl_backen_state_123d37_idx",
+                    )
+                ],
+            },
+        ),
+    ]
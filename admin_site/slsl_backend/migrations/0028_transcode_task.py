@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("slsl_backend", "0027_media_processing"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="mediatask",
+            name="kind",
+            field=models.CharField(
+                choices=[("VALIDATE", "Validate"), ("TRANSCODE", "Transcode")],
+                max_length=16,
+            ),
+        ),
+    ]
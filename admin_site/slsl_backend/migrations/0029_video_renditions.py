@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("slsl_backend", "0028_transcode_task"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="video",
+            name="renditions",
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AlterField(
+            model_name="mediatask",
+            name="kind",
+            field=models.CharField(
+                choices=[
+                    ("VALIDATE", "Validate"),
+                    ("TRANSCODE", "Transcode"),
+                    ("RENDITIONS", "Make renditions"),
+                ],
+                max_length=16,
+            ),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:49
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_media(apps, schema_editor):
+    """Record the videos' current media on the tasks queued before this.
+
+    Which media they were queued for wasn't kept, so they're taken to be for
+    what the video has now, which is what they'd have processed anyway.
+    """
+    MediaTask = apps.get_model("slsl_backend", "MediaTask")
+    Video = apps.get_model("slsl_backend", "Video")
+    db = schema_editor.connection.alias
+    MediaTask.objects.using(db).update(
+        media=Subquery(
+            Video.objects.using(db).filter(pk=OuterRef("video_id")).values("media")
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("slsl_backend", "0029_video_renditions"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="mediatask",
+            name="media",
+            field=models.CharField(default="", max_length=100),
+            preserve_default=False,
+        ),
+        migrations.RunPython(backfill_media, migrations.RunPython.noop),
+    ]
@@ -1,10 +1,12 @@
 import re
 
+from django.conf import settings
 from django.core.validators import FileExtensionValidator, RegexValidator
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
-from .validators import validate_media
+from .validators import VIDEO_EXTS, validate_media
 
 COMMA_SEPARATED_LIST_REGEX = re.compile(r"^(?!.*,$)([\w|\s]+(?:,\s*\w(\w|\s)*)*)?$")
 
@@ -12,7 +14,21 @@ COMMA_SEPARATED_LIST_REGEX = re.compile(r"^(?!.*,$)([\w|\s]+(?:,\s*\w(\w|\s)*)*)
 # at least one video.
 
 
-class Category(models.Model):
+# A model whose rows go into the dump. Saving one is atomic, so the signal
+# receivers' versioning and change log writes (see signals.py) commit together
+# with the row even under autocommit, e.g. in management commands and the shell.
+# Django already makes deletes and m2m changes atomic, but not saves.
+class DumpedModel(models.Model):
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        # No savepoint: inside a transaction already, this joins it.
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+
+
+class Category(DumpedModel):
     class Meta:
         verbose_name_plural = "categories"
         ordering = ["name"]
@@ -32,7 +48,7 @@ class EntryType(models.TextChoices):
 
 
 # This class defines a single entry, aka word.
-class Entry(models.Model):
+class Entry(DumpedModel):
     class Meta:
         verbose_name_plural = "entries"
         ordering = ["word_in_english"]
@@ -65,6 +81,12 @@ class Entry(models.Model):
     datetime_added = models.DateTimeField(auto_now_add=True)
     datetime_modified = models.DateTimeField(auto_now=True)
 
+    # The DumpVersion.version at which this entry's dumped content last changed,
+    # including changes to its sub-entries, videos, definitions and categories
+    # (which don't touch datetime_modified). Maintained by signals.py; the delta
+    # dump (/dump?since=<version>) returns entries newer than a given version.
+    dump_version = models.PositiveBigIntegerField(default=0, db_index=True)
+
     def __str__(self):
         out = self.word_in_english
         if self.word_in_tamil:
@@ -108,9 +130,17 @@ class VideoStatus(models.TextChoices):
     HISTORICAL = "HISTORICAL", _("Historical")
 
 
+# Whether a video's media has been through the background checks yet (see
+# media_queue.py). Only READY videos are dumped.
+class MediaState(models.TextChoices):
+    PENDING = "PENDING", _("Pending")
+    READY = "READY", _("Ready")
+    FAILED = "FAILED", _("Failed")
+
+
 # This links back to the Entry, implying there can be multiple SubEntries per Entry.
 # per SubEntry.
-class SubEntry(models.Model):
+class SubEntry(DumpedModel):
     class Meta:
         verbose_name_plural = "sub-entries"
         # Admin-controlled display order within an entry (drag-to-reorder in the
@@ -152,7 +182,7 @@ class SubEntry(models.Model):
 
 # This links back to the SubEntry, implying there can be multiple Videos per SubEntry.
 # Video is a legacy name, this can also contain images, e.g. for fingerspelling.
-class Video(models.Model):
+class Video(DumpedModel):
     class Meta:
         # Admin-controlled display order within a sub-entry (drag-to-reorder;
         # the dump emits videos in this order, so order 0 = the first/primary
@@ -203,21 +233,64 @@ class Video(models.Model):
     # Admin-authored free text shown in the source sheet's note card. Optional.
     note = models.TextField(blank=True, default="")
 
+    # With settings.PROCESS_MEDIA_IN_BACKGROUND, a new upload is saved as
+    # PENDING and checked afterwards by the process_media worker, which makes it
+    # READY or FAILED. Until it's READY the video is left out of the dump.
+    # Existing videos and images are READY.
+    media_state = models.CharField(
+        max_length=16,
+        choices=MediaState.choices,
+        default=MediaState.READY,
+        editable=False,
+    )
+
+    # Why the worker rejected the media, shown to admins. Empty unless FAILED.
+    media_error = models.TextField(blank=True, default="", editable=False)
+
+    # Smaller copies of the media made by the process_media worker once it's
+    # READY, for clients on slow connections (see media_queue.py): storage
+    # names by kind, "hls" for the HLS playlist and e.g. "240p" for an MP4,
+    # shortest height first. Empty until they've been made.
+    renditions = models.JSONField(default=dict, blank=True, editable=False)
+
     def save(self, *args, **kwargs):
-        # A newly-uploaded current video becomes the first (primary) video for
-        # its sub-entry: bump the existing videos down one so it sorts ahead of
-        # them (the dump orders by `order`, so 0 = first). Only on creation of a
-        # CURRENT video — editing an existing video, or reordering, is left to
-        # the admin's drag-to-reorder. (Reordering happens via the historical
-        # model in migrations and via nested_admin in the admin, neither of
-        # which is "adding", so they don't trip this.)
-        promote = self._state.adding and self.status == VideoStatus.CURRENT
-        if promote and self.sub_entry_id is not None:
-            Video.objects.filter(sub_entry_id=self.sub_entry_id).update(
-                order=models.F("order") + 1
+        # All of it in one transaction, not just the row (see DumpedModel).
+        with transaction.atomic(savepoint=False):
+            # A newly-uploaded current video becomes the first (primary) video for
+            # its sub-entry: bump the existing videos down one so it sorts ahead of
+            # them (the dump orders by `order`, so 0 = first). Only on creation of a
+            # CURRENT video — editing an existing video, or reordering, is left to
+            # the admin's drag-to-reorder. (Reordering happens via the historical
+            # model in migrations and via nested_admin in the admin, neither of
+            # which is "adding", so they don't trip this.)
+            promote = self._state.adding and self.status == VideoStatus.CURRENT
+            if promote and self.sub_entry_id is not None:
+                Video.objects.filter(sub_entry_id=self.sub_entry_id).update(
+                    order=models.F("order") + 1
+                )
+                self.order = 0
+            # The media is only uncommitted when a new file was just assigned (the
+            # FileField's pre_save uploads it).
+            uploaded = self.media and not self.media._committed
+            if uploaded:
+                # They were made from the old file.
+                self.renditions = {}
+            process = (
+                settings.VALIDATE_UPLOADED_MEDIA
+                and settings.PROCESS_MEDIA_IN_BACKGROUND
+                and uploaded
+                and self.media.name.lower().endswith(VIDEO_EXTS)
             )
-            self.order = 0
-        super().save(*args, **kwargs)
+            if process:
+                self.media_state = MediaState.PENDING
+                self.media_error = ""
+            super().save(*args, **kwargs)
+            if process:
+                # In the same transaction, so the video is never left pending with
+                # nothing queued to check it.
+                MediaTask.objects.create(
+                    video=self, kind=MediaTaskKind.VALIDATE, media=self.media.name
+                )
 
     def __str__(self):
         return f"Video"
@@ -227,7 +300,7 @@ class Video(models.Model):
 # category pair. This approach flattens the data as much as possible. In the various
 # frontends we can reorganize however we wish.
 # This links back to the SubEntry, implying there can be multiple Definitions per SubEntry.
-class Definition(models.Model):
+class Definition(DumpedModel):
     # Link back to the SubEntry.
     sub_entry = models.ForeignKey(SubEntry, on_delete=models.CASCADE)
 
@@ -262,3 +335,147 @@ class Definition(models.Model):
         text = " ".join((self.definition or "").split())
         label = f"{self.get_language_display()} · {self.get_category_display()}: {text}"
         return f"{label[:50]}…" if len(label) > 50 else label
+
+
+# A single row recording when the content that goes into the dump last changed.
+# Every save / delete of a dumped model bumps it (see signals.py), so any worker
+# process can tell with one cheap query whether its cached dump is still current.
+class DumpVersion(models.Model):
+    # Increases by one on every change to dumped content.
+    version = models.PositiveBigIntegerField(default=0)
+
+    # When the dumped content last changed. Served as the dump's Last-Modified.
+    changed_at = models.DateTimeField()
+
+    # The highest ContentChange.sequence that compact_change_log has pruned by
+    # age. Consumers that last saw an earlier sequence may have missed changes.
+    changes_pruned_through = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"Dump version {self.version} ({self.changed_at})"
+
+
+# A tombstone for an entry that left the dump: deleted, or renamed (the dump and
+# the apps key entries by their English word). The delta dump reports these so
+# clients can drop entries they already have.
+class DeletedEntry(models.Model):
+    class Meta:
+        verbose_name_plural = "deleted entries"
+
+    word_in_english = models.CharField(max_length=256)
+
+    # The DumpVersion.version at which the entry left the dump.
+    dump_version = models.PositiveBigIntegerField(db_index=True)
+
+    def __str__(self):
+        return f"{self.word_in_english} (deleted at version {self.dump_version})"
+
+
+# One entry as it appears in the JSON dump, pre-serialised. Refreshed whenever
+# the entry's dumped content changes (see dump_fragments.py), so the full dump
+# can be assembled by concatenating these in order rather than rebuilt.
+class DumpFragment(models.Model):
+    entry = models.OneToOneField(Entry, on_delete=models.CASCADE, primary_key=True)
+
+    # The Entry.dump_version this fragment was built at. If the entry's is newer,
+    # the fragment is stale.
+    dump_version = models.PositiveBigIntegerField()
+
+    # The entry serialised exactly as in the JSON dump, or null if the entry
+    # isn't in the dump (it has no videos).
+    content = models.TextField(null=True)
+
+    def __str__(self):
+        return f"Dump fragment of {self.entry_id} (version {self.dump_version})"
+
+
+class ChangeOperation(models.TextChoices):
+    CREATE = "CREATE", _("Create")
+    UPDATE = "UPDATE", _("Update")
+    DELETE = "DELETE", _("Delete")
+
+
+# An append-only log of every change to dumped content, written by the signal
+# receivers in the same transaction as the change (see signals.py and
+# changelog.py). Consumers remember the last sequence they saw and ask for the
+# changes after it, rather than assuming everything changed.
+class ContentChange(models.Model):
+    class Meta:
+        indexes = [models.Index(fields=["table", "object_id"])]
+
+    # Increases with every change, in the order the changes were logged.
+    sequence = models.BigAutoField(primary_key=True)
+
+    # The DB table of the changed row, e.g. "slsl_backend_video".
+    table = models.CharField(max_length=64)
+
+    # The primary key of the changed row. For the entry <-> category relation,
+    # the category's ID (the entry's is entry_id).
+    object_id = models.PositiveBigIntegerField()
+
+    # The ID of the entry the row belongs to, if any. Not a foreign key, since
+    # the entry may be gone.
+    entry_id = models.PositiveBigIntegerField(null=True)
+
+    operation = models.CharField(max_length=16, choices=ChangeOperation.choices)
+
+    # The DumpVersion.version the change was made at.
+    dump_version = models.PositiveBigIntegerField()
+
+    changed_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.sequence}: {self.operation} {self.table} {self.object_id}"
+
+
+class MediaTaskKind(models.TextChoices):
+    VALIDATE = "VALIDATE", _("Validate")
+    TRANSCODE = "TRANSCODE", _("Transcode")
+    RENDITIONS = "RENDITIONS", _("Make renditions")
+
+
+class MediaTaskState(models.TextChoices):
+    QUEUED = "QUEUED", _("Queued")
+    RUNNING = "RUNNING", _("Running")
+    DONE = "DONE", _("Done")
+    FAILED = "FAILED", _("Failed")
+
+
+# A job for the process_media worker, queued in the DB rather than a separate
+# broker (see media_queue.py).
+class MediaTask(models.Model):
+    class Meta:
+        indexes = [models.Index(fields=["state", "run_after"])]
+
+    video = models.ForeignKey(Video, on_delete=models.CASCADE)
+
+    kind = models.CharField(max_length=16, choices=MediaTaskKind.choices)
+
+    # The name of the media the task was queued for. If the video has other
+    # media by the time the task runs, e.g. because an admin uploaded another
+    # file, the task is skipped: the new file was queued for tasks of its own.
+    media = models.CharField(max_length=100)
+
+    state = models.CharField(
+        max_length=16,
+        choices=MediaTaskState.choices,
+        default=MediaTaskState.QUEUED,
+    )
+
+    # How many times a worker has claimed the task, including the current run.
+    attempts = models.PositiveIntegerField(default=0)
+
+    # A QUEUED task isn't claimed before this, so failed runs back off.
+    run_after = models.DateTimeField(default=timezone.now)
+
+    # While RUNNING, when the worker's claim expires. A task still RUNNING after
+    # that was left behind by a worker that died, and is claimed again.
+    locked_until = models.DateTimeField(null=True, blank=True)
+
+    # The last run's error, if it failed.
+    error = models.TextField(blank=True, default="")
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.get_kind_display()} video {self.video_id} ({self.state})"
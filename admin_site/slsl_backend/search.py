@@ -0,0 +1,201 @@
+"""Server-side search over entries, for clients that don't have the whole dump.
+
+Matches the query against the English, Sinhala and Tamil headwords, the
+sub-entries' related words and the definitions, and ranks the matching entries.
+Only entries that are in the dump (i.e. have at least one video) are returned,
+and only what's in the dump counts: related words and definitions only match in
+sub-entries with a video.
+
+On Postgres this uses the trigram and full-text indexes from migration 0024:
+headwords and related words match by trigram word similarity, so typos and
+partial words still match, and definitions match by full-text search. Elsewhere
+(SQLite in dev) it falls back to case-insensitive substring matches.
+"""
+
+import dataclasses
+import logging
+
+from django.db import connection
+from django.db.models import Q
+
+from . import models
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+# Longer queries are rejected rather than searched, they're not headwords.
+MAX_QUERY_LENGTH = 100
+
+HEADWORD_FIELDS = ["word_in_english", "word_in_sinhala", "word_in_tamil"]
+
+# How much a match in each field counts towards an entry's score, which is the
+# best weighted score over everything it matched. Headwords outrank the looser
+# related words, which outrank words buried in a definition.
+FIELD_WEIGHTS = {
+    "word_in_english": 1.0,
+    "word_in_sinhala": 1.0,
+    "word_in_tamil": 1.0,
+    "related_words": 0.6,
+    "definition": 0.4,
+}
+
+
+@dataclasses.dataclass
+class SearchResult:
+    entry_id: int
+    word_in_english: str
+    # Between 0 and 1, higher is better.
+    score: float
+    # The fields the query matched, e.g. ["word_in_english", "definition"].
+    matched: list
+
+
+def search_entries(query, limit=DEFAULT_LIMIT):
+    """Return up to `limit` SearchResults for `query`, best first."""
+    if connection.vendor == "postgresql":
+        results = _search_postgres(query, limit)
+    else:
+        results = _search_simple(query, limit)
+    LOG.info(f"Search for {query!r} found {len(results)} entries")
+    return results
+
+
+def _search_postgres(query, limit):
+    entry = connection.ops.quote_name(models.Entry._meta.db_table)
+    sub_entry = connection.ops.quote_name(models.SubEntry._meta.db_table)
+    video = connection.ops.quote_name(models.Video._meta.db_table)
+    definition = connection.ops.quote_name(models.Definition._meta.db_table)
+
+    # `q <% field` is the index-backed form of word_similarity(q, field) >
+    # pg_trgm.word_similarity_threshold, i.e. q is similar to some part of field.
+    # ts_rank's normalization 32 scales ranks into 0-1.
+    headword_matches = " UNION ALL ".join(
+        f"""
+        SELECT e.id AS entry_id, '{field}' AS field,
+            word_similarity(%(query)s, e.{field}) AS score
+        FROM {entry} e
+        WHERE %(query)s <%% e.{field}
+        """
+        for field in HEADWORD_FIELDS
+    )
+    weights = " ".join(
+        f"WHEN '{field}' THEN {weight}" for field, weight in FIELD_WEIGHTS.items()
+    )
+    # Sub-entries without a ready video are left out of the dump.
+    has_ready_video = f"""
+        EXISTS (
+            SELECT 1 FROM {video} v
+            WHERE v.sub_entry_id = s.id
+                AND v.media_state = '{models.MediaState.READY.value}'
+        )
+    """
+    sql = f"""
+        WITH matches AS (
+            {headword_matches}
+            UNION ALL
+            SELECT s.entry_id, 'related_words',
+                word_similarity(%(query)s, s.related_words)
+            FROM {sub_entry} s
+            WHERE %(query)s <%% s.related_words AND {has_ready_video}
+            UNION ALL
+            SELECT s.entry_id, 'definition', ts_rank(
+                to_tsvector('simple', d.definition),
+                websearch_to_tsquery('simple', %(query)s),
+                32
+            )
+            FROM {definition} d
+            JOIN {sub_entry} s ON s.id = d.sub_entry_id
+            WHERE to_tsvector('simple', d.definition)
+                @@ websearch_to_tsquery('simple', %(query)s)
+                AND {has_ready_video}
+        )
+        SELECT e.id, e.word_in_english,
+            max(m.score * CASE m.field {weights} END) AS score,
+            array_agg(DISTINCT m.field ORDER BY m.field) AS matched
+        FROM matches m
+        JOIN {entry} e ON e.id = m.entry_id
+        WHERE EXISTS (
+            SELECT 1 FROM {sub_entry} s WHERE s.entry_id = e.id AND {has_ready_video}
+        )
+        GROUP BY e.id, e.word_in_english
+        ORDER BY score DESC, e.word_in_english, e.id
+        LIMIT %(limit)s
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, {"query": query, "limit": limit})
+        return [
+            SearchResult(
+                entry_id=entry_id,
+                word_in_english=word_in_english,
+                score=round(score, 4),
+                matched=list(matched),
+            )
+            for entry_id, word_in_english, score, matched in cursor.fetchall()
+        ]
+
+
+def _search_simple(query, limit):
+    # Substring matches only, scored by how much of the field the query covers:
+    # an exact match scores 1, a prefix match 0.9 and anything else 0.7.
+    def score(value):
+        value = (value or "").lower()
+        if value == query.lower():
+            return 1.0
+        if value.startswith(query.lower()):
+            return 0.9
+        return 0.7
+
+    dumped = models.Entry.objects.filter(
+        subentry__video__media_state=models.MediaState.READY
+    )
+    # Filtered from the sub-entry's side, since filtering `dumped` by its
+    # sub-entries again would join any of them, not the ones with a video.
+    dumped_sub_entries = models.SubEntry.objects.filter(
+        video__media_state=models.MediaState.READY
+    )
+    scores = {}
+    words = {}
+
+    def add(entry_id, word_in_english, field, field_score):
+        words[entry_id] = word_in_english
+        best, matched = scores.get(entry_id, (0.0, set()))
+        matched.add(field)
+        scores[entry_id] = (max(best, field_score * FIELD_WEIGHTS[field]), matched)
+
+    headword_filter = Q()
+    for field in HEADWORD_FIELDS:
+        headword_filter |= Q(**{f"{field}__icontains": query})
+    for row in dumped.filter(headword_filter).values("id", *HEADWORD_FIELDS).distinct():
+        for field in HEADWORD_FIELDS:
+            if query.lower() in (row[field] or "").lower():
+                add(row["id"], row["word_in_english"], field, score(row[field]))
+
+    for entry_id, word_in_english, related_words in (
+        dumped_sub_entries.filter(related_words__icontains=query)
+        .values_list("entry_id", "entry__word_in_english", "related_words")
+        .distinct()
+    ):
+        if query.lower() in (related_words or "").lower():
+            add(entry_id, word_in_english, "related_words", score(related_words))
+
+    for entry_id, word_in_english in (
+        dumped_sub_entries.filter(definition__definition__icontains=query)
+        .values_list("entry_id", "entry__word_in_english")
+        .distinct()
+    ):
+        add(entry_id, word_in_english, "definition", 0.7)
+
+    ranked = sorted(
+        scores.items(), key=lambda item: (-item[1][0], words[item[0]], item[0])
+    )
+    return [
+        SearchResult(
+            entry_id=entry_id,
+            word_in_english=words[entry_id],
+            score=round(best, 4),
+            matched=sorted(matched),
+        )
+        for entry_id, (best, matched) in ranked[:limit]
+    ]
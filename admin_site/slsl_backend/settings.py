@@ -42,7 +42,7 @@ if deployment_mode == "prod":
 if deployment_mode == "dev":
     DEBUG = True
 
-# Whether to run the ffprobe codec/corruption validation on uploaded videos
+# Whether to run the codec/corruption validation on uploaded videos
 # (see slsl_backend.validators). Off in dev by default: local dev runs against
 # the prod media *filenames* (which aren't on the local disk), so saving an
 # entry would re-validate an existing video and crash trying to open a file
@@ -50,6 +50,90 @@ if deployment_mode == "dev":
 # `validate_media` secret.
 VALIDATE_UPLOADED_MEDIA = bool(secrets.get("validate_media", deployment_mode == "prod"))
 
+# Whether that validation also runs ffprobe on each upload, as a cross-check of
+# the in-process MP4 probe (see slsl_backend.video_probe) that does it without
+# spawning a process. Override via the `validate_with_ffprobe` secret.
+VALIDATE_WITH_FFPROBE = bool(secrets.get("validate_with_ffprobe", False))
+
+# Whether that validation happens after the upload rather than during the admin
+# save. New uploads are then saved as pending and checked by the process_media
+# worker (see slsl_backend.media_queue), and are left out of the dump until they
+# pass. Off by default: the worker needs CPU allocated all the time, which the
+# Cloud Run service (throttled outside requests, scaled to zero) doesn't have,
+# so it has to run on its own (`run.sh <port> prod worker`). Turn it on via the
+# `process_media_in_background` secret once that's deployed.
+PROCESS_MEDIA_IN_BACKGROUND = bool(secrets.get("process_media_in_background", False))
+
+# Whether the process_media worker re-encodes uploads the apps can't decode
+# (e.g. 10-bit 4:2:2 exports) to 8-bit 4:2:0 H.264 itself, rather than failing
+# them and leaving admins to re-encode and re-upload. Needs ffmpeg, which the
+# Docker image has. Off by default: each re-encode takes most of the worker's
+# CPUs for minutes, so only turn it on where the worker has CPUs of its own.
+# Override via the `transcode_undecodable_media` secret.
+TRANSCODE_UNDECODABLE_MEDIA = bool(secrets.get("transcode_undecodable_media", False))
+
+# Whether the process_media worker also makes smaller renditions of every video,
+# and an HLS playlist of them, for clients on slow connections (see
+# slsl_backend.media_queue). Needs ffmpeg too, and like transcoding, is off by
+# default since it's up to three more encodes per upload. Override via the
+# `media_renditions` secret.
+MEDIA_RENDITIONS = bool(secrets.get("media_renditions", False))
+
+# Whether /dump streams its JSON entry by entry (see dump.iter_dump_json) rather
+# than building the whole ~16 MB document in memory first. The bytes are the
+# same either way; streaming just keeps two overlapping dumps from blowing the
+# Cloud Run memory limit. Set the `stream_dump` secret to false to go back to
+# the in-memory build.
+STREAM_DUMP = bool(secrets.get("stream_dump", True))
+
+# Whether /dump serves a cached copy of the dump, rebuilt only when dumped
+# content changes (see dump_cache.py), with ETag / Last-Modified so clients get
+# a 304 when they're already up to date. Takes precedence over STREAM_DUMP: the
+# whole dump has to be built before its ETag is known. With DUMP_FILE_DIR set
+# (the default) it's streamed to disk as it's built, so memory stays bounded as
+# with STREAM_DUMP; without it, each worker holds the whole dump and its gzip and
+# brotli copies in memory.
+CACHE_DUMP = bool(secrets.get("cache_dump", True))
+
+# How the dump is built (see dump.DUMP_ENGINES). "postgres" has the DB build each
+# entry's JSON, rather than sending every row over to be shaped in Python, which
+# is a lot less work for both sides. "parallel" builds in Python, but runs the
+# queries of a full build at once, on separate connections reading the same
+# snapshot, so it waits on the slowest query rather than on every round trip in
+# turn. On SQLite (dev) both fall back to "python". All give the same output,
+# which the tests check against Postgres in CI (see tests/test_dump_engines.py);
+# run `manage.py check_dump_engines` to confirm it against a real DB too.
+# Override via the `dump_engine` secret.
+DUMP_ENGINE = secrets.get("dump_engine", "postgres")
+
+# How many full dumps can be built at once, across every worker process (see
+# dump_builds.py). Requests beyond that get the last dump built, or a 503 with
+# Retry-After, rather than piling more builds onto the small Cloud SQL instance.
+# Override via the `dump_build_concurrency` secret.
+DUMP_BUILD_CONCURRENCY = int(secrets.get("dump_build_concurrency", 1))
+
+# Every dump build logs the wall time, queries and rows of each of its stages
+# (see dump_profile.py). Set the `dump_trace_memory` secret to also record each
+# stage's peak memory with tracemalloc, which makes the build several times
+# slower.
+DUMP_TRACE_MEMORY = bool(secrets.get("dump_trace_memory", False))
+
+# Whether /dump also returns those stats in a Server-Timing header. On in dev by
+# default. Override via the `dump_timing_header` secret.
+DUMP_TIMING_HEADER = bool(secrets.get("dump_timing_header", deployment_mode == "dev"))
+
+# Whether every entry's dump JSON is kept pre-serialised in the DumpFragment
+# table, refreshed when the entry changes, so the full JSON dump is assembled by
+# concatenating fragments rather than rebuilt from scratch (see
+# dump_fragments.py). Override via the `dump_fragments` secret.
+DUMP_FRAGMENTS = bool(secrets.get("dump_fragments", True))
+
+# Where cached dumps are kept, so every worker process shares one copy rather
+# than each building and holding its own (see dump_files.py). The default is
+# under the gunicorn worker tmp dir run.sh makes. Set the `dump_file_dir` secret
+# to "" to keep them in each worker's memory instead.
+DUMP_FILE_DIR = secrets.get("dump_file_dir", "/tmp/slsl_workers/dumps")
+
 
 ###########################################################
 # The following stuff is generic to all deployment modes. #
@@ -0,0 +1,237 @@
+"""Signal receivers that track changes to the content that goes into the dump.
+
+Anything the dump reads — entries, sub-entries, videos, definitions, categories
+and the entry <-> category relation — bumps the DumpVersion row when it is saved
+or deleted, and stamps the entries it belongs to with the new version (see
+Entry.dump_version). Entries that leave the dump get a DeletedEntry tombstone.
+The writes happen inside the same transaction as the change, so a rolled-back
+admin save doesn't invalidate anything. Each change is also logged, row by row,
+to the change log (see changelog.py). Saves of the dumped models are atomic for
+this (see models.DumpedModel), as are Django's deletes and m2m changes.
+
+Note that QuerySet.update() and bulk_create() don't send these signals. Code
+that changes dumped content that way must call mark_dump_changed() itself, and
+log the changed rows with changelog.record_changes(), all in one transaction.
+Both refuse to run outside of one.
+"""
+
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import models
+from .changelog import ENTRY_CATEGORIES_TABLE, record_changes
+from .dump_fragments import schedule_refresh
+from .models import ChangeOperation
+
+
+def mark_dump_changed(entry_ids=()):
+    """Bump DumpVersion and stamp the given entries with the new version.
+
+    `entry_ids` can be a list of Entry IDs or a queryset of them. Returns the
+    new version. The stamped entries' dump fragments are refreshed once the
+    change commits (see dump_fragments.py).
+
+    Must be called in the transaction making the change, so the two commit
+    together: raises RuntimeError outside of one.
+    """
+    if not transaction.get_connection().in_atomic_block:
+        raise RuntimeError("Dumped content must be changed in a transaction")
+    entry_ids = list(entry_ids)
+    now = timezone.now()
+    # The UPDATE holds the row lock until the surrounding transaction commits,
+    # so concurrent changes are versioned in commit order.
+    updated = models.DumpVersion.objects.filter(pk=1).update(
+        version=F("version") + 1, changed_at=now
+    )
+    if not updated:
+        models.DumpVersion.objects.get_or_create(
+            pk=1, defaults={"version": 1, "changed_at": now}
+        )
+    version = models.DumpVersion.objects.values_list("version", flat=True).get(pk=1)
+    models.Entry.objects.filter(pk__in=entry_ids).update(dump_version=version)
+    schedule_refresh(entry_ids)
+    return version
+
+
+def _entry_of_sub_entry(sub_entry_id):
+    return (
+        models.SubEntry.objects.filter(pk=sub_entry_id)
+        .values_list("entry_id", flat=True)
+        .first()
+    )
+
+
+def _operation(kwargs):
+    # post_save passes created, post_delete doesn't.
+    if "created" not in kwargs:
+        return ChangeOperation.DELETE
+    return ChangeOperation.CREATE if kwargs["created"] else ChangeOperation.UPDATE
+
+
+def _record_change(version, instance, entry_id, operation):
+    record_changes(
+        version, [(instance._meta.db_table, instance.pk, entry_id, operation)]
+    )
+
+
+@receiver(pre_save, sender=models.Entry)
+def _on_entry_pre_save(sender, instance, **kwargs):
+    # Clients key entries by their English word, so a rename deletes the entry
+    # under its old word. Remember that word for the post_save receiver.
+    instance._dump_renamed_from = None
+    if instance.pk is None:
+        return
+    old_word = (
+        models.Entry.objects.filter(pk=instance.pk)
+        .values_list("word_in_english", flat=True)
+        .first()
+    )
+    if old_word is not None and old_word != instance.word_in_english:
+        instance._dump_renamed_from = old_word
+
+
+@receiver(post_save, sender=models.Entry)
+def _on_entry_saved(sender, instance, **kwargs):
+    version = mark_dump_changed([instance.pk])
+    _record_change(version, instance, instance.pk, _operation(kwargs))
+    renamed_from = getattr(instance, "_dump_renamed_from", None)
+    if renamed_from:
+        models.DeletedEntry.objects.create(
+            word_in_english=renamed_from, dump_version=version
+        )
+
+
+@receiver(pre_delete, sender=models.Entry)
+def _on_entry_pre_delete(sender, instance, **kwargs):
+    # The relations to its categories go with the entry, without an m2m_changed
+    # signal, so remember them for the change log.
+    instance._dump_category_ids = list(instance.categories.values_list("id", flat=True))
+
+
+@receiver(post_delete, sender=models.Entry)
+def _on_entry_deleted(sender, instance, **kwargs):
+    version = mark_dump_changed()
+    models.DeletedEntry.objects.create(
+        word_in_english=instance.word_in_english, dump_version=version
+    )
+    record_changes(
+        version,
+        [
+            (ENTRY_CATEGORIES_TABLE, category_id, instance.pk, ChangeOperation.DELETE)
+            for category_id in getattr(instance, "_dump_category_ids", [])
+        ]
+        + [(sender._meta.db_table, instance.pk, instance.pk, ChangeOperation.DELETE)],
+    )
+
+
+@receiver(post_save, sender=models.SubEntry)
+@receiver(post_delete, sender=models.SubEntry)
+def _on_sub_entry_changed(sender, instance, **kwargs):
+    version = mark_dump_changed([instance.entry_id])
+    _record_change(version, instance, instance.entry_id, _operation(kwargs))
+
+
+# When a whole sub-entry or entry is deleted the cascaded videos / definitions
+# may find no entry to stamp here; the parent's own receiver covers that.
+@receiver(post_save, sender=models.Video)
+@receiver(post_delete, sender=models.Video)
+@receiver(post_save, sender=models.Definition)
+@receiver(post_delete, sender=models.Definition)
+def _on_sub_entry_child_changed(sender, instance, **kwargs):
+    entry_id = _entry_of_sub_entry(instance.sub_entry_id)
+    version = mark_dump_changed([entry_id] if entry_id is not None else [])
+    operation = _operation(kwargs)
+    _record_change(version, instance, entry_id, operation)
+    if (
+        sender is models.Video
+        and operation == ChangeOperation.CREATE
+        and instance.status == models.VideoStatus.CURRENT
+    ):
+        # Video.save moved the sub-entry's other videos down one with an
+        # update(), which sends no signals.
+        siblings = models.Video.objects.filter(
+            sub_entry_id=instance.sub_entry_id
+        ).exclude(pk=instance.pk)
+        record_changes(
+            version,
+            [
+                (sender._meta.db_table, video_id, entry_id, ChangeOperation.UPDATE)
+                for video_id in siblings.values_list("id", flat=True)
+            ],
+        )
+
+
+@receiver(post_save, sender=models.Category)
+def _on_category_saved(sender, instance, **kwargs):
+    # Entries carry category names, so a rename changes every entry in it.
+    version = mark_dump_changed(
+        models.Entry.objects.filter(categories=instance).values_list("id", flat=True)
+    )
+    _record_change(version, instance, None, _operation(kwargs))
+
+
+@receiver(pre_delete, sender=models.Category)
+def _on_category_deleted(sender, instance, **kwargs):
+    # pre_delete, since by post_delete the relations to the entries are gone.
+    entry_ids = list(
+        models.Entry.objects.filter(categories=instance).values_list("id", flat=True)
+    )
+    version = mark_dump_changed(entry_ids)
+    # The relations to the entries go with the category, without an
+    # m2m_changed signal.
+    record_changes(
+        version,
+        [
+            (ENTRY_CATEGORIES_TABLE, instance.pk, entry_id, ChangeOperation.DELETE)
+            for entry_id in entry_ids
+        ]
+        + [(sender._meta.db_table, instance.pk, None, ChangeOperation.DELETE)],
+    )
+
+
+def _relation_changes(pairs, action):
+    # pairs are (entry ID, category ID).
+    operation = (
+        ChangeOperation.CREATE if action == "post_add" else ChangeOperation.DELETE
+    )
+    return [
+        (ENTRY_CATEGORIES_TABLE, category_id, entry_id, operation)
+        for entry_id, category_id in pairs
+    ]
+
+
+@receiver(m2m_changed, sender=models.Entry.categories.through)
+def _on_categories_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        # instance is the Entry whose categories changed.
+        if action == "pre_clear":
+            # Which categories were cleared isn't passed to post_clear.
+            instance._dump_cleared_category_ids = list(
+                instance.categories.values_list("id", flat=True)
+            )
+        elif action in ("post_add", "post_remove", "post_clear"):
+            version = mark_dump_changed([instance.pk])
+            if action == "post_clear":
+                pk_set = getattr(instance, "_dump_cleared_category_ids", [])
+            pairs = [(instance.pk, category_id) for category_id in pk_set]
+            record_changes(version, _relation_changes(pairs, action))
+        return
+    # instance is a Category whose entries changed.
+    if action in ("post_add", "post_remove"):
+        entry_ids = list(pk_set)
+    elif action == "pre_clear":
+        entry_ids = list(instance.entry_set.values_list("id", flat=True))
+    else:
+        return
+    version = mark_dump_changed(entry_ids)
+    pairs = [(entry_id, instance.pk) for entry_id in entry_ids]
+    record_changes(version, _relation_changes(pairs, action))
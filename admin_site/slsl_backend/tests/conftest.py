@@ -0,0 +1,46 @@
+"""Fixtures shared by the tests, which run with plain pytest from admin_site/:
+
+    uv run pytest
+
+Tests that use the DB get a throwaway test database, the same one the Django
+test runner (and benchmark_dump) would create, so the configured DB is never
+touched. For SQLite that is an in-memory DB, and with Postgres configured the
+tests that need it run too.
+"""
+
+import os
+import random
+
+import django
+import pytest
+from django.db import connection, transaction
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "slsl_backend.settings")
+django.setup()
+
+
+@pytest.fixture(scope="session")
+def django_db():
+    old_name = connection.settings_dict["NAME"]
+    setup_test_environment()
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    yield
+    connection.creation.destroy_test_db(old_name, verbosity=0)
+    teardown_test_environment()
+
+
+@pytest.fixture
+def db(django_db):
+    """Run the test in a transaction, rolled back afterwards."""
+    with transaction.atomic():
+        yield
+        transaction.set_rollback(True)
+
+
+@pytest.fixture
+def seeded(db):
+    """Seed synthetic entries like the real data (see benchmark_dump)."""
+    from slsl_backend.management.commands.benchmark_dump import seed_data
+
+    return seed_data(200, random.Random(0))
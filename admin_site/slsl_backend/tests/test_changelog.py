@@ -0,0 +1,24 @@
+import pytest
+
+from slsl_backend import models
+from slsl_backend.changelog import record_changes
+from slsl_backend.signals import mark_dump_changed
+
+
+def test_a_change_is_not_saved_without_its_log(django_db, monkeypatch):
+    # Under autocommit, as in a management command.
+    def fail(*args, **kwargs):
+        raise RuntimeError("Failed to write the change log")
+
+    monkeypatch.setattr(models.ContentChange.objects, "bulk_create", fail)
+
+    with pytest.raises(RuntimeError, match="change log"):
+        models.Entry.objects.create(word_in_english="Unlogged")
+    assert not models.Entry.objects.filter(word_in_english="Unlogged").exists()
+
+
+def test_refuses_to_log_outside_a_transaction(django_db):
+    with pytest.raises(RuntimeError):
+        mark_dump_changed()
+    with pytest.raises(RuntimeError):
+        record_changes(1, [])
@@ -0,0 +1,44 @@
+import io
+import random
+
+import pytest
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, transaction
+
+from slsl_backend import models
+from slsl_backend.management.commands.benchmark_dump import seed_data
+
+
+@pytest.fixture
+def committed_seed(django_db):
+    """Seed data that other connections can see, i.e. committed.
+
+    The parallel engine reads its rows on other connections, so the data can't
+    be rolled back as with the `db` fixture: it's deleted afterwards instead.
+    """
+    if connection.vendor != "postgresql":
+        pytest.skip("Every dump engine is the Python one on SQLite")
+    with transaction.atomic():
+        seed_data(200, random.Random(0))
+        # Give the filters for videos something to tell apart.
+        videos = models.Video.objects.order_by("id")
+        videos.filter(id__in=list(videos.values_list("id", flat=True)[::3])).update(
+            renditions={"240p": "renditions/240p.mp4", "hls": "renditions/index.m3u8"}
+        )
+        videos.filter(id=videos[1].id).update(media_state=models.MediaState.PENDING)
+    yield
+    with transaction.atomic():
+        models.Entry.objects.all().delete()
+        models.Category.objects.all().delete()
+        models.DeletedEntry.objects.all().delete()
+        models.DumpFragment.objects.all().delete()
+        models.ContentChange.objects.all().delete()
+
+
+def test_every_engine_builds_the_same_dump(committed_seed):
+    stderr = io.StringIO()
+    try:
+        call_command("check_dump_engines", stdout=io.StringIO(), stderr=stderr)
+    except CommandError:
+        pytest.fail(stderr.getvalue())
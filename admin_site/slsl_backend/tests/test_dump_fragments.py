@@ -0,0 +1,74 @@
+from django.db import transaction
+from django.db.models import F
+from django.test import TestCase
+
+from slsl_backend import dump_fragments, models
+from slsl_backend.dump_fragments import (
+    fragment_content,
+    refresh_stale_fragments,
+    stale_entries,
+)
+
+
+def count_refreshes(monkeypatch):
+    refreshes = []
+    refresh_fragments = dump_fragments.refresh_fragments
+
+    def counting(entries, **kwargs):
+        refreshes.append(set(entries.values_list("id", flat=True)))
+        return refresh_fragments(entries, **kwargs)
+
+    monkeypatch.setattr(dump_fragments, "refresh_fragments", counting)
+    return refreshes
+
+
+def test_refreshes_only_the_changed_entries_on_commit(seeded, monkeypatch):
+    refresh_stale_fragments()
+    sub_entry = models.SubEntry.objects.order_by("id").first()
+    # Stale, but unchanged as far as the signals know.
+    other = models.Entry.objects.exclude(pk=sub_entry.entry_id).order_by("id")[0]
+    models.Entry.objects.filter(pk=other.pk).update(dump_version=F("dump_version") + 1)
+    refreshes = count_refreshes(monkeypatch)
+
+    with TestCase.captureOnCommitCallbacks(execute=True):
+        sub_entry.save()
+        models.Entry.objects.get(pk=sub_entry.entry_id).save()
+
+    # Once, and not of the entry that only went stale.
+    [refreshed] = refreshes
+    assert sub_entry.entry_id in refreshed
+    assert other.pk not in refreshed
+    assert list(stale_entries()) == [other]
+
+
+def test_refreshes_changes_made_after_a_rolled_back_savepoint(seeded, monkeypatch):
+    refresh_stale_fragments()
+    first, second = models.Entry.objects.order_by("id")[:2]
+    refreshes = count_refreshes(monkeypatch)
+
+    with TestCase.captureOnCommitCallbacks(execute=True):
+        try:
+            with transaction.atomic():
+                first.save()
+                raise RuntimeError("Rolled back")
+        except RuntimeError:
+            pass
+        second.save()
+
+    # The first entry's hook went with the savepoint, but not its ID.
+    [refreshed] = refreshes
+    assert {first.pk, second.pk} <= refreshed
+    assert not stale_entries().exists()
+
+
+def test_refreshes_every_entry_in_a_renamed_category(seeded):
+    refresh_stale_fragments()
+    category = models.Category.objects.filter(entry__isnull=False).first()
+    entry = category.entry_set.first()
+
+    with TestCase.captureOnCommitCallbacks(execute=True):
+        category.name = "Renamed category"
+        category.save()
+
+    assert not stale_entries().exists()
+    assert '"Renamed category"' in fragment_content(entry.pk)
@@ -0,0 +1,50 @@
+import collections
+import json
+
+import msgpack
+
+from slsl_backend import models
+from slsl_backend.dump import build_dump, serialise_dump
+from slsl_backend.dump_msgpack import (
+    EXT_DEFINE,
+    EXT_REF,
+    decode_msgpack_dump,
+    iter_dump_msgpack,
+)
+
+
+def _ext_codes(data):
+    """Count the interned strings in `data`, by ext type and index size."""
+    codes = collections.Counter()
+
+    def ext_hook(code, payload):
+        codes[code, len(payload) if code == EXT_REF else None] += 1
+        return msgpack.ExtType(code, payload)
+
+    unpacker = msgpack.Unpacker(ext_hook=ext_hook, raw=False, strict_map_key=False)
+    unpacker.feed(data)
+    list(unpacker)
+    return codes
+
+
+def test_round_trips_to_the_json_dump(seeded):
+    data = b"".join(iter_dump_msgpack())
+
+    assert decode_msgpack_dump(data) == json.loads(serialise_dump(build_dump()["data"]))
+    codes = _ext_codes(data)
+    assert codes[EXT_DEFINE, None]
+    assert codes[EXT_REF, 1]
+
+
+def test_round_trips_with_wide_string_indexes(seeded):
+    # Enough category names that later ones are referred to by 2 byte indexes.
+    categories = models.Category.objects.bulk_create(
+        models.Category(name=f"Wide category {i}") for i in range(300)
+    )
+    entry = models.Entry.objects.order_by("id").first()
+    entry.categories.add(*categories)
+    models.Entry.objects.order_by("id")[1].categories.add(*categories)
+    data = b"".join(iter_dump_msgpack())
+
+    assert decode_msgpack_dump(data) == json.loads(serialise_dump(build_dump()["data"]))
+    assert _ext_codes(data)[EXT_REF, 2]
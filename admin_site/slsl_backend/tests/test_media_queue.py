@@ -0,0 +1,256 @@
+import datetime
+
+import pytest
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.test import override_settings
+from django.utils import timezone
+
+from slsl_backend import media_queue, models
+from slsl_backend.dump import build_dump_models
+from slsl_backend.media_queue import (
+    MAX_ATTEMPTS,
+    RETRY_BACKOFF,
+    STUCK_AFTER,
+    claim_task,
+    run_task,
+    stuck_videos,
+)
+
+from .test_video_probe import avcc, mp4, sample_entry
+
+
+@pytest.fixture
+def background(tmp_path):
+    """Check uploads in the background, keeping them under tmp_path."""
+    with override_settings(
+        VALIDATE_UPLOADED_MEDIA=True,
+        VALIDATE_WITH_FFPROBE=False,
+        PROCESS_MEDIA_IN_BACKGROUND=True,
+        TRANSCODE_UNDECODABLE_MEDIA=False,
+        MEDIA_RENDITIONS=False,
+        MEDIA_ROOT=str(tmp_path),
+    ):
+        yield
+
+
+def upload(sub_entry, data, name="upload.mp4"):
+    video = models.Video(sub_entry=sub_entry, media=ContentFile(data, name=name))
+    video.save()
+    return video
+
+
+def dumped_videos():
+    return {
+        video if isinstance(video, str) else video["video"]
+        for entry in build_dump_models()
+        for sub_entry in entry["sub_entries"]
+        for video in sub_entry["videos"]
+    }
+
+
+def queue_task(kind=models.MediaTaskKind.VALIDATE):
+    video = models.Video.objects.order_by("pk").first()
+    models.Video.objects.filter(pk=video.pk).update(
+        media_state=models.MediaState.PENDING
+    )
+    return models.MediaTask.objects.create(
+        video=video, kind=kind, media=video.media.name
+    )
+
+
+def test_an_upload_is_queued_to_be_checked(seeded, background):
+    sub_entry = models.SubEntry.objects.order_by("pk").first()
+
+    video = upload(sub_entry, b"not checked yet")
+
+    video.refresh_from_db()
+    assert video.media_state == models.MediaState.PENDING
+    task = models.MediaTask.objects.get(video=video)
+    assert (task.kind, task.state) == (
+        models.MediaTaskKind.VALIDATE,
+        models.MediaTaskState.QUEUED,
+    )
+    assert video.media.name not in dumped_videos()
+
+
+def test_an_upload_is_not_saved_without_its_task(django_db, background, monkeypatch):
+    # Under autocommit, as in a management command.
+    entry = models.Entry.objects.create(word_in_english="Unqueued")
+    sub_entry = models.SubEntry.objects.create(entry=entry)
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("Failed to queue the task")
+
+    monkeypatch.setattr(models.MediaTask.objects, "create", fail)
+
+    try:
+        with pytest.raises(RuntimeError, match="queue"):
+            upload(sub_entry, b"never queued")
+        assert not models.Video.objects.filter(sub_entry=sub_entry).exists()
+    finally:
+        with transaction.atomic():
+            entry.delete()
+            models.DeletedEntry.objects.filter(word_in_english="Unqueued").delete()
+            models.ContentChange.objects.filter(entry_id=entry.pk).delete()
+
+
+def test_the_worker_makes_a_good_upload_ready(seeded, background):
+    sub_entry = models.SubEntry.objects.order_by("pk").first()
+    video = upload(sub_entry, mp4(sample_entry(b"avc1", avcc())))
+
+    task = claim_task()
+    assert task.video == video
+    assert run_task(task) == models.MediaTaskState.DONE
+
+    video.refresh_from_db()
+    assert video.media_state == models.MediaState.READY
+    assert video.media.name in dumped_videos()
+    assert claim_task() is None
+
+
+def test_the_worker_fails_an_undecodable_upload(seeded, background):
+    sub_entry = models.SubEntry.objects.order_by("pk").first()
+    entry = sample_entry(b"avc1", avcc(profile=122, chroma_format=2, bit_depth=10))
+    video = upload(sub_entry, mp4(entry))
+
+    assert run_task(claim_task()) == models.MediaTaskState.DONE
+
+    video.refresh_from_db()
+    assert video.media_state == models.MediaState.FAILED
+    assert "yuv422p10le" in video.media_error
+    assert video.media.name not in dumped_videos()
+
+
+def test_a_task_is_claimed_once(seeded):
+    task = queue_task()
+
+    claimed = claim_task()
+    assert claimed.pk == task.pk
+    assert claimed.state == models.MediaTaskState.RUNNING
+    assert claimed.attempts == 1
+    assert claimed.locked_until > timezone.now()
+    assert claim_task() is None
+
+
+def test_two_workers_cant_both_claim_a_task(seeded, monkeypatch):
+    task = queue_task()
+    claimable = media_queue._claimable
+    calls = []
+    other_claims = []
+
+    def racing(now):
+        # Between this worker choosing the task and claiming it, another claims
+        # it.
+        calls.append(now)
+        if len(calls) == 2:
+            monkeypatch.setattr(media_queue, "_claimable", claimable)
+            other_claims.append(claim_task())
+        return claimable(now)
+
+    monkeypatch.setattr(media_queue, "_claimable", racing)
+
+    assert claim_task() is None
+    assert [claimed.pk for claimed in other_claims] == [task.pk]
+    task.refresh_from_db()
+    assert task.attempts == 1
+
+
+def test_a_task_is_claimed_again_once_its_lease_runs_out(seeded):
+    task = queue_task()
+    claim_task()
+    assert claim_task() is None
+
+    models.MediaTask.objects.filter(pk=task.pk).update(
+        locked_until=timezone.now() - datetime.timedelta(seconds=1)
+    )
+
+    claimed = claim_task()
+    assert claimed.pk == task.pk
+    assert claimed.attempts == 2
+
+
+def test_a_failing_task_backs_off_then_fails_the_video(seeded, monkeypatch):
+    task = queue_task()
+
+    def fail(video, threads):
+        raise OSError("The bucket is unreachable")
+
+    monkeypatch.setitem(media_queue.HANDLERS, models.MediaTaskKind.VALIDATE, fail)
+
+    for attempt in range(1, MAX_ATTEMPTS):
+        before = timezone.now()
+        assert run_task(claim_task()) == models.MediaTaskState.QUEUED
+        task.refresh_from_db()
+        assert task.state == models.MediaTaskState.QUEUED
+        assert task.run_after >= before + RETRY_BACKOFF * 2 ** (attempt - 1)
+        assert "unreachable" in task.error
+        # Not due again until the backoff's over.
+        assert claim_task() is None
+        models.MediaTask.objects.filter(pk=task.pk).update(run_after=timezone.now())
+
+    assert run_task(claim_task()) == models.MediaTaskState.FAILED
+    task.refresh_from_db()
+    assert (task.state, task.attempts) == (models.MediaTaskState.FAILED, MAX_ATTEMPTS)
+    assert task.video.media_state == models.MediaState.FAILED
+    assert "unreachable" in task.video.media_error
+    assert claim_task() is None
+
+
+def test_skips_a_task_for_media_the_video_no_longer_has(seeded, monkeypatch):
+    task = queue_task(models.MediaTaskKind.TRANSCODE)
+    # An admin uploads another file before the worker gets to it.
+    models.Video.objects.filter(pk=task.video_id).update(media="replacement.mp4")
+
+    def transcode(video, threads):
+        raise AssertionError(f"Transcoded {video.media.name}")
+
+    monkeypatch.setitem(media_queue.HANDLERS, models.MediaTaskKind.TRANSCODE, transcode)
+
+    assert run_task(claim_task()) == models.MediaTaskState.DONE
+    task.refresh_from_db()
+    assert task.state == models.MediaTaskState.DONE
+    assert task.video.media.name == "replacement.mp4"
+    assert task.video.media_state == models.MediaState.PENDING
+
+
+def test_pending_and_failed_videos_are_not_dumped(seeded):
+    pending, failed, ready = models.Video.objects.order_by("pk")[:3]
+    models.Video.objects.filter(pk=pending.pk).update(
+        media_state=models.MediaState.PENDING
+    )
+    models.Video.objects.filter(pk=failed.pk).update(
+        media_state=models.MediaState.FAILED
+    )
+
+    videos = dumped_videos()
+    assert pending.media.name not in videos
+    assert failed.media.name not in videos
+    assert ready.media.name in videos
+
+
+def test_finds_videos_stuck_pending(seeded):
+    waiting, stuck, orphaned, ready = models.Video.objects.order_by("pk")[:4]
+    models.Video.objects.filter(pk__in=[waiting.pk, stuck.pk, orphaned.pk]).update(
+        media_state=models.MediaState.PENDING
+    )
+    models.MediaTask.objects.create(video=waiting, kind=models.MediaTaskKind.VALIDATE)
+    old = models.MediaTask.objects.create(
+        video=stuck, kind=models.MediaTaskKind.VALIDATE
+    )
+    models.MediaTask.objects.filter(pk=old.pk).update(
+        created_at=timezone.now() - STUCK_AFTER
+    )
+    # Its only task is done, yet it was never made ready.
+    models.MediaTask.objects.create(
+        video=orphaned,
+        kind=models.MediaTaskKind.VALIDATE,
+        state=models.MediaTaskState.DONE,
+    )
+    # Only pending videos can be stuck.
+    models.MediaTask.objects.create(video=ready, kind=models.MediaTaskKind.RENDITIONS)
+    models.MediaTask.objects.filter(video=ready).update(
+        created_at=timezone.now() - STUCK_AFTER
+    )
+
+    assert set(stuck_videos()) == {stuck, orphaned}
@@ -0,0 +1,47 @@
+import pytest
+
+from slsl_backend import models
+from slsl_backend.search import search_entries
+
+
+@pytest.fixture
+def entry_with_undumped_sub_entry(seeded):
+    """An entry with one dumped sub-entry, and one left out of the dump."""
+    entry = models.Entry.objects.filter(
+        subentry__video__media_state=models.MediaState.READY
+    ).first()
+    dumped = entry.subentry_set.filter(video__isnull=False).first()
+    undumped = models.SubEntry.objects.create(entry=entry, order=99)
+    models.Video.objects.create(
+        sub_entry=undumped,
+        media="undumped.mp4",
+        media_state=models.MediaState.PENDING,
+    )
+    return entry, dumped, undumped
+
+
+@pytest.mark.parametrize("in_dump", [True, False])
+def test_related_words_only_match_in_dumped_sub_entries(
+    entry_with_undumped_sub_entry, in_dump
+):
+    entry, dumped, undumped = entry_with_undumped_sub_entry
+    sub_entry = dumped if in_dump else undumped
+    sub_entry.related_words = "quetzalcoatl"
+    sub_entry.save()
+
+    found = {r.entry_id for r in search_entries("quetzalcoatl")}
+    assert (entry.pk in found) == in_dump
+
+
+@pytest.mark.parametrize("in_dump", [True, False])
+def test_definitions_only_match_in_dumped_sub_entries(
+    entry_with_undumped_sub_entry, in_dump
+):
+    entry, dumped, undumped = entry_with_undumped_sub_entry
+    models.Definition.objects.create(
+        sub_entry=dumped if in_dump else undumped,
+        definition="A feathered serpent, quetzalcoatl",
+    )
+
+    found = {r.entry_id for r in search_entries("quetzalcoatl")}
+    assert (entry.pk in found) == in_dump
@@ -0,0 +1,185 @@
+import io
+import struct
+
+import pytest
+from django.core.exceptions import ValidationError
+
+from slsl_backend.validators import UNDECODABLE, check_video_file
+from slsl_backend.video_probe import MAX_MOOV_SIZE, VideoProbeError, probe_video
+
+# Synthetic MP4s, with just the boxes the probe reads.
+
+
+def box(box_type, body=b""):
+    return struct.pack(">I4s", 8 + len(body), box_type) + body
+
+
+def full_box(box_type, body):
+    # Version 0, no flags.
+    return box(box_type, b"\0\0\0\0" + body)
+
+
+def _ue(value):
+    # Exp-Golomb, as the SPS codes most of its fields.
+    bits = bin(value + 1)[2:]
+    return "0" * (len(bits) - 1) + bits
+
+
+def avcc(profile=100, chroma_format=1, bit_depth=8):
+    # A NAL header, profile_idc, the constraint flags and level_idc, then
+    # seq_parameter_set_id, chroma_format_idc, (for 4:4:4)
+    # separate_colour_plane_flag and the bit depths.
+    bits = _ue(0) + _ue(chroma_format) + ("0" if chroma_format == 3 else "")
+    bits += _ue(bit_depth - 8) + _ue(bit_depth - 8) + "1"
+    bits += "0" * (-len(bits) % 8)
+    sps = bytes([0x67, profile, 0, 30]) + int(bits, 2).to_bytes(len(bits) // 8)
+    pps = b"\x68\xce\x38\x80"
+    return box(
+        b"avcC",
+        bytes([1, profile, 0, 30, 0xFF, 0xE1])
+        + struct.pack(">H", len(sps))
+        + sps
+        + b"\x01"
+        + struct.pack(">H", len(pps))
+        + pps,
+    )
+
+
+def hvcc(profile=1, chroma_format=1, bit_depth=8):
+    return box(
+        b"hvcC",
+        bytes([1, profile])
+        + b"\0" * 10
+        + bytes([93, 0xF0, 0, 0xFC, 0xFC | chroma_format])
+        + bytes([0xF8 | (bit_depth - 8)] * 2)
+        + b"\0\0\x0f\0",
+    )
+
+
+def sample_entry(entry_type, config, width=640, height=480):
+    body = (
+        b"\0" * 6  # reserved
+        + struct.pack(">H", 1)  # data_reference_index
+        + b"\0" * 16  # pre_defined and reserved
+        + struct.pack(">HH", width, height)
+        + struct.pack(">II", 0x480000, 0x480000)  # 72 dpi
+        + b"\0" * 4  # reserved
+        + struct.pack(">H", 1)  # frame_count
+        + b"\0" * 32  # compressorname
+        + struct.pack(">Hh", 0x18, -1)  # depth, pre_defined
+    )
+    return box(entry_type, body + config)
+
+
+def mp4(entry, faststart=True, handler=b"vide", mdat_size=1000):
+    stsd = full_box(b"stsd", struct.pack(">I", 1) + entry)
+    mdhd = full_box(b"mdhd", struct.pack(">IIII", 0, 0, 1000, 5000) + b"\0" * 4)
+    hdlr = full_box(b"hdlr", b"\0" * 4 + handler + b"\0" * 13)
+    stbl = box(b"stbl", stsd)
+    trak = box(
+        b"trak",
+        box(b"tkhd", b"\0" * 84) + box(b"mdia", mdhd + hdlr + box(b"minf", stbl)),
+    )
+    mvhd = full_box(b"mvhd", struct.pack(">IIII", 0, 0, 1000, 5000) + b"\0" * 80)
+    moov = box(b"moov", mvhd + trak)
+    ftyp = box(b"ftyp", b"isom\0\0\x02\0isomavc1")
+    mdat = box(b"mdat", b"\0" * mdat_size)
+    return ftyp + (moov + mdat if faststart else mdat + moov)
+
+
+class Unseekable(io.RawIOBase):
+    """A stream the probe can only read forwards, like an upload."""
+
+    def __init__(self, data):
+        self._data = io.BytesIO(data)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        return self._data.readinto(buffer)
+
+
+def test_accepts_8_bit_420_high():
+    probe = check_video_file(io.BytesIO(mp4(sample_entry(b"avc1", avcc()))))
+
+    assert (probe.codec, probe.profile, probe.pix_fmt) == ("h264", "High", "yuv420p")
+    assert (probe.width, probe.height, probe.duration) == (640, 480, 5.0)
+    assert probe.faststart
+
+
+def test_rejects_10_bit_422_high_as_undecodable():
+    entry = sample_entry(b"avc1", avcc(profile=122, chroma_format=2, bit_depth=10))
+
+    with pytest.raises(ValidationError) as e:
+        check_video_file(io.BytesIO(mp4(entry)))
+    assert e.value.code == UNDECODABLE
+    assert "yuv422p10le" in e.value.message
+
+
+def test_probes_hevc_main_10():
+    entry = sample_entry(b"hvc1", hvcc(profile=2, bit_depth=10), 1920, 1080)
+
+    probe = probe_video(io.BytesIO(mp4(entry)))
+    assert (probe.codec, probe.profile, probe.pix_fmt) == (
+        "hevc",
+        "Main 10",
+        "yuv420p10le",
+    )
+    assert (probe.width, probe.height) == (1920, 1080)
+    with pytest.raises(ValidationError) as e:
+        check_video_file(io.BytesIO(mp4(entry)))
+    assert e.value.code == UNDECODABLE
+
+
+@pytest.mark.parametrize("seekable", [True, False])
+def test_finds_the_moov_after_the_media_data(seekable):
+    data = mp4(sample_entry(b"avc1", avcc()), faststart=False)
+
+    probe = probe_video(io.BytesIO(data) if seekable else Unseekable(data))
+    assert probe.pix_fmt == "yuv420p"
+    assert not probe.faststart
+
+
+@pytest.mark.parametrize("faststart", [True, False])
+def test_rejects_truncated_files(faststart):
+    data = mp4(sample_entry(b"avc1", avcc()), faststart=faststart)
+
+    with pytest.raises(VideoProbeError, match="truncated"):
+        probe_video(io.BytesIO(data[:-10]))
+    # Without the size, the missing end is only noticed if it's in the moov.
+    if not faststart:
+        with pytest.raises(VideoProbeError, match="truncated"):
+            probe_video(Unseekable(data[:-10]))
+
+
+def test_rejects_an_oversized_moov():
+    ftyp = box(b"ftyp", b"isom\0\0\x02\0isom")
+    moov_size = MAX_MOOV_SIZE + 9
+    data = ftyp + struct.pack(">I4s", moov_size, b"moov")
+
+    # Claiming the file is big enough, so it's the moov's size that's refused
+    # rather than the file being short, and without reading the moov.
+    with pytest.raises(VideoProbeError, match="implausibly large"):
+        probe_video(io.BytesIO(data), size=len(ftyp) + moov_size)
+
+
+def test_rejects_a_file_without_a_video_track():
+    entry = sample_entry(b"mp4a", b"")
+
+    with pytest.raises(VideoProbeError, match="no video track"):
+        probe_video(io.BytesIO(mp4(entry, handler=b"soun")))
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        b"\xff\xd8\xff\xe0\x00\x10JFIF\x00\x01\x01" + b"\0" * 100,
+        b"This is just some text, not a video at all.",
+        b"",
+    ],
+)
+def test_rejects_files_that_arent_mp4(data):
+    with pytest.raises(ValidationError) as e:
+        check_video_file(io.BytesIO(data))
+    assert e.value.code != UNDECODABLE
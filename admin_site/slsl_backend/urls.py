@@ -8,5 +8,8 @@ admin.site.site_header = "Sri Lankan Sign Language Dictionary"
 
 urlpatterns = [
     path("dump", views.get_dump),
+    path("entry/<int:entry_id>", views.get_entry),
+    path("search", views.search),
+    path("changes", views.get_changes),
     path("", admin.site.urls),
 ]
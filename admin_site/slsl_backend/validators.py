@@ -9,23 +9,26 @@ Two failure modes have shipped to users in the past, both rendering as a blank
     4:2:0 H.264. Pro/editing exports — H.264 High 4:2:2 10-bit (yuv422p10le),
     4:4:4, etc. — load fine but never render.
 
-These run at upload time so a bad file is rejected before it reaches users.
-Validation needs `ffprobe` (shipped in the Docker image); if it's missing
-(e.g. a bare local dev box) the check is skipped with a warning rather than
-blocking uploads.
+These run at upload time so a bad file is rejected before it reaches users, or
+with settings.PROCESS_MEDIA_IN_BACKGROUND, just after it, by the process_media
+worker (see media_queue.py), with the video held back from the dump meanwhile.
+The file's headers are read in-process (see video_probe.py), so validation
+needs no external tools. With settings.VALIDATE_WITH_FFPROBE on, `ffprobe`
+(shipped in the Docker image) checks each upload as well, as a cross-check of
+the in-process probe; if it's missing that part is skipped with a warning.
 """
 
 import json
 import logging
-import os
 import shutil
 import subprocess
-import tempfile
 
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.core.files.uploadedfile import UploadedFile
 
+from .video_probe import VideoProbeError, probe_video
+
 logger = logging.getLogger(__name__)
 
 # Pixel formats consumer players can actually decode (8-bit 4:2:0).
@@ -34,21 +37,82 @@ ALLOWED_PIX_FMTS = {"yuv420p", "yuvj420p"}
 IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".gif", ".webp")
 VIDEO_EXTS = (".mp4", ".mov", ".m4v")
 
-_FFMPEG_HINT = (
-    "ffmpeg -i in.mp4 -c:v libx264 -profile:v high -pix_fmt yuv420p -crf 20 "
-    "-movflags +faststart out.mp4"
-)
+# The ffmpeg options that re-encode a video to what the apps can decode, with
+# the moov atom up front so playback can start before the download finishes.
+# Admins are told to run them by hand, and the process_media worker runs them
+# itself (see media_queue.py).
+TRANSCODE_ARGS = [
+    "-c:v",
+    "libx264",
+    "-profile:v",
+    "high",
+    "-pix_fmt",
+    "yuv420p",
+    "-crf",
+    "20",
+    "-movflags",
+    "+faststart",
+]
+
+_FFMPEG_HINT = f"ffmpeg -i in.mp4 {' '.join(TRANSCODE_ARGS)} out.mp4"
+
+# The ValidationError code for a video that's intact but can't be decoded, which
+# re-encoding fixes (unlike a corrupt one).
+UNDECODABLE = "undecodable"
+
+
+def _check_pix_fmt(codec, pix_fmt):
+    if pix_fmt not in ALLOWED_PIX_FMTS:
+        if pix_fmt:
+            encoding = f"'{pix_fmt}'"
+        else:
+            encoding = f"'{codec}'" if codec else "a codec we don't recognise"
+        raise ValidationError(
+            f"This video is encoded as {encoding}, which phones and browsers can't "
+            f"decode — it would show as a blank rectangle in the app. Re-encode it to "
+            f"8-bit 4:2:0 H.264 first, e.g.: {_FFMPEG_HINT}",
+            code=UNDECODABLE,
+        )
+
 
+def check_video_file(file, size=None):
+    """Raise ValidationError if the video in ``file`` is corrupt or undecodable.
 
-def check_video_path(path):
+    ``file`` is a binary file object positioned at the start of the video, and
+    ``size`` its size in bytes, if known (see video_probe.probe_video). Returns
+    the video's VideoProbe.
+    """
+    try:
+        probe = probe_video(file, size)
+    except VideoProbeError as e:
+        raise ValidationError(
+            f"This video is corrupt or unreadable: {e}. It's likely a truncated "
+            "upload; re-export it and upload again."
+        )
+    _check_pix_fmt(probe.codec, probe.pix_fmt)
+    return probe
+
+
+def check_video_path(path, cross_check=False):
     """Raise ValidationError if the video at ``path`` is corrupt or undecodable.
 
     Pure (path in, exception out) so it's unit-testable without Django/uploads.
-    No-op when ffprobe isn't installed.
+    With ``cross_check``, ffprobe must accept the video too, if it's installed.
+    Returns the video's VideoProbe.
     """
+    with open(path, "rb") as f:
+        probe = check_video_file(f)
+    if cross_check:
+        _ffprobe_cross_check(path, probe)
+    return probe
+
+
+def _ffprobe_cross_check(path, probe, content=None):
+    # With `content`, ffprobe reads that from its stdin, and `path` is only for
+    # the logs.
     ffprobe = shutil.which("ffprobe")
     if not ffprobe:
-        logger.warning("ffprobe not found; skipping codec validation for %s", path)
+        logger.warning("ffprobe not found; skipping the cross-check for %s", path)
         return
 
     proc = subprocess.run(
@@ -62,10 +126,10 @@ def check_video_path(path):
             "stream=codec_name,pix_fmt",
             "-of",
             "json",
-            path,
+            path if content is None else "pipe:0",
         ],
+        input=content,
         capture_output=True,
-        text=True,
     )
     if proc.returncode != 0:
         raise ValidationError(
@@ -73,7 +137,7 @@ def check_video_path(path):
             "Re-export it and upload again."
         )
     try:
-        streams = json.loads(proc.stdout or "{}").get("streams", [])
+        streams = json.loads(proc.stdout or b"{}").get("streams", [])
     except json.JSONDecodeError:
         streams = []
     if not streams:
@@ -82,13 +146,19 @@ def check_video_path(path):
             "truncated upload."
         )
 
-    pix_fmt = streams[0].get("pix_fmt")
-    if pix_fmt not in ALLOWED_PIX_FMTS:
-        raise ValidationError(
-            f"This video is encoded as '{pix_fmt}', which phones and browsers can't "
-            f"decode — it would show as a blank rectangle in the app. Re-encode it to "
-            f"8-bit 4:2:0 H.264 first, e.g.: {_FFMPEG_HINT}"
+    codec, pix_fmt = streams[0].get("codec_name"), streams[0].get("pix_fmt")
+    if (codec, pix_fmt) != (probe.codec, probe.pix_fmt):
+        # One of the two is wrong, and it's the in-process probe that runs
+        # without this, so it's the one to fix.
+        logger.warning(
+            "ffprobe found %s %s in %s, but the probe found %s %s",
+            codec,
+            pix_fmt,
+            path,
+            probe.codec,
+            probe.pix_fmt,
         )
+    _check_pix_fmt(codec, pix_fmt)
 
 
 def validate_media(value):
@@ -109,22 +179,26 @@ def validate_media(value):
     upload = getattr(value, "file", None)
     if not isinstance(upload, UploadedFile):
         return  # not a new upload (unchanged existing record) — nothing to re-check.
-
-    # TemporaryUploadedFile is already on disk; probe it in place. Otherwise
-    # (small InMemoryUploadedFile) spill it to a temp file for ffprobe.
-    temp_path = getattr(upload, "temporary_file_path", None)
-    if callable(temp_path):
-        check_video_path(temp_path())
-        return
-
-    tmp = tempfile.NamedTemporaryFile(suffix=".mp4", delete=False)
+    if getattr(settings, "PROCESS_MEDIA_IN_BACKGROUND", False):
+        return  # Video.save queues it for the process_media worker instead.
+
+    # Probe the upload where it is, in memory (InMemoryUploadedFile) or in the
+    # temp file Django spooled it to (TemporaryUploadedFile), rather than
+    # copying it anywhere first. Only the headers are read, seeking over the
+    # media data, and the declared sizes are checked against the upload's.
+    upload.seek(0)
     try:
-        upload.seek(0)
-        for chunk in upload.chunks():
-            tmp.write(chunk)
-        tmp.flush()
-        tmp.close()
-        upload.seek(0)
-        check_video_path(tmp.name)
+        probe = check_video_file(upload, upload.size)
     finally:
-        os.unlink(tmp.name)
+        upload.seek(0)
+
+    if getattr(settings, "VALIDATE_WITH_FFPROBE", False):
+        temp_path = getattr(upload, "temporary_file_path", None)
+        if callable(temp_path):
+            _ffprobe_cross_check(temp_path(), probe)
+        else:
+            # It's small enough to be in memory, so pipe it to ffprobe whole.
+            try:
+                _ffprobe_cross_check(upload.name, probe, content=upload.read())
+            finally:
+                upload.seek(0)
@@ -0,0 +1,426 @@
+"""A pure-Python probe of MP4 / MOV headers, for upload validation.
+
+Spawning ffprobe for every upload just to learn the codec and pixel format is
+slow, and skipped entirely wherever ffmpeg isn't installed. Everything the
+validators need is in the file's headers, so this reads those itself: it walks
+the top-level boxes to the moov box, and from there
+moov/trak/mdia/minf/stbl/stsd to the video track's sample entry and its codec
+configuration (avcC, hvcC, av1C or vpcC).
+
+The file is only ever read forwards, and the media data (mdat) is skipped, not
+read: with a seekable file by seeking over it, otherwise by reading and
+discarding it. probe_video stops as soon as it has both the moov box and the
+position of the media data.
+"""
+
+import dataclasses
+import struct
+
+# The most of a moov box we'll read into memory. Real ones are a few hundred KB
+# even for long videos; anything much bigger is broken or malicious.
+MAX_MOOV_SIZE = 64 * 1024 * 1024
+
+# Sample entry types by codec, as ffprobe names them.
+_CODECS = {
+    b"avc1": "h264",
+    b"avc3": "h264",
+    b"hvc1": "hevc",
+    b"hev1": "hevc",
+    b"av01": "av1",
+    b"vp09": "vp9",
+    b"mp4v": "mpeg4",
+    b"apco": "prores",
+    b"apcs": "prores",
+    b"apcn": "prores",
+    b"apch": "prores",
+    b"ap4h": "prores",
+    b"ap4x": "prores",
+}
+
+# ProRes has no configuration box; each flavour has fixed sampling.
+_PRORES_FORMATS = {
+    b"apco": (2, 10),
+    b"apcs": (2, 10),
+    b"apcn": (2, 10),
+    b"apch": (2, 10),
+    b"ap4h": (3, 12),
+    b"ap4x": (3, 12),
+}
+
+_H264_PROFILES = {
+    66: "Baseline",
+    77: "Main",
+    88: "Extended",
+    100: "High",
+    110: "High 10",
+    122: "High 4:2:2",
+    244: "High 4:4:4 Predictive",
+    44: "CAVLC 4:4:4",
+}
+
+# H.264 profiles whose SPS says how the chroma is sampled and the bit depth.
+# The rest are always 8-bit 4:2:0.
+_H264_HIGH_PROFILES = {100, 110, 122, 244, 44, 83, 86, 118, 128, 138, 139, 134, 135}
+
+_HEVC_PROFILES = {1: "Main", 2: "Main 10", 3: "Main Still Picture", 4: "Rext"}
+
+_AV1_PROFILES = {0: "Main", 1: "High", 2: "Professional"}
+
+# chroma_format_idc (the H.264 / HEVC numbering) to ffprobe's pix_fmt prefix.
+_CHROMA_PIX_FMTS = {0: "gray", 1: "yuv420p", 2: "yuv422p", 3: "yuv444p"}
+
+
+class VideoProbeError(ValueError):
+    """The file isn't a readable MP4 / MOV, or is truncated."""
+
+
+@dataclasses.dataclass(frozen=True)
+class VideoProbe:
+    # As ffprobe names it, e.g. "h264", or None if it's not one we know.
+    codec: str | None
+    # E.g. "High", or None if unknown.
+    profile: str | None
+    # chroma_format_idc: 0 = monochrome, 1 = 4:2:0, 2 = 4:2:2, 3 = 4:4:4, or
+    # None if unknown.
+    chroma_format: int | None
+    bit_depth: int | None
+    width: int
+    height: int
+    # In seconds, or None if the file doesn't say.
+    duration: float | None
+    # Byte offsets of the moov box and of the first mdat box (None if there's
+    # none). A moov before the mdat means players can start before the whole
+    # file has downloaded (ffmpeg's -movflags +faststart).
+    moov_offset: int
+    mdat_offset: int | None
+
+    @property
+    def pix_fmt(self):
+        """The pixel format as ffprobe names it, e.g. "yuv420p", or None."""
+        if self.chroma_format not in _CHROMA_PIX_FMTS or self.bit_depth is None:
+            return None
+        pix_fmt = _CHROMA_PIX_FMTS[self.chroma_format]
+        if self.bit_depth != 8:
+            pix_fmt += f"{self.bit_depth}le"
+        return pix_fmt
+
+    @property
+    def faststart(self):
+        return self.mdat_offset is None or self.moov_offset < self.mdat_offset
+
+
+class _Reader:
+    """Reads a file forwards only, tracking the offset."""
+
+    def __init__(self, file):
+        self._file = file
+        self.offset = 0
+        self.seekable = getattr(file, "seekable", lambda: False)()
+
+    def read(self, n):
+        data = self._file.read(n)
+        self.offset += len(data)
+        if len(data) < n:
+            raise VideoProbeError("The file is truncated")
+        return data
+
+    def read_header(self):
+        # Returns None at the end of the file.
+        data = self._file.read(8)
+        self.offset += len(data)
+        if not data:
+            return None
+        if len(data) < 8:
+            raise VideoProbeError("The file is truncated")
+        return data
+
+    def skip(self, n):
+        if self.seekable:
+            self._file.seek(n, 1)
+            self.offset += n
+            return
+        while n > 0:
+            chunk = self._file.read(min(n, 1024 * 1024))
+            if not chunk:
+                raise VideoProbeError("The file is truncated")
+            self.offset += len(chunk)
+            n -= len(chunk)
+
+
+def _check_type(box_type):
+    if not all(0x20 <= c < 0x7F for c in box_type):
+        raise VideoProbeError("Not an MP4 / MOV file")
+
+
+def probe_video(file, size=None):
+    """Probe the video in `file`, a binary file object positioned at its start.
+
+    `size` is the file's size in bytes, if known, which is how a truncated file
+    is caught without reading all of it. Returns a VideoProbe of its first video
+    track. Raises VideoProbeError if the file is corrupt, truncated or has no
+    video track.
+    """
+    reader = _Reader(file)
+    if size is None and reader.seekable:
+        position = file.tell()
+        size = file.seek(0, 2) - position
+        file.seek(position)
+    moov = moov_offset = mdat_offset = None
+    while True:
+        start = reader.offset
+        header = reader.read_header()
+        if header is None:
+            break
+        box_size, box_type = struct.unpack(">I4s", header)
+        _check_type(box_type)
+        if box_size == 1:
+            (box_size,) = struct.unpack(">Q", reader.read(8))
+        elif box_size == 0:
+            # The box runs to the end of the file.
+            if size is None:
+                if box_type == b"mdat" and mdat_offset is None:
+                    mdat_offset = start
+                break
+            box_size = size - start
+        body_size = box_size - (reader.offset - start)
+        if body_size < 0:
+            raise VideoProbeError(f"Invalid {box_type.decode()} box")
+        if size is not None and start + box_size > size:
+            raise VideoProbeError(
+                f"The file is truncated: its {box_type.decode()} box needs "
+                f"{start + box_size} bytes, but it has {size}"
+            )
+
+        if box_type == b"moov" and moov is None:
+            if body_size > MAX_MOOV_SIZE:
+                raise VideoProbeError("The moov box is implausibly large")
+            moov = reader.read(body_size)
+            moov_offset = start
+        elif box_type == b"mdat" and mdat_offset is None:
+            mdat_offset = start
+        else:
+            reader.skip(body_size)
+            continue
+        if moov is not None and mdat_offset is not None:
+            # Nothing left to learn. The rest of the file is media data, which
+            # the size check above says is all there, if the size is known.
+            break
+        if box_type == b"mdat":
+            reader.skip(body_size)
+
+    if moov is None:
+        raise VideoProbeError("The file has no moov box, so is likely truncated")
+    return _probe_moov(moov, moov_offset, mdat_offset)
+
+
+def _iter_boxes(data, start=0, end=None):
+    end = len(data) if end is None else end
+    offset = start
+    while offset + 8 <= end:
+        box_size, box_type = struct.unpack_from(">I4s", data, offset)
+        header_size = 8
+        if box_size == 1:
+            if offset + 16 > end:
+                raise VideoProbeError(f"Invalid {box_type!r} box")
+            (box_size,) = struct.unpack_from(">Q", data, offset + 8)
+            header_size = 16
+        elif box_size == 0:
+            box_size = end - offset
+        if box_size < header_size or offset + box_size > end:
+            raise VideoProbeError(f"Invalid {box_type!r} box")
+        yield box_type, offset + header_size, offset + box_size
+        offset += box_size
+
+
+def _find(data, path, start=0, end=None):
+    # Yields the (start, end) of the body of every box at `path` below.
+    for box_type, body_start, body_end in _iter_boxes(data, start, end):
+        if box_type != path[0]:
+            continue
+        if len(path) == 1:
+            yield body_start, body_end
+        else:
+            yield from _find(data, path[1:], body_start, body_end)
+
+
+def _duration(data, start, end):
+    # mvhd and mdhd both start version, flags, creation and modification times,
+    # timescale, duration.
+    if end - start < 4:
+        raise VideoProbeError("Invalid duration box")
+    if data[start] == 1:
+        timescale, duration = struct.unpack_from(">IQ", data, start + 20)
+    else:
+        timescale, duration = struct.unpack_from(">II", data, start + 12)
+    if not timescale or duration in (0xFFFFFFFF, 0xFFFFFFFFFFFFFFFF):
+        return None
+    return duration / timescale
+
+
+def _probe_moov(moov, moov_offset, mdat_offset):
+    movie_duration = None
+    for start, end in _find(moov, [b"mvhd"]):
+        movie_duration = _duration(moov, start, end)
+
+    for trak_start, trak_end in _find(moov, [b"trak"]):
+        handler = None
+        for start, end in _find(moov, [b"mdia", b"hdlr"], trak_start, trak_end):
+            handler = moov[start + 8 : start + 12]
+        if handler != b"vide":
+            continue
+        duration = movie_duration
+        for start, end in _find(moov, [b"mdia", b"mdhd"], trak_start, trak_end):
+            duration = _duration(moov, start, end) or duration
+        stsd = next(
+            _find(moov, [b"mdia", b"minf", b"stbl", b"stsd"], trak_start, trak_end),
+            None,
+        )
+        if stsd is None:
+            raise VideoProbeError("The video track has no sample description")
+        # A full box (version, flags), then the entry count, then the entries.
+        entry = next(_iter_boxes(moov, stsd[0] + 8, stsd[1]), None)
+        if entry is None:
+            raise VideoProbeError("The video track has no sample entry")
+        return _probe_sample_entry(moov, *entry, duration, moov_offset, mdat_offset)
+
+    raise VideoProbeError("The file has no video track")
+
+
+def _probe_sample_entry(data, entry_type, start, end, duration, moov, mdat):
+    # A VisualSampleEntry: 6 reserved bytes, the data reference index, 16 bytes
+    # of pre-defined / reserved, the width and height, then 50 more bytes before
+    # the child boxes.
+    if end - start < 78:
+        raise VideoProbeError("Invalid video sample entry")
+    width, height = struct.unpack_from(">HH", data, start + 24)
+    codec = _CODECS.get(entry_type)
+    profile = chroma_format = bit_depth = None
+    children = {
+        box_type: (body_start, body_end)
+        for box_type, body_start, body_end in _iter_boxes(data, start + 78, end)
+    }
+    if codec == "h264" and b"avcC" in children:
+        profile, chroma_format, bit_depth = _probe_avcc(data, *children[b"avcC"])
+    elif codec == "hevc" and b"hvcC" in children:
+        profile, chroma_format, bit_depth = _probe_hvcc(data, *children[b"hvcC"])
+    elif codec == "av1" and b"av1C" in children:
+        profile, chroma_format, bit_depth = _probe_av1c(data, *children[b"av1C"])
+    elif codec == "vp9" and b"vpcC" in children:
+        profile, chroma_format, bit_depth = _probe_vpcc(data, *children[b"vpcC"])
+    elif codec == "prores":
+        chroma_format, bit_depth = _PRORES_FORMATS[entry_type]
+    elif codec == "mpeg4":
+        # MPEG-4 Part 2 as found in MP4s (Simple / Advanced Simple) is 8-bit
+        # 4:2:0.
+        chroma_format, bit_depth = 1, 8
+    return VideoProbe(
+        codec=codec,
+        profile=profile,
+        chroma_format=chroma_format,
+        bit_depth=bit_depth,
+        width=width,
+        height=height,
+        duration=duration,
+        moov_offset=moov,
+        mdat_offset=mdat,
+    )
+
+
+class _BitReader:
+    """Reads an H.264 RBSP bit by bit, for the few SPS fields we need."""
+
+    def __init__(self, data):
+        # Drop the emulation prevention bytes (00 00 03 -> 00 00).
+        self._data = data.replace(b"\x00\x00\x03", b"\x00\x00")
+        self._bit = 0
+
+    def bit(self):
+        if self._bit >= len(self._data) * 8:
+            raise VideoProbeError("Invalid H.264 sequence parameter set")
+        byte = self._data[self._bit // 8]
+        value = (byte >> (7 - self._bit % 8)) & 1
+        self._bit += 1
+        return value
+
+    def bits(self, n):
+        value = 0
+        for _ in range(n):
+            value = (value << 1) | self.bit()
+        return value
+
+    def ue(self):
+        # Unsigned exp-Golomb.
+        zeros = 0
+        while not self.bit():
+            zeros += 1
+            if zeros > 31:
+                raise VideoProbeError("Invalid H.264 sequence parameter set")
+        return (1 << zeros) - 1 + self.bits(zeros)
+
+
+def _probe_avcc(data, start, end):
+    # configurationVersion, AVCProfileIndication, profile_compatibility,
+    # AVCLevelIndication, lengthSizeMinusOne, numOfSequenceParameterSets, then
+    # each SPS with a 16-bit length.
+    if end - start < 8:
+        raise VideoProbeError("Invalid avcC box")
+    profile_idc, compatibility = data[start + 1], data[start + 2]
+    profile = _H264_PROFILES.get(profile_idc)
+    if profile_idc == 66 and compatibility & 0x40:
+        profile = "Constrained Baseline"
+    if profile_idc not in _H264_HIGH_PROFILES:
+        return profile, 1, 8
+    if not data[start + 5] & 0x1F:
+        raise VideoProbeError("The avcC box has no sequence parameter set")
+    (sps_size,) = struct.unpack_from(">H", data, start + 6)
+    sps = data[start + 8 : start + 8 + sps_size]
+    # The NAL header, profile_idc, constraint flags and level_idc, then
+    # seq_parameter_set_id and the fields we're after.
+    reader = _BitReader(sps[4:])
+    reader.ue()
+    chroma_format = reader.ue()
+    if chroma_format == 3:
+        reader.bit()  # separate_colour_plane_flag
+    bit_depth = reader.ue() + 8
+    return profile, chroma_format, bit_depth
+
+
+def _probe_hvcc(data, start, end):
+    # configurationVersion, then general_profile_space (2 bits), tier (1) and
+    # profile_idc (5), ... and at byte 16 chromaFormat, then
+    # bitDepthLumaMinus8, each in the low bits.
+    if end - start < 23:
+        raise VideoProbeError("Invalid hvcC box")
+    profile = _HEVC_PROFILES.get(data[start + 1] & 0x1F)
+    return profile, data[start + 16] & 0x03, (data[start + 17] & 0x07) + 8
+
+
+def _probe_av1c(data, start, end):
+    # marker and version, seq_profile (3 bits) and seq_level_idx_0 (5), then
+    # seq_tier_0, high_bitdepth, twelve_bit, monochrome, chroma_subsampling_x
+    # and chroma_subsampling_y (1 bit each).
+    if end - start < 4:
+        raise VideoProbeError("Invalid av1C box")
+    profile = _AV1_PROFILES.get(data[start + 1] >> 5)
+    flags = data[start + 2]
+    high_bitdepth, twelve_bit = flags & 0x40, flags & 0x20
+    bit_depth = (12 if twelve_bit else 10) if high_bitdepth else 8
+    if flags & 0x10:
+        chroma_format = 0
+    elif flags & 0x08:
+        chroma_format = 1 if flags & 0x04 else 2
+    else:
+        chroma_format = 3
+    return profile, chroma_format, bit_depth
+
+
+def _probe_vpcc(data, start, end):
+    # A full box (version, flags), then profile, level, and bitDepth (4 bits),
+    # chromaSubsampling (3) and videoFullRangeFlag (1).
+    if end - start < 7:
+        raise VideoProbeError("Invalid vpcC box")
+    profile = f"Profile {data[start + 4]}"
+    bit_depth = data[start + 6] >> 4
+    # 0 and 1 are both 4:2:0, with different chroma siting.
+    chroma_format = {0: 1, 1: 1, 2: 2, 3: 3}.get((data[start + 6] >> 1) & 0x07)
+    return profile, chroma_format, bit_depth
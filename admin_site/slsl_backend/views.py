@@ -1,11 +1,305 @@
-from django.http import HttpResponseBadRequest, HttpResponseForbidden, JsonResponse
+import os
 
-from .dump import build_dump
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import (
+    FileResponse,
+    HttpResponse,
+    HttpResponseBadRequest,
+    HttpResponseForbidden,
+    HttpResponseGone,
+    HttpResponseNotFound,
+    JsonResponse,
+    StreamingHttpResponse,
+)
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+
+from . import changelog
+from .dump import (
+    STREAM_CHUNK_SIZE,
+    DumpFilter,
+    build_dump,
+    build_dump_delta,
+    current_version,
+    dump_entry,
+    iter_dump_models,
+)
+from .dump_builds import DumpBusy, build_slot, hold_build_slot
+from .dump_cache import FORMATS, clear_cached_dumps, get_cached_dump
+from .dump_fragments import fragment_content
+from .dump_profile import DumpProfile
+from .models import Entry
+from .search import DEFAULT_LIMIT, MAX_LIMIT, MAX_QUERY_LENGTH, search_entries
 from .secrets import secrets
 
+# The Content-Type each dump format is served as.
+CONTENT_TYPES = {
+    "json": "application/json",
+    "msgpack": "application/msgpack",
+    "index": "application/json",
+    "ndjson": "application/x-ndjson",
+}
 
-# Get the entire DB as JSON, to be stored in a bucket to then be served to clients.
-def get_dump(request):
+# The file name each dump format is offered to be saved as.
+FILE_NAMES = {
+    "json": "dump.json",
+    "msgpack": "dump.msgpack",
+    "index": "index.json",
+    "ndjson": "dump.ndjson",
+}
+
+# How long to tell clients to wait before retrying when too many dumps are being
+# built (see dump_builds.py). About how long a build takes.
+BUSY_RETRY_AFTER_SECS = 30
+
+# Accept header media types that select the MessagePack dump (see
+# dump_msgpack.py). There's no one agreed name for it.
+MSGPACK_MEDIA_TYPES = (
+    "application/msgpack",
+    "application/x-msgpack",
+    "application/vnd.msgpack",
+)
+
+# Accept header media types that select the NDJSON dump (see dump_ndjson.py).
+NDJSON_MEDIA_TYPES = (
+    "application/x-ndjson",
+    "application/ndjson",
+    "application/jsonl",
+)
+
+
+async def _iterate_in_thread(iterator):
+    # Under ASGI, StreamingHttpResponse buffers a sync iterator into a list
+    # before sending it, which would defeat streaming. Pull one chunk at a time
+    # instead. thread_sensitive keeps every step on the same thread, and so on
+    # the same DB connection / transaction.
+    next_chunk = sync_to_async(next, thread_sensitive=True)
+    try:
+        while True:
+            chunk = await next_chunk(iterator, None)
+            if chunk is None:
+                break
+            yield chunk
+    finally:
+        # Release the dump's DB transaction if the client went away mid-stream.
+        await sync_to_async(iterator.close, thread_sensitive=True)()
+
+
+def _requested_format(request):
+    # An explicit ?format= wins over the Accept header.
+    format = request.GET.get("format")
+    if format is not None:
+        return format if format in FORMATS else None
+    accept = request.headers.get("Accept", "")
+    if any(media_type in accept for media_type in MSGPACK_MEDIA_TYPES):
+        return "msgpack"
+    if any(media_type in accept for media_type in NDJSON_MEDIA_TYPES):
+        return "ndjson"
+    return "json"
+
+
+def _stream_dump(request, format, dump_filter):
+    version, _ = current_version()
+    chunks = hold_build_slot(FORMATS[format](dump_filter=dump_filter))
+    if isinstance(request, ASGIRequest):
+        chunks = _iterate_in_thread(chunks)
+    response = StreamingHttpResponse(chunks, content_type=CONTENT_TYPES[format])
+    response.headers["X-Dump-Version"] = version
+    return response
+
+
+def _dump_busy():
+    response = HttpResponse(
+        "Too many dumps are being built, try again shortly",
+        status=503,
+        content_type="text/plain",
+    )
+    response.headers["Retry-After"] = BUSY_RETRY_AFTER_SECS
+    return response
+
+
+def _dump_delta(request, since, dump_filter):
+    try:
+        since = int(since)
+    except ValueError:
+        return HttpResponseBadRequest("since must be a dump version number")
+    version, _ = current_version()
+    if since < 0 or since > version:
+        # Not a version this server ever produced (e.g. the DB was restored from
+        # a backup), so the client has to fall back to the full dump.
+        return HttpResponseGone(f"Unknown dump version {since}, fetch the full dump")
+    delta = build_dump_delta(since, dump_filter)
+    response = JsonResponse(delta)
+    response.headers["X-Dump-Version"] = delta["version"]
+    return response
+
+
+def _choose_encoding(accept_encoding, available):
+    """Pick the best of `available` (most preferred first) the client accepts."""
+    accepted = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding.strip().lower()] = quality
+    for coding in available:
+        if accepted.get(coding, accepted.get("*", 0.0)) > 0:
+            return coding
+    return None
+
+
+def _byte_range(request, etag, size):
+    """Return the (start, end) byte range the request asks for, inclusive.
+
+    None means the whole body: there's no Range header, it's not one we serve
+    (we only serve a single range of bytes), or its If-Range doesn't match
+    `etag`. Raises ValueError if the range is outside the body.
+    """
+    header = request.headers.get("Range", "")
+    unit, _, spec = header.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        return None
+    # If-Range can also be a date, which we don't compare, so send it all.
+    if_range = request.headers.get("If-Range")
+    if if_range is not None and if_range != etag:
+        return None
+    first, _, last = spec.strip().partition("-")
+    try:
+        if not first:
+            # The last `last` bytes.
+            start, end = max(size - int(last), 0), size - 1
+        else:
+            start, end = int(first), int(last) if last else size - 1
+    except ValueError:
+        return None
+    end = min(end, size - 1)
+    if start > end or start < 0:
+        raise ValueError(f"Range {header} is outside the {size} byte body")
+    return start, end
+
+
+class _FileRange:
+    """Reads the bytes from start to end (inclusive) of a file, for FileResponse."""
+
+    def __init__(self, file, start, end):
+        self._file = file
+        self._file.seek(start)
+        self._remaining = end - start + 1
+
+    def read(self, size=-1):
+        if size < 0 or size > self._remaining:
+            size = self._remaining
+        chunk = self._file.read(size)
+        self._remaining -= len(chunk)
+        return chunk
+
+    def close(self):
+        self._file.close()
+
+
+def _file_chunks(file):
+    try:
+        while chunk := file.read(STREAM_CHUNK_SIZE):
+            yield chunk
+    finally:
+        file.close()
+
+
+def _dump_body_response(request, body, content_type, etag, filename):
+    # body is the dump's content, or the path of the file holding it (see
+    # dump_files.py). Either way, a Range request gets just those bytes, so
+    # interrupted downloads can carry on where they stopped.
+    file = open(body, "rb") if isinstance(body, str) else None
+    size = os.fstat(file.fileno()).st_size if file else len(body)
+    try:
+        byte_range = _byte_range(request, etag, size)
+    except ValueError as e:
+        if file:
+            file.close()
+        response = HttpResponse(str(e), status=416, content_type="text/plain")
+        response.headers["Content-Range"] = f"bytes */{size}"
+        return response
+
+    if byte_range is None:
+        start, end = 0, size - 1
+    else:
+        start, end = byte_range
+    if file:
+        # Under WSGI a whole file goes out with sendfile.
+        if byte_range is not None:
+            file = _FileRange(file, start, end)
+        response = FileResponse(file, content_type=content_type, filename=filename)
+        if isinstance(request, ASGIRequest):
+            # As in _stream_dump, or the file is read whole into memory first.
+            response.streaming_content = _iterate_in_thread(_file_chunks(file))
+    else:
+        response = HttpResponse(body[start : end + 1], content_type=content_type)
+    response.headers["Content-Length"] = end - start + 1
+    response.headers["Accept-Ranges"] = "bytes"
+    if byte_range is not None:
+        response.status_code = 206
+        response.headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return response
+
+
+def _cached_dump(request, format, dump_filter, retry=True):
+    # The app only sends If-Modified-Since, which we can answer from the
+    # DumpVersion row alone, without touching (or rebuilding) the cached dump.
+    if "If-None-Match" not in request.headers:
+        _, changed_at = current_version()
+        last_modified = int(changed_at.timestamp())
+        response = get_conditional_response(request, last_modified=last_modified)
+        if response is not None:
+            patch_vary_headers(response, ["Accept", "Accept-Encoding"])
+            response.headers["Last-Modified"] = http_date(last_modified)
+            return response
+
+    dump = get_cached_dump(format, dump_filter)
+    last_modified = int(dump.last_modified.timestamp())
+    encoding = _choose_encoding(
+        request.headers.get("Accept-Encoding", ""), list(dump.encodings)
+    )
+    content = dump.content
+    etag = dump.etag
+    if encoding:
+        # Each encoding is a different representation, so needs its own ETag.
+        content = dump.encodings[encoding]
+        etag = f'{dump.etag[:-1]}-{encoding}"'
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        try:
+            response = _dump_body_response(
+                request, content, CONTENT_TYPES[format], etag, FILE_NAMES[format]
+            )
+        except FileNotFoundError:
+            # Another worker wrote a newer version and deleted this one since it
+            # was cached, so pick that up instead.
+            if not retry:
+                raise
+            clear_cached_dumps()
+            return _cached_dump(request, format, dump_filter, retry=False)
+        if encoding:
+            response.headers["Content-Encoding"] = encoding
+    patch_vary_headers(response, ["Accept", "Accept-Encoding"])
+    response.headers["ETag"] = etag
+    response.headers["Last-Modified"] = http_date(last_modified)
+    response.headers["X-Dump-Version"] = dump.version
+    if settings.DUMP_TIMING_HEADER:
+        # The stats of the build that produced this dump, which may well have
+        # been for an earlier request.
+        response.headers["Server-Timing"] = dump.server_timing
+    return response
+
+
+def _check_auth_token(request):
     # If the server is running with a required auth token configured, check it.
     our_auth_token = secrets.get("dump_auth_token")
     if our_auth_token:
@@ -17,7 +311,174 @@ def get_dump(request):
         their_auth_token = their_auth_token[len("Bearer ") :]
         if their_auth_token != our_auth_token:
             return HttpResponseForbidden("Auth token was incorrect")
+    return None
+
+
+# Get the entire DB as JSON, to be stored in a bucket to then be served to clients.
+# Every response carries the dump version it reflects in X-Dump-Version. Pass that
+# back as ?since=<version> to get just the entries that changed since then. Ask for
+# ?format=msgpack (or Accept: application/msgpack) to get the compact binary
+# format instead (see dump_msgpack.py), ?format=ndjson (or Accept:
+# application/x-ndjson) for one entry per line (see dump_ndjson.py), or
+# ?format=index for just the words, entry type, categories and ID of each entry
+# (see get_entry). Clients that only
+# need part of the dump can pass ?video_status=, ?region=, ?definition_language=
+# (each a comma separated list) and ?omit=definitions,related_words, which are
+# applied as the dump is built (see DumpFilter), and clients that can play them
+# can ask for each video's renditions with ?include=renditions. When too many
+# dumps are being built at once, this serves the last dump built (if any) or a
+# 503 (see dump_builds.py).
+def get_dump(request):
+    response = _check_auth_token(request)
+    if response is not None:
+        return response
+
+    try:
+        dump_filter = DumpFilter.from_params(request.GET)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+
+    since = request.GET.get("since")
+    if since is not None:
+        return _dump_delta(request, since, dump_filter)
+
+    format = _requested_format(request)
+    if format is None:
+        return HttpResponseBadRequest(f"format must be one of: {', '.join(FORMATS)}")
+
+    try:
+        if settings.CACHE_DUMP:
+            return _cached_dump(request, format, dump_filter)
+
+        # Only JSON has an in-memory builder.
+        if settings.STREAM_DUMP or format != "json":
+            return _stream_dump(request, format, dump_filter)
+
+        version, _ = current_version()
+        with build_slot(), DumpProfile("build_dump") as profile:
+            dump = build_dump(profile=profile, dump_filter=dump_filter)
+    except DumpBusy:
+        return _dump_busy()
+
+    response = JsonResponse(dump)
+    response.headers["X-Dump-Version"] = version
+    if settings.DUMP_TIMING_HEADER:
+        response.headers["Server-Timing"] = profile.server_timing()
+    return response
+
+
+# Get one entry exactly as it is in the dump, by the ID the index dump
+# (?format=index) lists it under. The ETag only changes when the entry does, so
+# clients can revalidate entries they've already fetched cheaply.
+def get_entry(request, entry_id):
+    response = _check_auth_token(request)
+    if response is not None:
+        return response
+
+    # Read the entry's version before building it: if it changes in between,
+    # the ETag is older than the content and the next request just refetches.
+    dump_version = (
+        Entry.objects.filter(pk=entry_id).values_list("dump_version", flat=True).first()
+    )
+    if dump_version is None:
+        return HttpResponseNotFound(f"No entry with ID {entry_id}")
+    etag = f'"entry-{entry_id}-{dump_version}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        # The fragment is the same JSON as serialising dump_entry's result.
+        if settings.DUMP_FRAGMENTS:
+            content = fragment_content(entry_id)
+        else:
+            content = dump_entry(entry_id)
+            if content is not None:
+                content = DjangoJSONEncoder().encode(content)
+        if content is None:
+            return HttpResponseNotFound(f"Entry {entry_id} isn't in the dump")
+        response = HttpResponse(content, content_type="application/json")
+    response.headers["ETag"] = etag
+    return response
+
+
+# Get the change log (see changelog.py): every change to dumped content after
+# ?since=<sequence>, oldest first, at most ?limit= at a time. Pass the returned
+# sequence back as ?since= to get the next page, or, once more is false, the
+# changes made since. A sequence that's been pruned from the log, or that the
+# log never reached, gets a 410, meaning start over from the full dump.
+def get_changes(request):
+    response = _check_auth_token(request)
+    if response is not None:
+        return response
+
+    try:
+        since = int(request.GET.get("since", 0))
+    except ValueError:
+        return HttpResponseBadRequest("since must be a change sequence number")
+    try:
+        limit = int(request.GET.get("limit", changelog.DEFAULT_LIMIT))
+    except ValueError:
+        return HttpResponseBadRequest("limit must be a number")
+    if not 1 <= limit <= changelog.MAX_LIMIT:
+        return HttpResponseBadRequest(
+            f"limit must be between 1 and {changelog.MAX_LIMIT}"
+        )
+    if since < 0 or since > changelog.latest_sequence():
+        return HttpResponseGone(f"Unknown change sequence {since}, start over")
+
+    try:
+        changes, more = changelog.changes_since(since, limit)
+    except changelog.ChangesPruned:
+        return HttpResponseGone(
+            f"Changes after sequence {since} have been pruned, start over"
+        )
+    return JsonResponse(
+        {
+            "sequence": changes[-1]["sequence"] if changes else since,
+            "more": more,
+            "changes": changes,
+        }
+    )
+
+
+# Search the entries by headword (in any language), related words and definitions.
+# Returns the best matches first, each with its score, the fields it matched and
+# the entry itself, shaped exactly as in the dump. See search.py.
+def search(request):
+    response = _check_auth_token(request)
+    if response is not None:
+        return response
 
-    dump = build_dump()
+    query = request.GET.get("q", "").strip()
+    if not query:
+        return HttpResponseBadRequest("q is required")
+    if len(query) > MAX_QUERY_LENGTH:
+        return HttpResponseBadRequest(
+            f"q must be at most {MAX_QUERY_LENGTH} characters"
+        )
+    try:
+        limit = int(request.GET.get("limit", DEFAULT_LIMIT))
+    except ValueError:
+        return HttpResponseBadRequest("limit must be a number")
+    if not 1 <= limit <= MAX_LIMIT:
+        return HttpResponseBadRequest(f"limit must be between 1 and {MAX_LIMIT}")
 
-    return JsonResponse(dump)
+    results = search_entries(query, limit)
+    entries = {
+        entry["word_in_english"]: entry
+        for entry in iter_dump_models(
+            entries=Entry.objects.filter(id__in=[r.entry_id for r in results])
+        )
+    }
+    return JsonResponse(
+        {
+            "query": query,
+            "results": [
+                {
+                    "score": result.score,
+                    "matched": result.matched,
+                    "entry": entries[result.word_in_english],
+                }
+                for result in results
+                if result.word_in_english in entries
+            ],
+        }
+    )